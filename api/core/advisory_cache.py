@@ -0,0 +1,161 @@
+"""
+Two-tier cache for crop & weather advisories: an in-process LRU in front of the shared
+`crop_advisory_cache` table. Entries are keyed by grid cell (see forecast_cache.snap_to_grid),
+crop and date, read through from the table on a miss, and written back via the write-behind queue
+after a fresh upstream fetch. Expired entries are still returned to offline requests.
+"""
+import os
+import json
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from .ttl_cache import TTLCache, MISSING
+from .singleflight import SingleFlight
+from .concurrency import run_blocking
+from .supabase_client import get_supabase_client
+from .write_behind import write_behind
+from .forecast_cache import snap_to_grid
+
+TABLE = "crop_advisory_cache"
+ON_CONFLICT = "latitude,longitude,advisory_date,crop_type" # uq_advisory_location_date_crop
+COLUMNS = "latitude, longitude, crop_type, advisory_date, weather_forecast_data, crop_tips_data, fetched_at, expires_at"
+# How long past expires_at an entry stays in memory for offline requests
+ADVISORY_STALE_HOURS = float(os.getenv("ADVISORY_CACHE_STALE_HOURS", "72"))
+# A table read slower than this is treated as a miss, so the caller fetches a fresh advisory instead
+ADVISORY_READ_TIMEOUT_SECONDS = float(os.getenv("ADVISORY_CACHE_READ_TIMEOUT_SECONDS", "1.0"))
+
+
+def normalize_crop(crop_type: str) -> str:
+    # NULLs never conflict in a Postgres unique constraint, so "no crop" is stored as "" to keep upserts idempotent
+    return (crop_type or "").strip().lower()
+
+
+def _parse_time(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+
+
+def to_table_row(cell: tuple, crop_type: str, advisory_date: str, forecast_data: dict, crop_tips: dict,
+                 ttl_seconds: float, fetched_at: datetime = None) -> dict:
+    fetched_at = fetched_at or datetime.now(timezone.utc)
+    return {
+        "latitude": cell[0],
+        "longitude": cell[1],
+        "crop_type": normalize_crop(crop_type),
+        "advisory_date": advisory_date,
+        "weather_forecast_data": forecast_data,
+        "crop_tips_data": crop_tips,
+        "fetched_at": fetched_at.isoformat(),
+        "expires_at": (fetched_at + timedelta(seconds=ttl_seconds)).isoformat(),
+    }
+
+
+def from_table_row(record: dict) -> dict:
+    entry = dict(record)
+    for column in ("weather_forecast_data", "crop_tips_data"):
+        if isinstance(entry.get(column), str):
+            entry[column] = json.loads(entry[column])
+    return entry
+
+
+def is_expired(entry: dict, now: datetime = None) -> bool:
+    return _parse_time(entry["expires_at"]) <= (now or datetime.now(timezone.utc))
+
+
+class AdvisoryCache:
+    """
+    get() checks the LRU, then the table (concurrent misses for one key share a single query);
+    put() fills the LRU immediately and queues the upsert so the response never waits on the write.
+    Misses are not cached, so a row written by another worker is picked up on the next request.
+    A table read that takes longer than `read_timeout` seconds counts as a miss.
+    """
+
+    def __init__(self, max_entries: int = 5000, client_getter=get_supabase_client, writer=write_behind,
+                 stale_hours: float = ADVISORY_STALE_HOURS, read_timeout: float = ADVISORY_READ_TIMEOUT_SECONDS):
+        self._entries = TTLCache(maxsize=max_entries, ttl=stale_hours * 3600)
+        self._client_getter = client_getter
+        self._writer = writer
+        self.stale_seconds = stale_hours * 3600
+        self.read_timeout = read_timeout
+        self._singleflight = SingleFlight()
+        self._counters = {"memory_hits": 0, "table_hits": 0, "misses": 0, "stale_served": 0, "writes": 0,
+                          "read_errors": 0, "read_timeouts": 0}
+
+    def _remember(self, key: tuple, entry: dict) -> None:
+        remaining = (_parse_time(entry["expires_at"]) - datetime.now(timezone.utc)).total_seconds()
+        if remaining + self.stale_seconds > 0:
+            self._entries.set(key, entry, ttl=remaining + self.stale_seconds)
+
+    def _select(self, cell: tuple, crop: str, advisory_date: str, on_or_before: bool):
+        supabase = self._client_getter()
+        if not supabase:
+            raise RuntimeError("Supabase client not initialized.")
+        query = (
+            supabase.table(TABLE).select(COLUMNS)
+            .eq("latitude", cell[0])
+            .eq("longitude", cell[1])
+            .eq("crop_type", crop)
+        )
+        if on_or_before:
+            query = query.lte("advisory_date", advisory_date).order("advisory_date", desc=True)
+        else:
+            query = query.eq("advisory_date", advisory_date)
+        response = query.limit(1).execute()
+        return from_table_row(response.data[0]) if response.data else None
+
+    async def get(self, latitude: float, longitude: float, crop_type: str, advisory_date: str, allow_expired: bool = False):
+        """
+        The cached advisory entry (a crop_advisory_cache row) for the cell, crop and date, or None.
+        With allow_expired (offline requests) an expired entry is returned too, and if there is none
+        for that date, the most recent earlier one.
+        """
+        cell = snap_to_grid(latitude, longitude)
+        crop = normalize_crop(crop_type)
+        key = (cell, crop, advisory_date)
+        entry = self._entries.get(key)
+        if entry is not MISSING and (allow_expired or not is_expired(entry)):
+            self._counters["memory_hits"] += 1
+            return self._served(entry)
+
+        try:
+            entry = await self._singleflight.do((key, allow_expired), lambda: run_blocking(
+                self._select, cell, crop, advisory_date, allow_expired, timeout=self.read_timeout
+            ))
+        except asyncio.TimeoutError:
+            print(f"WARNING - Reading {TABLE} took over {self.read_timeout}s, treating it as a miss.")
+            self._counters["read_timeouts"] += 1
+            entry = None
+        except Exception as e:
+            print(f"WARNING - Could not read {TABLE}: {e}")
+            self._counters["read_errors"] += 1
+            entry = None
+        if entry is None or (not allow_expired and is_expired(entry)):
+            self._counters["misses"] += 1
+            return None
+        self._counters["table_hits"] += 1
+        if entry["advisory_date"] == advisory_date:
+            self._remember(key, entry)
+        return self._served(entry)
+
+    def _served(self, entry: dict) -> dict:
+        if is_expired(entry):
+            self._counters["stale_served"] += 1
+        return entry
+
+    def put(self, latitude: float, longitude: float, crop_type: str, advisory_date: str, forecast_data: dict,
+            crop_tips: dict, ttl_seconds: float) -> dict:
+        """Caches a freshly fetched advisory and queues its upsert. Must be called from the event loop."""
+        cell = snap_to_grid(latitude, longitude)
+        row = to_table_row(cell, crop_type, advisory_date, forecast_data, crop_tips, ttl_seconds)
+        self._remember((cell, row["crop_type"], advisory_date), row)
+        self._writer.enqueue(TABLE, row, on_conflict=ON_CONFLICT)
+        self._counters["writes"] += 1
+        return row
+
+    def stats(self) -> dict:
+        entries = self._entries.stats()
+        return {**self._counters, "entries": entries["size"], "evictions": entries["evictions"]}
+
+
+advisory_cache = AdvisoryCache(max_entries=int(os.getenv("ADVISORY_CACHE_MAX_ENTRIES", "5000")))
@@ -0,0 +1,205 @@
+"""
+Content-addressed cache of synthesized IVR prompts.
+
+play_audio actions used to carry only text, so the gateway synthesized the same welcome and menu
+prompts on every call. Each (language, text) is now rendered once, stored as a file named after
+their SHA-256, and handed to the gateway as a URL. A changed prompt gets a new name, so files never
+need invalidating and the gateway or a CDN may cache them indefinitely.
+
+Rendering never happens on the request path: static menu prompts are warmed in the background, and
+other fixed texts (FAQ answers) are queued the first time they are spoken, so only that first caller
+hears gateway text-to-speech. Without a synthesizer, or without an absolute AUDIO_BASE_URL the
+gateway can fetch from, every action simply keeps its text.
+"""
+import os
+import re
+import asyncio
+import hashlib
+import tempfile
+from urllib.parse import urlsplit
+
+from .concurrency import run_blocking
+from .singleflight import SingleFlight
+
+DEFAULT_AUDIO_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "cache", "audio")
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", DEFAULT_AUDIO_DIR)
+# Public URL the gateway fetches files from, e.g. https://api.example.org/api/v1/access-channels/audio
+# (the access-channels router serves them under that path). Unset: no audio URLs are handed out.
+AUDIO_BASE_URL = os.getenv("AUDIO_BASE_URL", "")
+AUDIO_CACHE_MAX_FILES = int(os.getenv("AUDIO_CACHE_MAX_FILES", "5000"))
+# Renders at once; synthesis blocks a worker of the shared I/O pool while it waits on the TTS API
+AUDIO_SYNTHESIS_CONCURRENCY = int(os.getenv("AUDIO_SYNTHESIS_CONCURRENCY", "2"))
+AUDIO_EXTENSION = "mp3"
+AUDIO_FILE_RE = re.compile(r"^[0-9a-f]{32}\." + AUDIO_EXTENSION + "$")
+TTS_VOICES = {"en": "en-US", "am": "am-ET"}
+
+
+def audio_key(text: str, language: str) -> str:
+    """Name of the rendering of `text` in `language`; whitespace differences do not matter."""
+    normalized = " ".join(text.split())
+    return hashlib.sha256(f"{language}\n{normalized}".encode("utf-8")).hexdigest()[:32]
+
+
+def google_tts_synthesizer():
+    """
+    A synthesize(text, language) -> MP3 bytes function backed by Google Cloud Text-to-Speech,
+    or None when the client library or credentials are missing.
+    """
+    try:
+        from google.cloud import texttospeech
+    except ImportError:
+        print("WARNING - google-cloud-texttospeech is not installed; IVR prompts are left to gateway TTS.")
+        return None
+    if not os.getenv("GOOGLE_APPLICATION_CREDENTIALS"):
+        print("WARNING - GOOGLE_APPLICATION_CREDENTIALS not set; IVR prompts are left to gateway TTS.")
+        return None
+
+    clients = []
+
+    def synthesize(text: str, language: str) -> bytes:
+        if not clients:
+            clients.append(texttospeech.TextToSpeechClient())
+        response = clients[0].synthesize_speech(
+            input=texttospeech.SynthesisInput(text=text),
+            voice=texttospeech.VoiceSelectionParams(language_code=TTS_VOICES.get(language, language)),
+            audio_config=texttospeech.AudioConfig(audio_encoding=texttospeech.AudioEncoding.MP3),
+        )
+        return response.audio_content
+
+    return synthesize
+
+
+def is_absolute_url(url: str) -> bool:
+    parts = urlsplit(url)
+    return parts.scheme in ("http", "https") and bool(parts.netloc)
+
+
+class AudioCache:
+    """
+    Rendered prompts in `directory`, shared by all workers on the host. The names present on disk
+    are kept in a set, so looking up a prompt does no I/O. At most `max_files` are rendered;
+    the cache is meant for fixed texts, not per-caller answers.
+    """
+
+    def __init__(self, directory: str = AUDIO_CACHE_DIR, base_url: str = AUDIO_BASE_URL, synthesize=None,
+                 max_files: int = AUDIO_CACHE_MAX_FILES, concurrency: int = AUDIO_SYNTHESIS_CONCURRENCY):
+        self.directory = directory
+        self.base_url = base_url.rstrip("/")
+        if synthesize is not None and not is_absolute_url(self.base_url):
+            # A relative URL would be resolved against the gateway's own host; play text instead
+            print("WARNING - AUDIO_BASE_URL is not an absolute http(s) URL; IVR prompts are left to gateway TTS.")
+            synthesize = None
+        self._synthesize = synthesize
+        self.max_files = max_files
+        self.concurrency = concurrency
+        self._singleflight = SingleFlight()
+        self._semaphore = None
+        self._loop = None
+        self._background = set() # Strong references, so queued renders are not garbage collected
+        self._counters = {"hits": 0, "misses": 0, "rendered": 0, "failures": 0, "skipped": 0}
+        try:
+            self._present = {name[:-len(AUDIO_EXTENSION) - 1] for name in os.listdir(directory) if AUDIO_FILE_RE.match(name)}
+        except FileNotFoundError:
+            self._present = set()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether prompts are rendered and handed out as URLs (needs a synthesizer and an absolute base URL)."""
+        return self._synthesize is not None
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.{AUDIO_EXTENSION}")
+
+    def url_for(self, text: str, language: str):
+        """The URL of the rendered prompt, or None if it has not been rendered yet."""
+        key = audio_key(text, language)
+        if key in self._present and self.enabled:
+            self._counters["hits"] += 1
+            return f"{self.base_url}/{key}.{AUDIO_EXTENSION}"
+        self._counters["misses"] += 1
+        return None
+
+    def audio_config(self, text: str, language: str, cache: bool = True) -> dict:
+        """
+        The audio_config of a play_audio action: always the text (for gateway TTS), plus the URL of
+        the recording when there is one. A fixed text (`cache`) without one is queued for rendering.
+        """
+        config = {"text": text, "language": language}
+        if not cache or not self.enabled:
+            return config
+        url = self.url_for(text, language)
+        if url:
+            config["url"] = url
+        else:
+            self.render_later(text, language)
+        return config
+
+    def render_later(self, text: str, language: str) -> None:
+        """Queues a render on the running event loop without waiting for it."""
+        if not self.enabled or audio_key(text, language) in self._present:
+            return
+        task = asyncio.get_running_loop().create_task(self.render(text, language))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def render(self, text: str, language: str):
+        """Renders the prompt unless it is on disk already; returns its URL, or None if it could not be rendered."""
+        key = audio_key(text, language)
+        if key not in self._present and self.enabled:
+            await self._singleflight.do(key, lambda: self._render(key, text, language))
+        return f"{self.base_url}/{key}.{AUDIO_EXTENSION}" if key in self._present and self.enabled else None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    async def _render(self, key: str, text: str, language: str) -> None:
+        path = self.path_for(key)
+        if os.path.exists(path): # Rendered by another worker
+            self._present.add(key)
+            return
+        if len(self._present) >= self.max_files:
+            self._counters["skipped"] += 1
+            return
+        async with self._get_semaphore():
+            try:
+                audio = await run_blocking(self._synthesize, text, language)
+                await run_blocking(self._write, path, audio)
+            except Exception as e:
+                self._counters["failures"] += 1
+                print(f"ERROR - Could not render IVR prompt ({language}) '{text[:40]}': {e}")
+                return
+        self._present.add(key)
+        self._counters["rendered"] += 1
+
+    def _write(self, path: str, audio: bytes) -> None:
+        # Written next to the destination and renamed into place, so a URL never serves a partial file
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".audio-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(audio)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    async def warm(self, prompts) -> int:
+        """Renders every (text, language) pair that is missing; returns how many are available."""
+        if not self.enabled:
+            return 0
+        urls = await asyncio.gather(*(self.render(text, language) for text, language in set(prompts)))
+        available = sum(1 for url in urls if url)
+        print(f"DEBUG - IVR audio cache warmed: {available}/{len(urls)} prompts rendered.")
+        return available
+
+    def stats(self) -> dict:
+        return {**self._counters, "enabled": self.enabled, "files": len(self._present), "pending": len(self._background)}
+
+
+audio_cache = AudioCache(synthesize=google_tts_synthesizer())
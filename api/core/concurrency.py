@@ -0,0 +1,23 @@
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+# Bounded pool for blocking client calls (supabase-py .execute(), file I/O) made from async handlers.
+# Keeping them off the event loop stops one slow round trip from stalling every other request.
+BLOCKING_IO_WORKERS = int(os.getenv("BLOCKING_IO_WORKERS", "16"))
+
+_executor = ThreadPoolExecutor(max_workers=BLOCKING_IO_WORKERS, thread_name_prefix="blocking-io")
+
+
+async def run_blocking(func, *args, timeout: float = None, **kwargs):
+    """
+    Runs a blocking callable in the shared thread pool and awaits its result.
+    Raises asyncio.TimeoutError if `timeout` seconds pass first; the worker thread is not
+    interrupted, but the caller stops waiting for it.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+    if timeout is None:
+        return await future
+    return await asyncio.wait_for(future, timeout)
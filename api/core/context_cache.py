@@ -0,0 +1,113 @@
+import os
+import threading
+
+from .ttl_cache import TTLCache, MISSING
+from .prompt_builder import fold_into_summary
+
+# Number of most recent chat turns kept as conversational memory
+HISTORY_LIMIT = 5
+
+
+class UserContextCache:
+    """
+    In-process TTL/LRU cache of the per-user context that /chat/ask sends to the model:
+    recent chat history, a rolling summary of the turns that have left it, the farm profile,
+    and whether the user's `profiles` row already exists.
+
+    Writers keep it up to date (write-through): chat_history inserts append to the cached history
+    and farm profile upserts replace the cached profile, so warm users need no database reads.
+    """
+
+    def __init__(self, max_users: int = 10000, ttl: float = 900.0, timer=None):
+        kwargs = {"timer": timer} if timer else {}
+        self._entries = TTLCache(maxsize=max_users, ttl=ttl, **kwargs)
+        self._lock = threading.Lock()
+        self._counters = {
+            "history_hits": 0,
+            "history_misses": 0,
+            "farm_profile_hits": 0,
+            "farm_profile_misses": 0,
+            "profile_upserts_skipped": 0,
+        }
+
+    def _entry(self, user_id: str, create: bool = False):
+        entry = self._entries.get(user_id, None)
+        if entry is None and create:
+            entry = {"history": MISSING, "summary": "", "farm_profile": MISSING, "profile_known": False}
+            self._entries.set(user_id, entry)
+        return entry
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    # --- profiles row ---
+    def is_profile_known(self, user_id: str) -> bool:
+        entry = self._entry(user_id)
+        known = bool(entry and entry["profile_known"])
+        if known:
+            self._count("profile_upserts_skipped")
+        return known
+
+    def mark_profile_known(self, user_id: str) -> None:
+        self._entry(user_id, create=True)["profile_known"] = True
+
+    # --- chat history ---
+    def get_history(self, user_id: str):
+        """Returns the cached history (oldest first), or None if it is not cached."""
+        entry = self._entry(user_id)
+        if entry is None or entry["history"] is MISSING:
+            self._count("history_misses")
+            return None
+        self._count("history_hits")
+        return list(entry["history"])
+
+    def set_history(self, user_id: str, history: list[dict]) -> None:
+        self._entry(user_id, create=True)["history"] = list(history[-HISTORY_LIMIT:])
+
+    def append_history(self, user_id: str, turn: dict) -> None:
+        """
+        Write-through for a new chat_history row. Ignored if the history was never loaded.
+        Turns pushed out of the window are folded into the user's rolling summary.
+        """
+        entry = self._entry(user_id)
+        if entry is None or entry["history"] is MISSING:
+            return
+        history = entry["history"] + [turn]
+        dropped = history[:-HISTORY_LIMIT]
+        if dropped:
+            entry["summary"] = fold_into_summary(entry["summary"], dropped)
+        entry["history"] = history[-HISTORY_LIMIT:]
+
+    def get_summary(self, user_id: str) -> str:
+        """Compact summary of the user's older turns ('' if there is none)."""
+        entry = self._entry(user_id)
+        return entry["summary"] if entry else ""
+
+    # --- farm profile ---
+    def get_farm_profile(self, user_id: str):
+        """Returns (found, profile). A cached 'no profile' is found=True with profile=None."""
+        entry = self._entry(user_id)
+        if entry is None or entry["farm_profile"] is MISSING:
+            self._count("farm_profile_misses")
+            return False, None
+        self._count("farm_profile_hits")
+        return True, entry["farm_profile"]
+
+    def set_farm_profile(self, user_id: str, profile) -> None:
+        self._entry(user_id, create=True)["farm_profile"] = profile
+
+    def invalidate(self, user_id: str) -> None:
+        self._entries.pop(user_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        entries = self._entries.stats()
+        return {**counters, "users": entries["size"], "max_users": entries["maxsize"], "evictions": entries["evictions"]}
+
+
+context_cache = UserContextCache(
+    max_users=int(os.getenv("CONTEXT_CACHE_MAX_USERS", "10000")),
+    ttl=float(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "900")),
+)
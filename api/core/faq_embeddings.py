@@ -0,0 +1,120 @@
+import os
+import math
+import zlib
+
+import numpy as np
+
+from .faq_index import tokenize
+
+DEFAULT_HASHING_DIM = 1024
+
+
+class HashingEmbedder:
+    """
+    Deterministic, dependency-free text embedder (the "hashing trick").
+
+    Each word and each character trigram of a word is hashed into one of `dim` signed buckets.
+    Trigrams let related word forms ("plant" / "planting", Amharic affixes) and mixed
+    Amharic/English text share features without any trained model, so this always works offline.
+    crc32 is used instead of hash() so vectors are identical across processes and restarts.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = DEFAULT_HASHING_DIM):
+        self.dim = dim
+
+    def _features(self, text: str) -> dict[str, int]:
+        counts: dict[str, int] = {}
+        for word in tokenize(text):
+            counts["w:" + word] = counts.get("w:" + word, 0) + 1
+            padded = f"<{word}>"
+            for i in range(len(padded) - 2):
+                gram = "c:" + padded[i:i + 3]
+                counts[gram] = counts.get(gram, 0) + 1
+        return counts
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in self._features(text).items():
+                h = zlib.crc32(feature.encode("utf-8"))
+                sign = 1.0 if h & 0x80000000 else -1.0
+                matrix[row, h % self.dim] += sign * (1.0 + math.log(count))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+
+class SentenceTransformerEmbedder:
+    """Embedder backed by a local sentence-transformers model (optional dependency)."""
+
+    name = "sentence-transformers"
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer # Imported lazily; not in requirements.txt
+        self._model = SentenceTransformer(model_name)
+        self.dim = self._model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = self._model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+        return np.asarray(vectors, dtype=np.float32)
+
+
+def get_embedder():
+    """
+    Returns the embedding backend selected by FAQ_EMBEDDING_BACKEND ('hashing' or 'sentence-transformers').
+    Falls back to the hashing embedder if the configured backend cannot be loaded.
+    """
+    backend = os.getenv("FAQ_EMBEDDING_BACKEND", "hashing").lower()
+    if backend == "sentence-transformers":
+        model_name = os.getenv("FAQ_EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+        try:
+            return SentenceTransformerEmbedder(model_name)
+        except Exception as e:
+            print(f"WARNING - Could not load embedding model '{model_name}', using hashing embedder: {e}")
+    return HashingEmbedder(int(os.getenv("FAQ_EMBEDDING_DIM", DEFAULT_HASHING_DIM)))
+
+
+class SemanticFaqIndex:
+    """
+    Dense-vector FAQ index. Document vectors live in one contiguous float32 matrix, so a batch
+    of queries is scored with a single matrix product and the top-k picked with argpartition.
+    """
+
+    def __init__(self, texts: list[str], embedder=None):
+        self.embedder = embedder or get_embedder()
+        self.matrix = np.ascontiguousarray(self.embedder.embed(texts), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    def search_batch(self, queries: list[str], top_k: int = 3, min_score: float = 0.0) -> list[list[tuple[int, float]]]:
+        """
+        Scores every query against every FAQ in one pass.
+        Returns, per query, up to top_k (doc_id, cosine similarity) pairs with score >= min_score, best first.
+        """
+        n_docs = len(self)
+        if not queries:
+            return []
+        if not n_docs or top_k <= 0:
+            return [[] for _ in queries]
+
+        scores = self.embedder.embed(queries) @ self.matrix.T # (n_queries, n_docs)
+        k = min(top_k, n_docs)
+        if k < n_docs:
+            candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.broadcast_to(np.arange(n_docs), (len(queries), n_docs))
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1, kind="stable")
+        ranked_ids = np.take_along_axis(candidates, order, axis=1)
+        ranked_scores = np.take_along_axis(candidate_scores, order, axis=1)
+
+        return [
+            [(int(doc_id), float(score)) for doc_id, score in zip(ids, row_scores) if score >= min_score]
+            for ids, row_scores in zip(ranked_ids, ranked_scores)
+        ]
+
+    def search(self, query: str, top_k: int = 3, min_score: float = 0.0) -> list[tuple[int, float]]:
+        return self.search_batch([query], top_k=top_k, min_score=min_score)[0]
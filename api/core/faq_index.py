@@ -0,0 +1,275 @@
+import os
+import sys
+import json
+import math
+import mmap
+import re
+import heapq
+import bisect
+import struct
+import tempfile
+from array import array
+
+# Unicode-aware word pattern, so Ge'ez (Amharic) words tokenize the same way as Latin ones
+_TOKEN_RE = re.compile(r"\w+")
+
+# BM25 tuning parameters (standard defaults)
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Question text is a much stronger relevance signal than the answer body
+QUESTION_WEIGHT = 2
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercases and splits text into word tokens.
+    Short ASCII words (e.g. 'to', 'is') are dropped as noise, matching the old keyword search,
+    but short Ge'ez words are kept since many Amharic crop names are only two syllables (e.g. 'ጤፍ').
+    """
+    if not text:
+        return []
+    return [
+        token for token in _TOKEN_RE.findall(text.lower())
+        if len(token) > 2 or not token.isascii()
+    ]
+
+
+class FaqIndex:
+    """
+    Tokenized inverted index over the FAQ corpus with BM25 ranking.
+
+    Built once from the list of FAQ dicts; a query only touches the postings of its own terms,
+    so its cost is independent of the corpus size.
+    """
+
+    def __init__(self, faqs: list[dict]):
+        self._docs = faqs
+        self._postings: dict[str, tuple[array, array]] = {}
+        self._doc_lens = array("I")
+
+        for doc_id, faq in enumerate(faqs):
+            term_freqs: dict[str, int] = {}
+            for token in tokenize(faq.get("question", "")):
+                term_freqs[token] = term_freqs.get(token, 0) + QUESTION_WEIGHT
+            for token in tokenize(faq.get("answer", "")):
+                term_freqs[token] = term_freqs.get(token, 0) + 1
+
+            self._doc_lens.append(sum(term_freqs.values()))
+            for term, tf in term_freqs.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = (array("I"), array("I"))
+                postings[0].append(doc_id)
+                postings[1].append(tf)
+
+        total_len = sum(self._doc_lens)
+        self._avg_doc_len = (total_len / len(self._doc_lens)) if self._doc_lens else 0.0
+
+    def __len__(self) -> int:
+        return len(self._doc_lens)
+
+    @property
+    def term_count(self) -> int:
+        return len(self._postings)
+
+    def get_doc(self, doc_id: int) -> dict:
+        """Returns the FAQ dict stored under the given document id."""
+        return self._docs[doc_id]
+
+    def _get_postings(self, term: str):
+        """Returns (doc_ids, term_freqs) for a term, or None if the term is not indexed."""
+        return self._postings.get(term)
+
+    def search(self, query: str, top_n: int = 3) -> list[tuple[int, float]]:
+        """
+        Ranks documents against the query with BM25.
+        Returns up to top_n (doc_id, score) pairs, best first.
+        """
+        n_docs = len(self)
+        if not n_docs or top_n <= 0:
+            return []
+
+        scores: dict[int, float] = {}
+        avg_len = self._avg_doc_len or 1.0
+        doc_lens = self._doc_lens
+
+        for term in set(tokenize(query)):
+            postings = self._get_postings(term)
+            if postings is None:
+                continue
+            doc_ids, tfs = postings
+            df = len(doc_ids)
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            for doc_id, tf in zip(doc_ids, tfs):
+                norm = BM25_K1 * (1.0 - BM25_B + BM25_B * doc_lens[doc_id] / avg_len)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1.0) / (tf + norm)
+
+        # Highest score first; ties go to the earlier FAQ so results are deterministic
+        return heapq.nlargest(top_n, scores.items(), key=lambda item: (item[1], -item[0]))
+
+    def match_confidence(self, query: str, doc_id: int) -> float:
+        """
+        How safely a document answers the query on its own, between 0 and 1: the share of the
+        query's IDF weight found in the document's question. Unlike a BM25 score it is comparable
+        across queries, so it can serve as a cut-off. It is 0 when the query uses a corpus term the
+        document never mentions (e.g. a different crop), and terms no FAQ contains weigh the most.
+        """
+        n_docs = len(self)
+        terms = set(tokenize(query))
+        if not n_docs or not terms:
+            return 0.0
+        question_terms = set(tokenize(self.get_doc(doc_id).get("question", "")))
+        total = matched = 0.0
+        for term in terms:
+            postings = self._get_postings(term)
+            df = len(postings[0]) if postings is not None else 0
+            if df and term not in question_terms:
+                doc_ids = postings[0]
+                i = bisect.bisect_left(doc_ids, doc_id)
+                if i == df or doc_ids[i] != doc_id:
+                    return 0.0
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            total += idf
+            if term in question_terms:
+                matched += idf
+        return matched / total
+
+
+# --- Persisted index format ---
+# A single little-endian file that worker processes memory-map read-only, so the OS page cache
+# shares one copy of the index between all workers and startup does no parsing at all.
+#
+#   header            magic, n_docs, n_terms, n_postings, avg_doc_len, blob sizes
+#   doc_lens          uint32[n_docs]
+#   doc_offsets       uint32[n_docs + 1]    byte offsets into the doc string table
+#   term_offsets      uint32[n_terms + 1]   byte offsets into the term string table
+#   postings_offsets  uint32[n_terms + 1]   element offsets into the postings arrays
+#   postings_doc_ids  uint32[n_postings]
+#   postings_tfs      uint32[n_postings]
+#   term strings      UTF-8 terms, sorted bytewise so lookups can binary search
+#   doc strings       compact UTF-8 JSON of each FAQ, decoded only for returned results
+INDEX_MAGIC = b"FAQIDX01"
+_HEADER = struct.Struct("<8sIIIdII")
+
+
+def write_faq_index(index: FaqIndex, path: str) -> None:
+    """
+    Serializes an in-memory FaqIndex to the binary format above.
+    The file is written next to its destination and renamed into place, so workers that still
+    have the previous version mapped keep reading consistent pages.
+    """
+    doc_blobs = [json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8") for doc in index._docs]
+    doc_offsets = array("I", [0])
+    for blob in doc_blobs:
+        doc_offsets.append(doc_offsets[-1] + len(blob))
+
+    terms = sorted((term.encode("utf-8"), term) for term in index._postings)
+    term_offsets = array("I", [0])
+    postings_offsets = array("I", [0])
+    postings_doc_ids = array("I")
+    postings_tfs = array("I")
+    for encoded, term in terms:
+        doc_ids, tfs = index._postings[term]
+        term_offsets.append(term_offsets[-1] + len(encoded))
+        postings_doc_ids.extend(doc_ids)
+        postings_tfs.extend(tfs)
+        postings_offsets.append(len(postings_doc_ids))
+
+    arrays = [index._doc_lens, doc_offsets, term_offsets, postings_offsets, postings_doc_ids, postings_tfs]
+    if sys.byteorder != "little":
+        arrays = [array("I", a) for a in arrays]
+        for a in arrays:
+            a.byteswap()
+
+    header = _HEADER.pack(
+        INDEX_MAGIC, len(index), len(terms), len(postings_doc_ids), index._avg_doc_len,
+        term_offsets[-1], doc_offsets[-1],
+    )
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".faqs-", suffix=".idx.tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            for a in arrays:
+                a.tofile(f)
+            for encoded, _ in terms:
+                f.write(encoded)
+            for blob in doc_blobs:
+                f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644) # mkstemp creates owner-only files; workers may run as another user
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class MmapFaqIndex(FaqIndex):
+    """
+    Read-only FaqIndex backed by a memory-mapped index file written by write_faq_index.
+    Opening it costs a header read; postings are zero-copy views into the mapping.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, n_docs, n_terms, n_postings, avg_doc_len, terms_size, docs_size = _HEADER.unpack_from(self._mmap, 0)
+        if magic != INDEX_MAGIC:
+            self._mmap.close()
+            raise ValueError(f"Not a FAQ index file: {path}")
+
+        view = memoryview(self._mmap)
+        offset = _HEADER.size
+
+        def _take_uint32(count: int):
+            nonlocal offset
+            section = view[offset:offset + count * 4]
+            offset += count * 4
+            if sys.byteorder != "little":
+                swapped = array("I", section.tobytes())
+                swapped.byteswap()
+                return swapped
+            return section.cast("I")
+
+        self._doc_lens = _take_uint32(n_docs)
+        self._doc_offsets = _take_uint32(n_docs + 1)
+        self._term_offsets = _take_uint32(n_terms + 1)
+        self._postings_offsets = _take_uint32(n_terms + 1)
+        self._postings_doc_ids = _take_uint32(n_postings)
+        self._postings_tfs = _take_uint32(n_postings)
+        self._terms_start = offset
+        self._docs_start = offset + terms_size
+        self._n_terms = n_terms
+        self._avg_doc_len = avg_doc_len
+        self.path = path
+
+    @property
+    def term_count(self) -> int:
+        return self._n_terms
+
+    def _term_at(self, i: int) -> bytes:
+        start = self._terms_start
+        return self._mmap[start + self._term_offsets[i]:start + self._term_offsets[i + 1]]
+
+    def _get_postings(self, term: str):
+        target = term.encode("utf-8")
+        lo, hi = 0, self._n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_at(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self._n_terms or self._term_at(lo) != target:
+            return None
+        begin, end = self._postings_offsets[lo], self._postings_offsets[lo + 1]
+        return self._postings_doc_ids[begin:end], self._postings_tfs[begin:end]
+
+    def get_doc(self, doc_id: int) -> dict:
+        start = self._docs_start
+        raw = self._mmap[start + self._doc_offsets[doc_id]:start + self._doc_offsets[doc_id + 1]]
+        return json.loads(raw.decode("utf-8"))
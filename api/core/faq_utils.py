@@ -1,13 +1,48 @@
 import os
 import json
-import re # For simple keyword search
+import threading
+
+from .faq_index import FaqIndex, MmapFaqIndex
+from .faq_embeddings import SemanticFaqIndex
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+FAQ_DATA_PATH = os.path.join(DATA_DIR, "faqs.json")
+# Compiled by api/scripts/build_faq_index.py; preferred over faqs.json when it is up to date
+FAQ_INDEX_PATH = os.getenv("FAQ_INDEX_PATH", os.path.join(DATA_DIR, "faqs.idx"))
+
+# Minimum cosine similarity for a semantic match to be used as context
+SEMANTIC_MIN_SCORE = float(os.getenv("FAQ_SEMANTIC_MIN_SCORE", "0.2"))
+# Minimum FaqIndex.match_confidence for an FAQ answer to be given verbatim (voice channels)
+DIRECT_ANSWER_MIN_CONFIDENCE = float(os.getenv("FAQ_DIRECT_ANSWER_MIN_CONFIDENCE", "0.4"))
 
 _faq_cache = None
+_faq_index = None
+_semantic_index = None # (lexical index, SemanticFaqIndex built from it)
+_semantic_lock = threading.Lock()
 
-def load_faq_data():
-    """Loads FAQ data from a JSON file."""
+def _load_compiled_index():
+    """Memory-maps the compiled FAQ index if it exists and is not older than faqs.json."""
+    try:
+        if os.path.getmtime(FAQ_INDEX_PATH) < os.path.getmtime(FAQ_DATA_PATH):
+            print(f"WARNING - FAQ index at {FAQ_INDEX_PATH} is older than faqs.json, ignoring it.")
+            return None
+        return MmapFaqIndex(FAQ_INDEX_PATH)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"ERROR - Could not open compiled FAQ index {FAQ_INDEX_PATH}: {e}")
+        return None
+
+def _read_faq_index():
+    """The compiled index when available (shared between worker processes), otherwise one built from faqs.json."""
     global _faq_cache
-    data_path = os.path.join(os.path.dirname(__file__), "..", "data", "faqs.json")
+    compiled = _load_compiled_index()
+    if compiled is not None:
+        _faq_cache = None
+        print(f"DEBUG - FAQ index memory-mapped: {len(compiled)} FAQs, {compiled.term_count} terms.")
+        return compiled
+
+    data_path = FAQ_DATA_PATH
     try:
         with open(data_path, "r", encoding="utf-8") as f:
             _faq_cache = json.load(f)
@@ -22,48 +57,158 @@ def load_faq_data():
         print(f"ERROR - An unexpected error occurred loading FAQ data: {e}")
         _faq_cache = [] # Initialize as empty list on error
 
+    index = FaqIndex(_faq_cache)
+    print(f"DEBUG - FAQ index built: {len(index)} FAQs, {index.term_count} terms.")
+    return index
+
+def load_faq_data():
+    """
+    Loads the FAQ search index.
+    Uses the memory-mapped compiled index when available (shared between worker processes),
+    otherwise parses faqs.json and builds the index in memory. The semantic index is built here
+    too, so no request pays for embedding the corpus.
+    """
+    global _faq_index, _semantic_index
+    index = _read_faq_index()
+    with _semantic_lock:
+        try:
+            _semantic_index = (index, _build_semantic_index(index)) if index else None
+        except Exception as e:
+            print(f"ERROR - Could not build the semantic FAQ index, retrying on first semantic search: {e}")
+            _semantic_index = None
+        _faq_index = index
+
 # Load data when the module is imported
 load_faq_data()
 
 def search_faqs(query: str, top_n: int = 3) -> list[dict]:
     """
-    Searches FAQs based on a query using simple keyword matching.
-    Returns a list of relevant FAQs.
+    Searches FAQs for a query using the prebuilt inverted index.
+    Returns up to top_n relevant FAQs, ranked best first (BM25).
     """
-    if not _faq_cache:
-        print("WARNING - FAQ cache is empty. Attempting to reload data.")
+    if not _faq_index:
+        print("WARNING - FAQ index is empty. Attempting to reload data.")
         load_faq_data()
-        if not _faq_cache:
+        if not _faq_index:
             return []
 
     if not query:
         return []
 
-    lower_query = query.lower()
-    relevant_faqs = []
+    # Over-fetch a little so duplicate questions can be dropped without shortening the result
+    results = []
+    seen_questions = set()
+    for doc_id, _score in _faq_index.search(query, top_n=top_n * 2):
+        faq = _faq_index.get_doc(doc_id)
+        if faq.get('question') in seen_questions:
+            continue
+        seen_questions.add(faq.get('question'))
+        results.append(faq)
+        if len(results) == top_n:
+            break
+
+    return results
+
+def faq_language(faq: dict) -> str:
+    """The FAQ's explicit language, else 'am' if its question is written in Ge'ez script, else 'en'."""
+    if faq.get("language"):
+        return faq["language"]
+    return "am" if any("\u1200" <= ch <= "\u137f" for ch in faq.get("question", "")) else "en"
 
-    for faq in _faq_cache:
-        question = faq.get('question', '').lower()
-        answer = faq.get('answer', '').lower()
+def direct_answer_faq(query: str, language: str = None, min_confidence: float = DIRECT_ANSWER_MIN_CONFIDENCE):
+    """
+    The best keyword match if it answers the query on its own (and is written in `language`, when
+    given), else None. For channels that can give only one answer (IVR); a miss should go to the
+    model with search_faqs() results as context.
+    """
+    if not query:
+        return None
+    if not _faq_index:
+        load_faq_data()
+        if not _faq_index:
+            return None
+    hits = _faq_index.search(query, top_n=1)
+    if not hits or _faq_index.match_confidence(query, hits[0][0]) < min_confidence:
+        return None
+    faq = _faq_index.get_doc(hits[0][0])
+    if language and faq_language(faq) != language:
+        return None
+    return faq
 
-        # Simple keyword matching
-        if lower_query in question or lower_query in answer:
-            relevant_faqs.append(faq)
-            continue # Found a match, move to next FAQ
+def _build_semantic_index(lexical) -> SemanticFaqIndex:
+    texts = []
+    for doc_id in range(len(lexical)):
+        faq = lexical.get_doc(doc_id)
+        texts.append(f"{faq.get('question', '')} {faq.get('answer', '')}")
+    index = SemanticFaqIndex(texts)
+    print(f"DEBUG - Semantic FAQ index built with '{index.embedder.name}' embedder.")
+    return index
 
-        # More advanced: check for individual keywords
-        query_words = re.findall(r'\b\w+\b', lower_query)
-        for word in query_words:
-            if len(word) > 2 and (word in question or word in answer): # Ignore very short words
-                relevant_faqs.append(faq)
-                break # Found a match for this FAQ, move to next
+def _get_semantic_index():
+    """
+    (lexical index, dense-vector index over the same doc ids). Normally built by load_faq_data;
+    if that failed it is built here, once, while concurrent callers wait for it.
+    """
+    global _semantic_index
+    current = _semantic_index
+    if current is not None and current[0] is _faq_index:
+        return current
+    with _semantic_lock:
+        lexical = _faq_index
+        if not lexical:
+            return None
+        if _semantic_index is None or _semantic_index[0] is not lexical:
+            _semantic_index = (lexical, _build_semantic_index(lexical))
+        return _semantic_index
 
-    # Remove duplicates if any (due to multiple keyword matches)
-    unique_faqs = []
-    seen_questions = set()
-    for faq in relevant_faqs:
-        if faq['question'] not in seen_questions:
-            unique_faqs.append(faq)
-            seen_questions.add(faq['question'])
+def semantic_search_faqs(queries: list[str], top_n: int = 3, min_score: float = SEMANTIC_MIN_SCORE) -> list[list[dict]]:
+    """
+    Embedding-based FAQ search for a batch of queries (catches paraphrases and mixed-language queries).
+    Returns one ranked list of FAQs per query, in the same order as the queries.
+    """
+    if not _faq_index:
+        load_faq_data()
+    indexes = _get_semantic_index()
+    if indexes is None:
+        return [[] for _ in queries]
+    lexical, index = indexes
+    return [
+        [lexical.get_doc(doc_id) for doc_id, _score in hits]
+        for hits in index.search_batch(queries, top_k=top_n, min_score=min_score)
+    ]
+
+def hybrid_search_faqs(query: str, top_n: int = 3) -> list[dict]:
+    """
+    Keyword (BM25) matches first, topped up with semantic matches the keyword search missed.
+    """
+    if not query:
+        return []
+    results = search_faqs(query, top_n=top_n)
+    if len(results) < top_n:
+        seen_questions = {faq.get('question') for faq in results}
+        for faq in semantic_search_faqs([query], top_n=top_n)[0]:
+            if faq.get('question') not in seen_questions:
+                seen_questions.add(faq.get('question'))
+                results.append(faq)
+            if len(results) == top_n:
+                break
+    return results
 
-    return unique_faqs[:top_n] # Return top N relevant FAQs
+def hybrid_search_faqs_batch(queries: list[str], top_n: int = 3) -> list[list[dict]]:
+    """
+    hybrid_search_faqs for many queries at once: keyword search per query, then a single
+    batched semantic search for every query that still needs more results.
+    """
+    results = [search_faqs(query, top_n=top_n) if query else [] for query in queries]
+    needs_more = [i for i, (query, hits) in enumerate(zip(queries, results)) if query and len(hits) < top_n]
+    if needs_more:
+        semantic = semantic_search_faqs([queries[i] for i in needs_more], top_n=top_n)
+        for i, semantic_hits in zip(needs_more, semantic):
+            seen_questions = {faq.get('question') for faq in results[i]}
+            for faq in semantic_hits:
+                if len(results[i]) == top_n:
+                    break
+                if faq.get('question') not in seen_questions:
+                    seen_questions.add(faq.get('question'))
+                    results[i].append(faq)
+    return results
@@ -0,0 +1,86 @@
+import os
+import time
+import math
+
+from .ttl_cache import TTLCache, MISSING
+from .singleflight import SingleFlight
+
+# Grid resolution in degrees; 0.05 deg is ~5.5 km, finer than the ~11 km models behind Open-Meteo,
+# so farmers in the same cell get the same forecast the upstream API would return anyway.
+FORECAST_GRID_DEGREES = float(os.getenv("FORECAST_GRID_DEGREES", "0.05"))
+# Upstream models refresh on a fixed cadence; entries expire shortly after the next refresh lands.
+FORECAST_UPDATE_HOURS = {
+    "hourly": float(os.getenv("FORECAST_HOURLY_UPDATE_HOURS", "1")),
+    "daily": float(os.getenv("FORECAST_DAILY_UPDATE_HOURS", "3")),
+}
+FORECAST_UPDATE_DELAY_MINUTES = float(os.getenv("FORECAST_UPDATE_DELAY_MINUTES", "10"))
+# Expired forecasts are kept this long as a fallback for when the upstream is unreachable
+FORECAST_STALE_HOURS = float(os.getenv("FORECAST_STALE_HOURS", "24"))
+
+
+def snap_to_grid(lat: float, lon: float, resolution: float = FORECAST_GRID_DEGREES) -> tuple:
+    """Centre of the grid cell containing (lat, lon)."""
+    cell_lat = round(math.floor(lat / resolution) * resolution + resolution / 2, 4)
+    cell_lon = round(math.floor(lon / resolution) * resolution + resolution / 2, 4)
+    return cell_lat, cell_lon
+
+
+def seconds_until_refresh(update_hours: float, delay_minutes: float = FORECAST_UPDATE_DELAY_MINUTES, now: float = None) -> float:
+    """Seconds until the next upstream model update (aligned to UTC multiples of `update_hours`) has landed."""
+    now = time.time() if now is None else now
+    period = update_hours * 3600
+    delay = delay_minutes * 60
+    next_refresh = (math.floor((now - delay) / period) + 1) * period + delay
+    return max(next_refresh - now, 1.0)
+
+
+class ForecastCache:
+    """
+    Forecasts keyed by (product, grid cell, variables). Entries live until the upstream model's next
+    update, and concurrent misses for the same key share one upstream call. If that call fails (e.g.
+    the circuit breaker is open), the last forecast for the key is served for up to `stale_hours`.
+    """
+
+    def __init__(self, max_entries: int = 20000, resolution: float = FORECAST_GRID_DEGREES, update_hours: dict = None, stale_hours: float = FORECAST_STALE_HOURS):
+        self.resolution = resolution
+        self.update_hours = update_hours or FORECAST_UPDATE_HOURS
+        self._cache = TTLCache(maxsize=max_entries, ttl=3600)
+        self._stale = TTLCache(maxsize=max_entries, ttl=stale_hours * 3600)
+        self._singleflight = SingleFlight()
+        self.upstream_calls = 0
+        self.stale_served = 0
+
+    async def get(self, product: str, lat: float, lon: float, variables: str, fetch):
+        """
+        Returns the forecast for the cell containing (lat, lon). On a miss, `await fetch(cell_lat, cell_lon)`
+        is called once for all concurrent requesters; failures are not cached, and re-raise only when
+        there is no stale copy to fall back on.
+        """
+        cell_lat, cell_lon = snap_to_grid(lat, lon, self.resolution)
+        key = (product, cell_lat, cell_lon, variables)
+        value = self._cache.get(key)
+        if value is not MISSING:
+            return value
+
+        async def _load():
+            self.upstream_calls += 1
+            try:
+                data = await fetch(cell_lat, cell_lon)
+            except Exception as exc:
+                stale = self._stale.get(key)
+                if stale is MISSING:
+                    raise
+                self.stale_served += 1
+                print(f"WARNING - Forecast fetch failed for {key}, serving stale copy: {exc}")
+                return stale
+            self._cache.set(key, data, ttl=seconds_until_refresh(self.update_hours.get(product, 1)))
+            self._stale.set(key, data)
+            return data
+
+        return await self._singleflight.do(key, _load)
+
+    def stats(self) -> dict:
+        return {**self._cache.stats(), "upstream_calls": self.upstream_calls, "stale_served": self.stale_served, "coalesced": self._singleflight.coalesced}
+
+
+forecast_cache = ForecastCache(max_entries=int(os.getenv("FORECAST_CACHE_MAX_ENTRIES", "20000")))
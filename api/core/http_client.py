@@ -0,0 +1,230 @@
+import os
+import time
+import random
+import asyncio
+from urllib.parse import urlsplit
+
+import httpx
+
+from .metrics import latency_metrics
+
+# Shared pool for outbound calls (Open-Meteo, market price feed). Keep-alive connections are reused
+# across requests instead of paying a TCP + TLS handshake on every call.
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "10"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "10"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_BACKOFF_SECONDS = float(os.getenv("HTTP_BACKOFF_SECONDS", "0.2"))
+HTTP_MAX_BACKOFF_SECONDS = float(os.getenv("HTTP_MAX_BACKOFF_SECONDS", "2"))
+# Consecutive failed calls to a host before its circuit opens, and how long it stays open
+HTTP_BREAKER_THRESHOLD = int(os.getenv("HTTP_BREAKER_THRESHOLD", "5"))
+HTTP_BREAKER_RESET_SECONDS = float(os.getenv("HTTP_BREAKER_RESET_SECONDS", "30"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling upstream while a host's circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `threshold` consecutive failures; open -> half-open after `reset_timeout`
+    seconds, when one trial call is let through. A success closes the circuit, a failure re-opens it.
+    """
+
+    def __init__(self, threshold: int = HTTP_BREAKER_THRESHOLD, reset_timeout: float = HTTP_BREAKER_RESET_SECONDS, timer=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._timer = timer
+        self.failures = 0
+        self.opened_at = None
+        self._trial_started = None
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self._timer() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        # One trial at a time; a trial that never reported back (e.g. cancelled) stops blocking after reset_timeout
+        now = self._timer()
+        if state == "half-open" and (self._trial_started is None or now - self._trial_started >= self.reset_timeout):
+            self._trial_started = now
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_started = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_started = None
+        if self.opened_at is not None or self.failures >= self.threshold:
+            self.opened_at = self._timer()
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.failures, "rejected": self.rejected}
+
+
+def backoff_delay(attempt: int, base: float = HTTP_BACKOFF_SECONDS, cap: float = HTTP_MAX_BACKOFF_SECONDS) -> float:
+    """Full-jitter exponential backoff, so retrying workers do not hit a recovering host in lockstep."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class OutboundClient:
+    """
+    Pooled async HTTP client shared by the routes. Per-host semaphores cap concurrent calls to any
+    one upstream, retryable failures (connection errors, timeouts, 429/5xx) are retried with jittered
+    backoff, and a per-host circuit breaker fails fast while an upstream is down so callers can fall
+    back to cached data. Latency is recorded per host as "http:<host>" in the shared metrics registry.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = HTTP_MAX_CONNECTIONS,
+        max_keepalive: int = HTTP_MAX_KEEPALIVE,
+        max_per_host: int = HTTP_MAX_PER_HOST,
+        timeout: float = HTTP_TIMEOUT_SECONDS,
+        retries: int = HTTP_RETRIES,
+        transport: httpx.AsyncBaseTransport = None,
+    ):
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.transport = transport
+        self._client = None
+        self._loop = None
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self.retried = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # The pool and semaphores belong to one event loop; rebuild them if called from another
+        # (e.g. a script's asyncio.run or a test client) instead of sharing loop-bound state.
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout, transport=self.transport)
+            self._loop = loop
+            self._semaphores = {}
+        return self._client
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker()
+        return breaker
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Sends the request with retries and returns the response (status already checked).
+        Raises CircuitOpenError while the host's circuit is open, otherwise the last httpx error.
+        """
+        client = self._get_client()
+        host = urlsplit(url).netloc
+        breaker = self.breaker(host)
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {host}")
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._semaphores[host] = asyncio.Semaphore(self.max_per_host)
+        recorder = latency_metrics.recorder(f"http:{host}")
+
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                async with semaphore:
+                    response = await client.request(method, url, **kwargs)
+                if response.status_code in RETRY_STATUSES:
+                    response.raise_for_status()
+            except (httpx.HTTPStatusError, httpx.TransportError):
+                recorder.record(time.perf_counter() - started, error=True)
+                if attempt >= self.retries:
+                    breaker.record_failure()
+                    raise
+                self.retried += 1
+                await asyncio.sleep(backoff_delay(attempt))
+                attempt += 1
+                continue
+            except Exception:
+                breaker.record_failure()
+                raise
+            recorder.record(time.perf_counter() - started)
+            # Other 4xx responses mean the request was wrong, not that the host is unhealthy
+            breaker.record_success()
+            response.raise_for_status()
+            return response
+
+    async def get_json(self, url: str, params: dict = None, headers: dict = None):
+        response = await self.request("GET", url, params=params, headers=headers)
+        return response.json()
+
+    async def download(self, url: str, dest, headers: dict = None, chunk_size: int = 64 * 1024) -> int:
+        """
+        Streams the body of a GET into the binary file object `dest` (rewound and truncated on each
+        attempt), with the same retry and circuit-breaker handling as request(). Returns the byte count.
+        """
+        client = self._get_client()
+        host = urlsplit(url).netloc
+        breaker = self.breaker(host)
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {host}")
+        recorder = latency_metrics.recorder(f"http:{host}")
+
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            dest.seek(0)
+            dest.truncate()
+            try:
+                async with client.stream("GET", url, headers=headers) as response:
+                    response.raise_for_status()
+                    written = 0
+                    async for chunk in response.aiter_bytes(chunk_size):
+                        dest.write(chunk)
+                        written += len(chunk)
+            except (httpx.HTTPStatusError, httpx.TransportError) as exc:
+                recorder.record(time.perf_counter() - started, error=True)
+                status = exc.response.status_code if isinstance(exc, httpx.HTTPStatusError) else None
+                if status is not None and status not in RETRY_STATUSES:
+                    breaker.record_success()
+                    raise
+                if attempt >= self.retries:
+                    breaker.record_failure()
+                    raise
+                self.retried += 1
+                await asyncio.sleep(backoff_delay(attempt))
+                attempt += 1
+                continue
+            recorder.record(time.perf_counter() - started)
+            breaker.record_success()
+            dest.seek(0)
+            return written
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+    def stats(self) -> dict:
+        return {
+            "retried": self.retried,
+            "hosts": {host: breaker.stats() for host, breaker in sorted(self._breakers.items())},
+        }
+
+
+outbound = OutboundClient()
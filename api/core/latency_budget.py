@@ -0,0 +1,133 @@
+"""
+Per-request latency budgets for channels with hard gateway deadlines (USSD, IVR).
+
+A handler creates a LatencyBudget when the request arrives and runs each slow dependency (price
+lookup, FAQ search, model call) through budget.call(). The call gets whatever time is left; if it
+runs out or fails, the last answer that succeeded for the same key is returned instead, and
+BudgetExceeded is raised only when there is none. Overruns, timeouts and fallbacks are counted
+per channel and step for /metrics.
+"""
+import os
+import time
+import asyncio
+import inspect
+import threading
+
+from .ttl_cache import TTLCache, MISSING
+from .concurrency import run_blocking
+from .metrics import latency_metrics
+
+# Total handler time per channel; gateways typically drop a USSD hop after a few seconds
+LATENCY_BUDGETS = {
+    "ussd": float(os.getenv("USSD_LATENCY_BUDGET_MS", "1500")) / 1000,
+    "ivr": float(os.getenv("IVR_LATENCY_BUDGET_MS", "3000")) / 1000,
+}
+# Time kept back from each step for rendering and sending the response
+LATENCY_BUDGET_RESERVE = float(os.getenv("LATENCY_BUDGET_RESERVE_MS", "50")) / 1000
+FALLBACK_ANSWERS_MAX = int(os.getenv("LATENCY_FALLBACK_MAX_ENTRIES", "5000"))
+FALLBACK_ANSWERS_TTL = float(os.getenv("LATENCY_FALLBACK_TTL_SECONDS", str(6 * 3600)))
+
+
+class BudgetExceeded(Exception):
+    """A budgeted step ran out of time (or failed) and there was no earlier answer to fall back on."""
+
+
+class BudgetStats:
+    """Counters per channel: requests, requests over budget, and per-step timeouts, errors and fallbacks."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels: dict[str, dict] = {}
+
+    def _channel(self, channel: str) -> dict:
+        counters = self._channels.get(channel)
+        if counters is None:
+            counters = self._channels[channel] = {"requests": 0, "over_budget": 0, "steps": {}}
+        return counters
+
+    def count(self, channel: str, name: str, step: str = None) -> None:
+        with self._lock:
+            counters = self._channel(channel)
+            if step is not None:
+                counters = counters["steps"].setdefault(step, {"calls": 0, "timeouts": 0, "errors": 0, "fallbacks": 0, "unanswered": 0})
+            counters[name] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                channel: {**counters, "steps": {step: dict(c) for step, c in counters["steps"].items()}}
+                for channel, counters in self._channels.items()
+            }
+
+
+budget_stats = BudgetStats()
+# Last successful answer per (channel, step, key), served when a later call runs over budget
+fallback_answers = TTLCache(maxsize=FALLBACK_ANSWERS_MAX, ttl=FALLBACK_ANSWERS_TTL)
+
+
+def remember_answer(channel: str, step: str, key, answer) -> None:
+    """Pre-computes the fallback for a step, so it has an answer even before a call has succeeded."""
+    fallback_answers.set((channel, step, key), answer)
+
+
+class LatencyBudget:
+    def __init__(self, channel: str, seconds: float = None, timer=time.perf_counter):
+        self.channel = channel
+        self.seconds = LATENCY_BUDGETS.get(channel, 2.0) if seconds is None else seconds
+        self._timer = timer
+        self.started = timer()
+        self.deadline = self.started + self.seconds
+        self.degraded = False # Set when any step was answered from a fallback
+        budget_stats.count(channel, "requests")
+
+    def remaining(self) -> float:
+        return self.deadline - self._timer()
+
+    def step_timeout(self) -> float:
+        return self.remaining() - LATENCY_BUDGET_RESERVE
+
+    async def call(self, step: str, func, *args, fallback_key=None, **kwargs):
+        """
+        Runs `func(*args, **kwargs)` within the remaining budget; a coroutine function is awaited,
+        a plain function runs in the blocking-I/O pool. Successful results are remembered under
+        `fallback_key` (when given) and served if a later call for the same key times out or fails.
+        """
+        budget_stats.count(self.channel, "calls", step)
+        cache_key = (self.channel, step, fallback_key)
+        remaining = self.step_timeout()
+        try:
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            if inspect.iscoroutinefunction(func):
+                result = await asyncio.wait_for(func(*args, **kwargs), remaining)
+            else:
+                result = await run_blocking(func, *args, timeout=remaining, **kwargs)
+        except asyncio.TimeoutError:
+            budget_stats.count(self.channel, "timeouts", step)
+            print(f"WARNING - {self.channel} step '{step}' ran past the {self.seconds * 1000:.0f} ms budget.")
+            return self._fallback(step, cache_key, fallback_key)
+        except Exception as e:
+            budget_stats.count(self.channel, "errors", step)
+            print(f"ERROR - {self.channel} step '{step}' failed: {e}")
+            return self._fallback(step, cache_key, fallback_key, error=e)
+        if fallback_key is not None:
+            fallback_answers.set(cache_key, result)
+        return result
+
+    def _fallback(self, step: str, cache_key: tuple, fallback_key, error: Exception = None):
+        answer = fallback_answers.peek(cache_key) if fallback_key is not None else MISSING
+        if answer is MISSING:
+            budget_stats.count(self.channel, "unanswered", step)
+            raise BudgetExceeded(f"{self.channel} step '{step}' has no fallback answer") from error
+        budget_stats.count(self.channel, "fallbacks", step)
+        self.degraded = True
+        return answer
+
+    def finish(self) -> float:
+        """Records the request's total time; returns it in seconds."""
+        elapsed = self._timer() - self.started
+        over = elapsed > self.seconds
+        if over:
+            budget_stats.count(self.channel, "over_budget")
+        latency_metrics.recorder(f"{self.channel}_handler").record(elapsed, error=over)
+        return elapsed
@@ -0,0 +1,98 @@
+"""
+Mapping between market price feed rows and the shared `market_price_cache` table, with batched
+upserts for the sync job and a keyset-paginated reader for API workers (MARKET_PRICES_SOURCE=supabase).
+"""
+import json
+from datetime import datetime, timedelta, timezone
+
+from .price_store import normalize_key
+
+TABLE = "market_price_cache"
+ON_CONFLICT = "region,crop_type,price_date" # uq_market_price_region_crop_date
+COLUMNS = "id, region, crop_type, price_date, price_data, trend_advice"
+
+
+def to_table_row(row: dict, trend_advice: str = None, ttl_days: float = 30, fetched_at: datetime = None) -> dict:
+    """
+    The conflict columns hold normalized region/crop names, the same key price_key() dedupes on,
+    so "Oromia" and "oromia " update one row. The feed's spelling is kept in price_data for display.
+    """
+    fetched_at = fetched_at or datetime.now(timezone.utc)
+    return {
+        "region": normalize_key(row["region"]),
+        "crop_type": normalize_key(row["crop_type"]),
+        "price_date": row["date"],
+        "price_data": {
+            "price_per_kg": row["price_per_kg"],
+            "currency": row.get("currency", "ETB"),
+            "source": row.get("source"),
+            "region": row["region"],
+            "crop_type": row["crop_type"],
+        },
+        "trend_advice": trend_advice,
+        "fetched_at": fetched_at.isoformat(),
+        "expires_at": (fetched_at + timedelta(days=ttl_days)).isoformat(),
+    }
+
+
+def from_table_row(record: dict) -> dict:
+    """Feed-shaped row (as in market_prices.json) from a market_price_cache record."""
+    price_data = record.get("price_data") or {}
+    if isinstance(price_data, str):
+        price_data = json.loads(price_data)
+    row = {
+        # Records written before display names were kept in price_data fall back to the key columns
+        "region": price_data.get("region") or record["region"],
+        "crop_type": price_data.get("crop_type") or record["crop_type"],
+        "date": record["price_date"],
+        "price_per_kg": price_data.get("price_per_kg"),
+        "currency": price_data.get("currency", "ETB"),
+    }
+    if price_data.get("source"):
+        row["source"] = price_data["source"]
+    return row
+
+
+def upsert_rows(supabase, table_rows, batch_size: int = 500) -> int:
+    """Upserts rows in batches of `batch_size` (one request each). Returns the number of rows sent."""
+    sent = 0
+    batch = []
+    for table_row in table_rows:
+        batch.append(table_row)
+        if len(batch) >= batch_size:
+            supabase.table(TABLE).upsert(batch, on_conflict=ON_CONFLICT).execute()
+            sent += len(batch)
+            batch = []
+    if batch:
+        supabase.table(TABLE).upsert(batch, on_conflict=ON_CONFLICT).execute()
+        sent += len(batch)
+    return sent
+
+
+def iter_table_pages(supabase, page_size: int = 1000):
+    """
+    Yields pages of market_price_cache records using keyset pagination on `id`
+    (WHERE id > last_id ORDER BY id LIMIT n), which stays fast at any depth unlike OFFSET.
+    """
+    last_id = 0
+    while True:
+        response = (
+            supabase.table(TABLE).select(COLUMNS)
+            .gt("id", last_id)
+            .order("id")
+            .limit(page_size)
+            .execute()
+        )
+        page = response.data or []
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        last_id = page[-1]["id"]
+
+
+def latest_fetched_at(supabase):
+    """Cheap change marker for the table: the most recent fetched_at (None when empty)."""
+    response = supabase.table(TABLE).select("fetched_at").order("fetched_at", desc=True).limit(1).execute()
+    return response.data[0]["fetched_at"] if response.data else None
@@ -0,0 +1,64 @@
+import threading
+from collections import deque
+
+
+class LatencyRecorder:
+    """
+    Rolling latency statistics for one operation. Keeps the most recent `window` samples
+    for percentiles plus lifetime count/error totals; cheap enough to call on every request.
+    """
+
+    def __init__(self, window: int = 1024):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.errors = 0
+
+    def record(self, seconds: float, error: bool = False) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            if error:
+                self.errors += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            samples = sorted(self._samples)
+            count, errors = self.count, self.errors
+        if not samples:
+            return {"count": count, "errors": errors}
+
+        def _percentile(p: float) -> float:
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 2)
+
+        return {
+            "count": count,
+            "errors": errors,
+            "avg_ms": round(sum(samples) / len(samples) * 1000, 2),
+            "p50_ms": _percentile(0.50),
+            "p95_ms": _percentile(0.95),
+            "p99_ms": _percentile(0.99),
+        }
+
+
+class MetricsRegistry:
+    """Named LatencyRecorders, created on first use."""
+
+    def __init__(self):
+        self._recorders: dict[str, LatencyRecorder] = {}
+        self._lock = threading.Lock()
+
+    def recorder(self, name: str) -> LatencyRecorder:
+        with self._lock:
+            recorder = self._recorders.get(name)
+            if recorder is None:
+                recorder = self._recorders[name] = LatencyRecorder()
+            return recorder
+
+    def stats(self) -> dict:
+        with self._lock:
+            recorders = dict(self._recorders)
+        return {name: recorder.stats() for name, recorder in sorted(recorders.items())}
+
+
+latency_metrics = MetricsRegistry()
@@ -0,0 +1,35 @@
+import os
+
+import google.generativeai as genai
+from dotenv import load_dotenv
+
+from .singleflight import SingleFlight
+
+# Load environment variables and configure the Gemini API
+load_dotenv()
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+if not GEMINI_API_KEY:
+    raise ValueError("GEMINI_API_KEY is not set in the environment variables.")
+genai.configure(api_key=GEMINI_API_KEY)
+model = genai.GenerativeModel('gemini-1.5-flash')
+
+# In-flight model calls, shared by every route so identical questions are answered once
+model_singleflight = SingleFlight()
+
+
+async def generate_answer(prompt: str, coalesce_key=None, limit=None) -> str:
+    """
+    Calls the model. Concurrent calls with the same coalesce_key (e.g. a shareable response-cache
+    key) share one model request instead of each spending quota on an identical answer.
+    `limit` is an optional semaphore held for the duration of the request.
+    """
+    async def _call():
+        if limit is None:
+            response = await model.generate_content_async(prompt)
+        else:
+            async with limit:
+                response = await model.generate_content_async(prompt)
+        return response.text
+    if coalesce_key is None:
+        return await _call()
+    return await model_singleflight.do(coalesce_key, _call)
@@ -0,0 +1,185 @@
+"""
+Pre-encoded JSON responses for data that only changes when a new version is loaded.
+
+Each payload is serialized and compressed (gzip, and brotli when the `brotli` package is installed)
+once per data version and served with a strong ETag, so polling clients get a 304 when nothing
+changed and otherwise the smallest encoding they accept, without per-request encoding work.
+"""
+import os
+import re
+import gzip
+import json
+import hashlib
+
+from fastapi import Request, Response
+
+from .ttl_cache import TTLCache, MISSING
+
+try:
+    import brotli # Optional: pip install brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson # Optional: several times faster than json for large payloads
+except ImportError:
+    orjson = None
+
+# How many previous versions a dataset can compute `since=` deltas against
+DELTA_HISTORY = int(os.getenv("DATA_DELTA_HISTORY", "10"))
+# A data version, as sent back in `since=`: the first 16 hex digits of the content hash
+VERSION_RE = re.compile(r"^[0-9a-f]{16}$")
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 512
+
+
+class EncodedPayload:
+    __slots__ = ("body", "gzip", "br", "etag")
+
+    def __init__(self, body: bytes, etag: str):
+        self.body = body
+        self.etag = etag
+        self.gzip = gzip.compress(body, compresslevel=6, mtime=0) if len(body) >= MIN_COMPRESS_BYTES else None
+        self.br = brotli.compress(body) if brotli is not None and self.gzip is not None else None
+
+
+def encode_json(obj) -> bytes:
+    """Compact UTF-8 JSON, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison (RFC 9110 13.1.2): proxies may add a W/ prefix after compressing
+    candidates = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag in candidates
+
+
+def _accepts(accept_encoding: str, coding: str) -> bool:
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() == coding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def payload_response(request: Request, payload: EncodedPayload, headers: dict = None) -> Response:
+    """304 if the client already has this version, otherwise the best encoding it accepts."""
+    response_headers = {"ETag": payload.etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+    response_headers.update(headers or {})
+    if _etag_matches(request.headers.get("if-none-match"), payload.etag):
+        return Response(status_code=304, headers=response_headers)
+
+    accept_encoding = request.headers.get("accept-encoding", "")
+    body = payload.body
+    if payload.br is not None and _accepts(accept_encoding, "br"):
+        body = payload.br
+        response_headers["Content-Encoding"] = "br"
+    elif payload.gzip is not None and _accepts(accept_encoding, "gzip"):
+        body = payload.gzip
+        response_headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=response_headers)
+
+
+class KeyedDataset:
+    """
+    One version of a list dataset (rows identified by `key_func`), with its encoded payload and a
+    log of which keys changed relative to recent earlier versions, for `since=<version>` deltas.
+    `version` is derived from the content hash, so every worker loading the same data agrees on it.
+    """
+
+    def __init__(self, rows: list, content_hash: str, key_func):
+        self.rows = rows
+        self.version = content_hash[:16]
+        self._key_func = key_func
+        self._by_key = {}
+        for row in rows:
+            try:
+                self._by_key[key_func(row)] = row
+            except (KeyError, TypeError, AttributeError):
+                continue
+        self._changes = {} # earlier version -> (changed keys, deleted keys), newest first
+        self._delta_payloads = {}
+        self._full_delta = None
+        self.payload = EncodedPayload(encode_json(rows), f'"{self.version}"')
+
+    def link_previous(self, previous: "KeyedDataset", limit: int = DELTA_HISTORY) -> None:
+        """Records what changed since `previous` (and, transitively, since the versions it knew)."""
+        if previous is None or previous.version == self.version or limit <= 0:
+            return
+        changed = {key for key, row in self._by_key.items() if previous._by_key.get(key) != row}
+        deleted = {key for key in previous._by_key if key not in self._by_key}
+        changes = {previous.version: (changed, deleted)}
+        for version, (old_changed, old_deleted) in list(previous._changes.items())[:limit - 1]:
+            if version == self.version:
+                continue
+            keys = old_changed | old_deleted | changed | deleted
+            changes[version] = (
+                {key for key in keys if key in self._by_key},
+                {key for key in keys if key not in self._by_key},
+            )
+        self._changes = changes
+
+    def delta_payload(self, since: str) -> EncodedPayload:
+        """
+        Rows changed since version `since`; the full list (full=true) if that version is unknown.
+        Raises ValueError if `since` is not a version at all.
+        """
+        if not VERSION_RE.match(since or ""):
+            raise ValueError(f"since must be a data version ({VERSION_RE.pattern})")
+        if since != self.version and since not in self._changes:
+            # Unknown to this process (older than the history, or loaded before a restart): one shared
+            # full payload per version, so these clients do not each pay for encoding the whole dataset
+            if self._full_delta is None:
+                body = {"version": self.version, "since": None, "full": True, "changed": self.rows, "deleted": []}
+                self._full_delta = EncodedPayload(encode_json(body), f'"{self.version}-full"')
+            return self._full_delta
+        payload = self._delta_payloads.get(since)
+        if payload is not None:
+            return payload
+        if since == self.version:
+            body = {"version": self.version, "since": since, "full": False, "changed": [], "deleted": []}
+        else:
+            changed, deleted = self._changes[since]
+            body = {
+                "version": self.version,
+                "since": since,
+                "full": False,
+                "changed": [self._by_key[key] for key in changed],
+                "deleted": sorted(list(key) if isinstance(key, tuple) else key for key in deleted),
+            }
+        payload = self._delta_payloads[since] = EncodedPayload(encode_json(body), f'"{self.version}-since-{since}"')
+        return payload
+
+
+class PayloadCache:
+    """
+    Encoded payloads keyed by (data version, payload key), e.g. one per filter combination of a
+    route. Each distinct response is built and serialized once per data version; entries for old
+    versions are never hit again and age out of the LRU.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 24 * 3600):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get_or_build(self, version: str, key: tuple, build) -> EncodedPayload:
+        """The cached payload, or `build()` (a JSON-serializable object) encoded and cached."""
+        cache_key = (version, key)
+        payload = self._cache.get(cache_key)
+        if payload is MISSING:
+            body = encode_json(build())
+            key_hash = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:12]
+            payload = EncodedPayload(body, f'"{version}-{key_hash}"')
+            self._cache.set(cache_key, payload)
+        return payload
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+payload_cache = PayloadCache(maxsize=int(os.getenv("PAYLOAD_CACHE_MAX_ENTRIES", "1024")))
@@ -0,0 +1,227 @@
+import numpy as np
+
+from .price_store import normalize_key
+
+# Series ids are packed above the date ordinal so one sorted int64 key orders rows by (series, date)
+_ORDINAL_BITS = 21
+_EPOCH = np.datetime64("0001-01-01", "D") # date.toordinal() == 1
+
+DEFAULT_ADVICE = "Prices are stable. Consider market demand before selling."
+
+
+def _fenwick_add(tree: np.ndarray, base: np.ndarray, local: np.ndarray, size: np.ndarray) -> None:
+    """
+    Adds one at 1-based `local` positions of the Fenwick trees stored at tree[base + 1:base + size + 1].
+    tree[0] is never part of a tree, so finished positions are parked there and it is cleared at the end.
+    """
+    for _ in range(int(size.max()).bit_length()):
+        np.add.at(tree, np.where(local <= size, base + local, 0), 1) # Rows of one group can share a node
+        local = local + (local & -local)
+    tree[0] = 0
+
+
+def _fenwick_sum(tree: np.ndarray, base: np.ndarray, local: np.ndarray) -> np.ndarray:
+    """Prefix sums up to 1-based `local` positions of the Fenwick trees stored after `base` (tree[0] is 0)."""
+    totals = np.zeros(len(local), dtype=np.int64)
+    for _ in range(int(local.max()).bit_length()):
+        totals += tree[np.where(local > 0, base + local, 0)]
+        local = local & (local - 1)
+    return totals
+
+
+def _run_ends(boundary: np.ndarray) -> np.ndarray:
+    """For each index, one past the last index of its run, where `boundary[i]` marks the last element of a run."""
+    index = np.where(boundary, np.arange(len(boundary)), len(boundary) - 1)
+    return np.minimum.accumulate(index[::-1])[::-1] + 1
+
+
+class PriceHistory:
+    """
+    Columnar price history: date ordinals, float64 prices and interned region/crop codes,
+    sorted so each (region, crop) series is one contiguous slice. Trend analytics are computed
+    for every row in bulk when the history is built, so a lookup is a binary search plus array reads.
+    """
+
+    def __init__(self, ordinals, prices, region_codes, crop_codes, regions: list[str], crops: list[str],
+                 ma_window: int = 7, volatility_window: int = 30):
+        self.regions = regions
+        self.crops = crops
+        self._region_index = {name: code for code, name in enumerate(regions)}
+        self._crop_index = {name: code for code, name in enumerate(crops)}
+        self.ma_window = ma_window
+        self.volatility_window = volatility_window
+
+        series = np.asarray(region_codes, dtype=np.int64) * len(crops) + np.asarray(crop_codes, dtype=np.int64)
+        keys = (series << _ORDINAL_BITS) | np.asarray(ordinals, dtype=np.int64)
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.series = series[order]
+        self.ordinals = np.asarray(ordinals, dtype=np.int64)[order]
+        self.prices = np.asarray(prices, dtype=np.float64)[order]
+        self._compute()
+
+    @classmethod
+    def from_store(cls, store, **kwargs) -> "PriceHistory":
+        """Builds the columnar history from a PriceStore (names are its normalized keys)."""
+        regions, crops = {}, {}
+        ordinals, prices, region_codes, crop_codes = [], [], [], []
+        for (region_key, crop_key), records in store.series():
+            region_code = regions.setdefault(region_key, len(regions))
+            crop_code = crops.setdefault(crop_key, len(crops))
+            for record in records:
+                ordinals.append(record.date.toordinal())
+                prices.append(record.price)
+            region_codes.extend([region_code] * len(records))
+            crop_codes.extend([crop_code] * len(records))
+        return cls(ordinals, prices, region_codes, crop_codes, list(regions), list(crops), **kwargs)
+
+    def _window_starts(self, days: int) -> np.ndarray:
+        """Index of the first row of the same series within the last `days` days of each row."""
+        return np.searchsorted(self.keys, self.keys - (days - 1), side="left")
+
+    def _compute(self) -> None:
+        n = len(self.prices)
+        index = np.arange(n)
+
+        # Moving average over the last `ma_window` days
+        cumulative = np.concatenate(([0.0], np.cumsum(self.prices)))
+        starts = self._window_starts(self.ma_window)
+        self.moving_avg = (cumulative[index + 1] - cumulative[starts]) / (index + 1 - starts)
+
+        # Week-over-week change against the latest price at least 7 days earlier in the same series
+        previous = np.searchsorted(self.keys, self.keys - 7, side="right") - 1
+        has_previous = (previous >= 0) & (self.series[np.maximum(previous, 0)] == self.series)
+        self.week_change = np.full(n, np.nan)
+        base = self.prices[previous[has_previous]]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.week_change[has_previous] = np.where(base > 0, self.prices[has_previous] / base - 1.0, np.nan)
+
+        # Volatility: standard deviation of daily log returns over `volatility_window` days
+        same_series = np.zeros(n, dtype=bool)
+        same_series[1:] = self.series[1:] == self.series[:-1]
+        returns = np.zeros(n)
+        valid = same_series & (self.prices > 0) & (np.roll(self.prices, 1) > 0)
+        returns[valid] = np.log(self.prices[valid] / np.roll(self.prices, 1)[valid])
+        counts = np.concatenate(([0], np.cumsum(valid)))
+        sums = np.concatenate(([0.0], np.cumsum(returns)))
+        squares = np.concatenate(([0.0], np.cumsum(returns * returns)))
+        starts = self._window_starts(self.volatility_window)
+        count = counts[index + 1] - counts[starts]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = (sums[index + 1] - sums[starts]) / count
+            variance = (squares[index + 1] - squares[starts]) / count - mean * mean
+        self.volatility = np.where(count >= 2, np.sqrt(np.maximum(variance, 0.0)), np.nan)
+
+        # Seasonal percentile: share of this series' prices in the same calendar month (all years) dated on or
+        # before this row that are at or below it. Later prices are never counted, so a signal as of a past
+        # date is what could have been known then.
+        months = (_EPOCH + (self.ordinals - 1)).astype("datetime64[M]").astype(np.int64) % 12
+        self.seasonal_percentile = self._seasonal_percentile(self.series * 12 + months)
+
+    def _seasonal_percentile(self, groups: np.ndarray) -> np.ndarray:
+        """
+        Counts, for every row at once, the earlier same-group rows priced at or below it with one small
+        Fenwick tree per group over its prices in sorted order. Rows are added one date step at a time (the
+        k-th distinct date of every group together), so the Python loop runs once per distinct day in a
+        group, not once per row.
+        """
+        n = len(self.prices)
+        if not n:
+            return np.zeros(0)
+        index = np.arange(n)
+
+        # Date order within each group: rows are already date-ordered within a series, so the row index
+        # breaks ties. Unique int64 keys sort faster than a stable or multi-key sort.
+        by_date = np.argsort(groups * n + index)
+        grouped, days = groups[by_date], self.ordinals[by_date]
+        group_last = np.ones(n, dtype=bool)
+        group_last[:-1] = grouped[1:] != grouped[:-1]
+        day_last = group_last.copy()
+        day_last[:-1] |= days[1:] != days[:-1]
+        group_start = np.concatenate(([0], np.flatnonzero(group_last[:-1]) + 1))
+        start_sorted = np.repeat(group_start, np.diff(np.append(group_start, n)))
+        days_before = np.cumsum(day_last) - day_last # Distinct (group, day) runs that ended before each row
+        step, seen = np.empty(n, dtype=np.int64), np.empty(n, dtype=np.int64)
+        step[by_date] = days_before - days_before[start_sorted]
+        seen[by_date] = _run_ends(day_last) - start_sorted # Same-group rows dated on or before this one
+
+        # Each group's tree covers its rows in price order: tree[start + 1:end + 1]
+        price_rank = np.empty(n, dtype=np.int64)
+        price_rank[np.argsort(self.prices)] = index
+        by_price = np.argsort(groups * n + price_rank)
+        prices = self.prices[by_price]
+        price_last = group_last.copy() # Groups have the same sizes and order in both sorts
+        price_last[:-1] |= prices[1:] != prices[:-1]
+        base, local, size, at_or_below = (np.empty(n, dtype=np.int64) for _ in range(4))
+        base[by_price] = start_sorted
+        local[by_price] = index - start_sorted + 1
+        size[by_price] = _run_ends(group_last) - start_sorted
+        at_or_below[by_price] = _run_ends(price_last) - start_sorted # Equal prices count as at or below
+
+        # Lay the rows out step by step, so each step below is a contiguous slice
+        by_step = np.argsort(step.astype(np.min_scalar_type(int(step.max()))), kind="stable") # Radix sort
+        base, local, size, at_or_below, seen = (a[by_step] for a in (base, local, size, at_or_below, seen))
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(step[by_step])) + 1, [n]))
+        tree = np.zeros(n + 1, dtype=np.int64)
+        percentile = np.empty(n)
+        for lo, hi in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            _fenwick_add(tree, base[lo:hi], local[lo:hi], size[lo:hi])
+            percentile[lo:hi] = _fenwick_sum(tree, base[lo:hi], at_or_below[lo:hi]) / seen[lo:hi]
+        result = np.empty(n)
+        result[by_step] = percentile
+        return result
+
+    def _locate(self, region: str, crop: str, on_or_before=None):
+        region_code = self._region_index.get(normalize_key(region))
+        crop_code = self._crop_index.get(normalize_key(crop))
+        if region_code is None or crop_code is None:
+            return None
+        series = region_code * len(self.crops) + crop_code
+        ordinal = on_or_before.toordinal() if on_or_before else (1 << _ORDINAL_BITS) - 1
+        i = int(np.searchsorted(self.keys, (series << _ORDINAL_BITS) | ordinal, side="right")) - 1
+        if i < 0 or self.series[i] != series:
+            return None
+        return i
+
+    def signal(self, region: str, crop: str, on_or_before=None):
+        """Trend figures and hold/sell advice for the latest price of a region/crop (as of a date), or None."""
+        i = self._locate(region, crop, on_or_before)
+        if i is None:
+            return None
+        week_change = float(self.week_change[i])
+        volatility = float(self.volatility[i])
+        signal = {
+            "price": float(self.prices[i]),
+            "moving_avg": round(float(self.moving_avg[i]), 2),
+            "week_change": None if np.isnan(week_change) else round(week_change, 4),
+            "volatility": None if np.isnan(volatility) else round(volatility, 4),
+            "seasonal_percentile": round(float(self.seasonal_percentile[i]), 2),
+        }
+        signal["advice"] = advise(signal)
+        return signal
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+
+def advise(signal: dict) -> str:
+    """Hold/sell advice from a price signal."""
+    week_change = signal["week_change"]
+    percentile = signal["seasonal_percentile"]
+    if week_change is None:
+        return DEFAULT_ADVICE
+    if percentile >= 0.75 and week_change <= 0:
+        advice = "Sell: prices are near their seasonal high and have started to fall."
+    elif percentile >= 0.75:
+        advice = "Sell: prices are high for this time of year."
+    elif percentile <= 0.25 and week_change >= 0:
+        advice = "Hold: prices are low for the season and rising."
+    elif week_change <= -0.05:
+        advice = "Hold if you can store safely: prices dropped over the past week."
+    elif signal["price"] >= signal["moving_avg"]:
+        advice = "Prices are above their weekly average; selling now is reasonable."
+    else:
+        advice = DEFAULT_ADVICE
+    if signal["volatility"] is not None and signal["volatility"] >= 0.05:
+        advice += " Prices are volatile, so check again before selling."
+    return advice
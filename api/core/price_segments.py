@@ -0,0 +1,495 @@
+"""
+Append-friendly storage for market prices: the base market_prices.json plus JSONL delta segments.
+
+Ingest writes each batch of new or changed rows as one segment file (written to a temp file and
+renamed into place, so readers never see a partial segment). Readers apply the base and then every
+segment in name order, the last row for a (region, crop, date) key winning. Compaction folds the
+segments back into the base; because applying a segment twice gives the same result, readers that
+race with compaction still see consistent data.
+
+Ingest compares feed rows against a fingerprint index persisted next to the base (one line per key,
+plus a marker per segment it covers), so it never parses the whole dataset: new segments are
+appended to the index as they are written, and the index is rebuilt by streaming the base only
+when the base itself changed (i.e. after compaction).
+"""
+import os
+import re
+import json
+import time
+import tempfile
+from datetime import date, datetime, timezone
+
+from .price_store import normalize_key
+
+REQUIRED_FIELDS = ("region", "crop_type", "date", "price_per_kg", "currency")
+SEGMENT_SUFFIX = ".jsonl"
+# Longest array element held while waiting for its end; past this it is quarantined and skipped
+MAX_ELEMENT_CHARS = int(os.getenv("MARKET_PRICES_MAX_ELEMENT_CHARS", str(64 * 1024)))
+# Where the next object element starts, when resyncing after an element that never ended
+_NEXT_OBJECT_RE = re.compile(r",\s*(?=\{)")
+# Characters read at a time when streaming the base file
+READ_CHARS = 64 * 1024
+
+
+def segments_dir_for(base_path: str) -> str:
+    return os.path.splitext(base_path)[0] + ".segments"
+
+
+def quarantine_path_for(base_path: str) -> str:
+    return os.path.splitext(base_path)[0] + ".quarantine.jsonl"
+
+
+def fingerprint_index_path_for(base_path: str) -> str:
+    return os.path.splitext(base_path)[0] + ".fingerprints.jsonl"
+
+
+def price_key(row: dict) -> tuple:
+    return normalize_key(row["region"]), normalize_key(row["crop_type"]), row["date"]
+
+
+def validate_row(row):
+    """Returns (clean_row, None) for a valid feed row or (None, reason) for one that must be quarantined."""
+    if not isinstance(row, dict):
+        return None, "not an object"
+    missing = [field for field in REQUIRED_FIELDS if row.get(field) in (None, "")]
+    if missing:
+        return None, f"missing fields: {', '.join(missing)}"
+    try:
+        price_date = date.fromisoformat(str(row["date"]))
+    except ValueError:
+        return None, f"invalid date: {row['date']!r}"
+    try:
+        price = float(row["price_per_kg"])
+    except (TypeError, ValueError):
+        return None, f"invalid price: {row['price_per_kg']!r}"
+    if price < 0:
+        return None, f"negative price: {price}"
+    clean = dict(row)
+    clean["region"] = str(row["region"]).strip()
+    clean["crop_type"] = str(row["crop_type"]).strip()
+    clean["date"] = price_date.isoformat()
+    clean["price_per_kg"] = price
+    return clean, None
+
+
+def iter_feed(chunks, max_element_chars: int = MAX_ELEMENT_CHARS):
+    """
+    Incrementally parses a feed given as an iterable of text chunks, yielding one row at a time.
+    Accepts either a JSON array (parsed element by element, never holding the whole document) or NDJSON.
+    Elements that are not valid JSON are yielded as ('__invalid__', text) so they can be quarantined.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    chunks = iter(chunks)
+    mode = None
+    elements = None
+    for chunk in chunks:
+        buffer += chunk
+        if mode is None:
+            stripped = buffer.lstrip()
+            if not stripped:
+                continue
+            mode = "array" if stripped[0] == "[" else "lines"
+            buffer = stripped[1:] if mode == "array" else stripped
+            elements = _ArrayElements(decoder, max_element_chars) if mode == "array" else None
+        if mode == "lines":
+            *lines, buffer = buffer.split("\n")
+            for line in lines:
+                yield from _parse_line(decoder, line)
+        else:
+            yield from elements.feed(buffer)
+            buffer = ""
+    if mode == "lines":
+        yield from _parse_line(decoder, buffer)
+    elif mode == "array":
+        yield from elements.feed("", final=True)
+
+
+def _parse_line(decoder, line: str):
+    line = line.strip()
+    if line:
+        try:
+            yield decoder.decode(line)
+        except json.JSONDecodeError:
+            yield ("__invalid__", line[:500])
+
+
+class _ArrayElements:
+    """
+    Splits the text of a JSON array into elements as it arrives. Well-formed elements are decoded
+    directly; when one fails, its real end is found by scanning brackets and strings (the scan
+    resumes where the previous chunk stopped), so a malformed element is quarantined whole and the
+    rest of the feed keeps streaming. An element with no end within `max_element_chars` (e.g. an
+    unclosed brace) is quarantined and parsing resumes at the next object.
+    """
+
+    def __init__(self, decoder, max_element_chars: int):
+        self.decoder = decoder
+        self.max_element_chars = max_element_chars
+        self.buffer = ""
+        self.done = False
+        self.skipping = False
+        self._reset_scan()
+
+    def _reset_scan(self) -> None:
+        self._scanned = 0 # Characters of the pending element already scanned
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def _element_end(self, buffer: str, start: int) -> int:
+        """Index just past the element starting at `start`, or -1 if it has not ended yet."""
+        depth, in_string, escape = self._depth, self._in_string, self._escape
+        for i in range(start + self._scanned, len(buffer)):
+            ch = buffer[i]
+            if in_string:
+                if escape:
+                    escape = False
+                elif ch == "\\":
+                    escape = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch in "{[":
+                depth += 1
+            elif ch in "}]":
+                if depth == 0:
+                    return i # The array's closing bracket ends a scalar element
+                depth -= 1
+                if depth == 0:
+                    return i + 1
+            elif ch == "," and depth == 0:
+                return i
+        self._scanned = len(buffer) - start
+        self._depth, self._in_string, self._escape = depth, in_string, escape
+        return -1
+
+    def feed(self, text: str, final: bool = False) -> list:
+        buffer = self.buffer + text
+        rows = []
+        pos = 0
+        while not self.done:
+            if self.skipping:
+                match = _NEXT_OBJECT_RE.search(buffer, pos)
+                if match is None:
+                    # Keep a trailing comma: the next object may start in the next chunk
+                    comma = buffer.rfind(",", pos)
+                    pos = comma if comma >= 0 and not buffer[comma + 1:].strip() else len(buffer)
+                    break
+                pos = match.end()
+                self.skipping = False
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if buffer[pos] == "]":
+                self.done = True
+                break
+            if self._scanned == 0:
+                try:
+                    row, end = self.decoder.raw_decode(buffer, pos)
+                    rows.append(row)
+                    pos = end
+                    continue
+                except json.JSONDecodeError:
+                    pass
+            end = self._element_end(buffer, pos)
+            if end < 0:
+                if final:
+                    rows.extend(self._decode(buffer[pos:]))
+                    pos = len(buffer)
+                elif len(buffer) - pos > self.max_element_chars:
+                    rows.append(("__invalid__", buffer[pos:pos + 500]))
+                    self._reset_scan()
+                    self.skipping = True
+                    pos += 1
+                    continue
+                break
+            self._reset_scan()
+            rows.extend(self._decode(buffer[pos:end]))
+            pos = end
+        self._scanned = self._scanned if pos < len(buffer) else 0
+        self.buffer = buffer[pos:]
+        return rows
+
+    def _decode(self, element: str) -> list:
+        element = element.strip()
+        if not element:
+            return []
+        try:
+            return [self.decoder.decode(element)]
+        except json.JSONDecodeError:
+            return [("__invalid__", element[:500])]
+
+
+def list_segments(segments_dir: str) -> list[str]:
+    try:
+        names = sorted(name for name in os.listdir(segments_dir) if name.endswith(SEGMENT_SUFFIX))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(segments_dir, name) for name in names]
+
+
+def read_segment(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def load_merged_rows(base_path: str, segments_dir: str = None, segments: list[str] = None):
+    """
+    The base rows with the segments (by default all current ones) applied, plus the raw bytes read
+    (for content hashing). Returns (rows, raw_chunks). Rows keep the base order; new keys are appended.
+    """
+    segments_dir = segments_dir or segments_dir_for(base_path)
+    segments = list_segments(segments_dir) if segments is None else segments
+    raw_chunks = []
+    try:
+        with open(base_path, "rb") as f:
+            raw = f.read()
+        raw_chunks.append(raw)
+        base_rows = json.loads(raw)
+    except FileNotFoundError:
+        if not segments:
+            raise
+        base_rows = []
+    if not segments:
+        return base_rows, raw_chunks
+
+    merged = {}
+    for row in base_rows:
+        try:
+            merged[price_key(row)] = row
+        except KeyError:
+            merged[id(row)] = row # Malformed base row: keep it for the store to report and skip
+    for path in segments:
+        with open(path, "rb") as f:
+            raw_chunks.append(f.read())
+        for row in read_segment(path):
+            merged[price_key(row)] = row
+    return list(merged.values()), raw_chunks
+
+
+def row_fingerprint(row: dict) -> tuple:
+    return (row.get("price_per_kg"), row.get("currency"), row.get("source"))
+
+
+class SegmentWriter:
+    """Streams rows into a temp file inside the segments dir and renames it into place on commit."""
+
+    def __init__(self, segments_dir: str):
+        os.makedirs(segments_dir, exist_ok=True)
+        self.segments_dir = segments_dir
+        self.count = 0
+        fd, self._temp_path = tempfile.mkstemp(dir=segments_dir, prefix=".ingest-", suffix=".tmp")
+        self._file = os.fdopen(fd, "w", encoding="utf-8")
+
+    def write(self, row: dict) -> None:
+        self._file.write(json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.count += 1
+
+    def commit(self):
+        """Publishes the segment; returns its path, or None if no rows were written."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        if not self.count:
+            os.remove(self._temp_path)
+            return None
+        # Time-ordered names: segments apply in the order they were written
+        name = f"seg-{time.time_ns():020d}-{os.getpid()}{SEGMENT_SUFFIX}"
+        path = os.path.join(self.segments_dir, name)
+        os.chmod(self._temp_path, 0o644)
+        os.replace(self._temp_path, path)
+        return path
+
+    def abort(self) -> None:
+        self._file.close()
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+
+def _base_signature(base_path: str):
+    try:
+        stat = os.stat(base_path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _iter_base_rows(base_path: str):
+    """The base rows, streamed through the incremental parser instead of loaded whole."""
+    try:
+        f = open(base_path, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return
+    with f:
+        for row in iter_feed(iter(lambda: f.read(READ_CHARS), "")):
+            if isinstance(row, dict):
+                yield row
+
+
+def _index_lines(rows):
+    for row in rows:
+        try:
+            key = price_key(row)
+        except KeyError:
+            continue # Malformed base row; the store reports it
+        yield json.dumps([*key, *row_fingerprint(row)], ensure_ascii=False) + "\n"
+
+
+def write_fingerprint_index(base_path: str, rows) -> None:
+    """Replaces the fingerprint index with one built from `rows` (the full contents of the base file)."""
+    index_path = fingerprint_index_path_for(base_path)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(index_path)), prefix=".fingerprints-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"base": _base_signature(base_path)}) + "\n")
+            f.writelines(_index_lines(rows))
+        os.replace(temp_path, index_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _index_segment(base_path: str, segment_path: str) -> None:
+    """Appends a segment's rows to the index, then the marker saying it is covered."""
+    with open(fingerprint_index_path_for(base_path), "a", encoding="utf-8") as f:
+        f.writelines(_index_lines(read_segment(segment_path)))
+        f.write(json.dumps({"segment": os.path.basename(segment_path)}) + "\n")
+
+
+def _read_fingerprint_index(base_path: str):
+    """(fingerprints, covered segment names) from the index, or None if it is missing, torn or for another base."""
+    try:
+        with open(fingerprint_index_path_for(base_path), "r", encoding="utf-8") as f:
+            header = json.loads(f.readline() or "null")
+            if not isinstance(header, dict) or header.get("base") != _base_signature(base_path):
+                return None
+            fingerprints, covered = {}, set()
+            for line in f:
+                record = json.loads(line)
+                if isinstance(record, dict):
+                    covered.add(record["segment"])
+                else:
+                    fingerprints[tuple(record[:3])] = tuple(record[3:])
+            return fingerprints, covered
+    except FileNotFoundError:
+        return None
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        print(f"WARNING - Rebuilding corrupt market price fingerprint index: {e}")
+        return None
+
+
+def load_fingerprints(base_path: str) -> dict:
+    """
+    {price_key: row_fingerprint} for the base plus every current segment, from the persisted index.
+    Segments the index does not cover yet are folded into it; the base is only read (streamed) when
+    the index is missing or was built for a different base file.
+    """
+    indexed = _read_fingerprint_index(base_path)
+    if indexed is None:
+        write_fingerprint_index(base_path, _iter_base_rows(base_path))
+        indexed = _read_fingerprint_index(base_path) or ({}, set())
+    fingerprints, covered = indexed
+    for path in list_segments(segments_dir_for(base_path)):
+        if os.path.basename(path) not in covered:
+            for row in read_segment(path):
+                fingerprints[price_key(row)] = row_fingerprint(row)
+            _index_segment(base_path, path)
+    return fingerprints
+
+
+def ingest_feed(rows, base_path: str, chunk_size: int = 5000) -> dict:
+    """
+    Validates feed rows in chunks and writes those that are new or changed as one delta segment.
+    Invalid rows are appended to the quarantine file with the reason instead of aborting the update.
+    Memory use is one chunk plus one fingerprint per existing key, loaded from the persisted index
+    rather than by parsing the base and segments; the work done per ingest grows with the feed.
+    """
+    segments_dir = segments_dir_for(base_path)
+    current = load_fingerprints(base_path)
+
+    stats = {"received": 0, "written": 0, "unchanged": 0, "quarantined": 0}
+    writer = SegmentWriter(segments_dir)
+    quarantine = []
+    try:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                _ingest_chunk(chunk, current, writer, quarantine, stats)
+                _write_quarantine(quarantine, base_path)
+                chunk = []
+        _ingest_chunk(chunk, current, writer, quarantine, stats)
+        _write_quarantine(quarantine, base_path)
+        stats["segment"] = writer.commit()
+    except BaseException:
+        writer.abort()
+        raise
+    if stats["segment"]:
+        _index_segment(base_path, stats["segment"])
+    return stats
+
+
+def _ingest_chunk(chunk: list, current: dict, writer: SegmentWriter, quarantine: list, stats: dict) -> None:
+    for row in chunk:
+        stats["received"] += 1
+        if isinstance(row, tuple) and row and row[0] == "__invalid__":
+            quarantine.append(({"raw": row[1]}, "invalid JSON"))
+            continue
+        clean, reason = validate_row(row)
+        if clean is None:
+            quarantine.append((row, reason))
+            continue
+        key = price_key(clean)
+        fingerprint = row_fingerprint(clean)
+        if current.get(key) == fingerprint:
+            stats["unchanged"] += 1
+            continue
+        current[key] = fingerprint
+        writer.write(clean)
+        stats["written"] += 1
+    stats["quarantined"] += len(quarantine)
+
+
+def _write_quarantine(quarantine: list, base_path: str) -> None:
+    if not quarantine:
+        return
+    quarantined_at = datetime.now(timezone.utc).isoformat()
+    with open(quarantine_path_for(base_path), "a", encoding="utf-8") as f:
+        for row, reason in quarantine:
+            f.write(json.dumps({"row": row, "reason": reason, "quarantined_at": quarantined_at}, ensure_ascii=False, default=str) + "\n")
+    quarantine.clear()
+
+
+def compact(base_path: str) -> int:
+    """Folds all current segments into the base file (atomically) and removes them. Returns segments folded."""
+    segments_dir = segments_dir_for(base_path)
+    segments = list_segments(segments_dir)
+    if not segments:
+        return 0
+    rows, _ = load_merged_rows(base_path, segments_dir, segments)
+    directory = os.path.dirname(os.path.abspath(base_path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".market_prices-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, base_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    # The merged rows are in memory already; segments written meanwhile are picked up by the next ingest
+    write_fingerprint_index(base_path, rows)
+    # Only the segments that were folded in; ones written meanwhile stay for the next compaction
+    for path in segments:
+        os.remove(path)
+    return len(segments)
@@ -0,0 +1,149 @@
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+
+def normalize_key(value) -> str:
+    """Case- and whitespace-insensitive form of a region or crop name."""
+    return " ".join(str(value or "").split()).casefold()
+
+
+class PriceRecord:
+    """One parsed market price row. The date is parsed once at load time."""
+
+    __slots__ = ("region", "crop", "date", "price", "currency", "source", "row", "model")
+
+    def __init__(self, region: str, crop: str, price_date: date, price: float, currency: str, source: str, row: dict):
+        self.region = region
+        self.crop = crop
+        self.date = price_date
+        self.price = price
+        self.currency = currency
+        self.source = source
+        self.row = row
+        self.model = None # Response model, built on first use and then reused
+
+
+class _Series:
+    """Records of one (region, crop) pair sorted by date, with a parallel list of date ordinals for bisect."""
+
+    __slots__ = ("ordinals", "records")
+
+    def __init__(self, records: list):
+        records.sort(key=lambda record: record.date)
+        self.records = records
+        self.ordinals = [record.date.toordinal() for record in records]
+
+    def between(self, start: date = None, end: date = None) -> list:
+        lo = bisect_left(self.ordinals, start.toordinal()) if start else 0
+        hi = bisect_right(self.ordinals, end.toordinal()) if end else len(self.ordinals)
+        return self.records[lo:hi]
+
+    def latest(self, on_or_before: date = None) -> list:
+        """All records on the most recent date not after `on_or_before`."""
+        hi = bisect_right(self.ordinals, on_or_before.toordinal()) if on_or_before else len(self.ordinals)
+        if hi == 0:
+            return []
+        lo = bisect_left(self.ordinals, self.ordinals[hi - 1], 0, hi)
+        return self.records[lo:hi]
+
+
+class PriceStore:
+    """
+    Market prices indexed at load time: a hash index on normalized (region, crop) pointing at
+    date-sorted series, a region -> crops index, and a crop -> latest price per region index.
+    Exact-date, latest and range queries are a dict probe and a bisect instead of a scan over every row.
+    """
+
+    def __init__(self, rows: list[dict], model_factory=None):
+        self.rows = rows
+        self.model_factory = model_factory
+        self.skipped = 0
+        grouped: dict[tuple, list] = {}
+        for row in rows:
+            record = self._parse(row)
+            if record is None:
+                self.skipped += 1
+                continue
+            grouped.setdefault((normalize_key(record.region), normalize_key(record.crop)), []).append(record)
+
+        self._series = {key: _Series(records) for key, records in grouped.items()}
+        self._crops_by_region: dict[str, list[str]] = {}
+        for region_key, crop_key in sorted(self._series):
+            self._crops_by_region.setdefault(region_key, []).append(crop_key)
+        # Latest record of every region for each crop, highest price first
+        self._latest_by_crop: dict[str, list[PriceRecord]] = {}
+        for (region_key, crop_key), series in self._series.items():
+            self._latest_by_crop.setdefault(crop_key, []).append(series.records[-1])
+        for records in self._latest_by_crop.values():
+            records.sort(key=lambda record: (-record.price, normalize_key(record.region)))
+        self.record_count = len(rows) - self.skipped
+        if self.skipped:
+            print(f"WARNING - Skipped {self.skipped} unparseable market price rows.")
+
+    @staticmethod
+    def _parse(row: dict):
+        try:
+            return PriceRecord(
+                region=row["region"],
+                crop=row.get("crop_type", "Unknown"),
+                price_date=date.fromisoformat(row["date"]),
+                price=float(row.get("price_per_kg", 0.0)),
+                currency=row.get("currency", "ETB"),
+                source=row.get("source", "Sample JSON"),
+                row=row,
+            )
+        except (KeyError, ValueError, TypeError) as e:
+            print(f"WARNING - Could not parse market price data: {row} - {e}")
+            return None
+
+    def _series_for(self, region: str, crop: str = None) -> list:
+        region_key = normalize_key(region)
+        if crop:
+            series = self._series.get((region_key, normalize_key(crop)))
+            return [series] if series else []
+        return [self._series[(region_key, crop_key)] for crop_key in self._crops_by_region.get(region_key, ())]
+
+    def exact(self, region: str, crop: str = None, on: date = None) -> list[PriceRecord]:
+        """Prices for a region (optionally one crop) on a given date."""
+        results = []
+        for series in self._series_for(region, crop):
+            results.extend(series.between(on, on))
+        return results
+
+    def latest(self, region: str, crop: str = None, on_or_before: date = None) -> list[PriceRecord]:
+        """Most recent prices per crop in a region, optionally as of a date."""
+        results = []
+        for series in self._series_for(region, crop):
+            results.extend(series.latest(on_or_before))
+        return results
+
+    def range(self, region: str, crop: str = None, start: date = None, end: date = None) -> list[PriceRecord]:
+        """Prices between two dates (inclusive), ordered by crop then date."""
+        results = []
+        for series in self._series_for(region, crop):
+            results.extend(series.between(start, end))
+        return results
+
+    def latest_by_region(self, crop: str) -> list[PriceRecord]:
+        """The most recent price of a crop in every region that reports it, highest price first."""
+        return self._latest_by_crop.get(normalize_key(crop), [])
+
+    def series(self):
+        """Iterates ((region_key, crop_key), records sorted by date) for every indexed pair."""
+        for key, series in self._series.items():
+            yield key, series.records
+
+    def regions(self) -> list[str]:
+        return list(self._crops_by_region)
+
+    def models(self, records: list[PriceRecord]) -> list:
+        """Response models for records, built with `model_factory` once per record and reused."""
+        models = []
+        for record in records:
+            if record.model is None:
+                record.model = self.model_factory(record)
+            models.append(record.model)
+        return models
+
+    def __len__(self) -> int:
+        return self.record_count
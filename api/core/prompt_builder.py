@@ -0,0 +1,183 @@
+import os
+import re
+import threading
+
+# Rough token estimate without a tokenizer dependency: Latin text averages ~4 characters per token,
+# while Ge'ez (Amharic) syllables usually cost about one token each.
+_ASCII_CHARS_PER_TOKEN = 4
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?።])\s")
+
+SECTION_BUDGETS = {
+    "history": int(os.getenv("PROMPT_BUDGET_HISTORY_TOKENS", "400")),
+    "summary": int(os.getenv("PROMPT_BUDGET_SUMMARY_TOKENS", "150")),
+    "faqs": int(os.getenv("PROMPT_BUDGET_FAQ_TOKENS", "500")),
+    "profile": int(os.getenv("PROMPT_BUDGET_PROFILE_TOKENS", "100")),
+    "question": int(os.getenv("PROMPT_BUDGET_QUESTION_TOKENS", "300")),
+}
+# No single past answer may take more than this share of the history budget
+MAX_TURN_SHARE = 0.5
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ch.isascii())
+    return -(-ascii_chars // _ASCII_CHARS_PER_TOKEN) + (len(text) - ascii_chars)
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """Cuts text to roughly `budget` tokens at a word boundary, marking the cut with an ellipsis."""
+    if estimate_tokens(text) <= budget:
+        return text
+    if budget <= 0:
+        return ""
+    lo, hi = 0, len(text)
+    while lo < hi: # Longest prefix that fits
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) + 1 <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    cut = text[:lo]
+    if " " in cut:
+        cut = cut[:cut.rfind(" ")]
+    return cut.rstrip() + "…"
+
+
+def summarize_turn(turn: dict, max_tokens: int = 40) -> str:
+    """One-line extractive summary of a chat turn: the question and the first sentence of the answer."""
+    question = " ".join((turn.get("query_text") or "").split())
+    answer = " ".join((turn.get("response_text") or "").split())
+    first_sentence = _SENTENCE_END_RE.split(answer, maxsplit=1)[0] if answer else ""
+    return truncate_to_tokens(f"Asked: {question} -> {first_sentence}", max_tokens)
+
+
+def fold_into_summary(summary: str, turns: list[dict], budget: int = None) -> str:
+    """Appends summaries of `turns` to a rolling summary, dropping the oldest lines to stay within budget."""
+    budget = SECTION_BUDGETS["summary"] if budget is None else budget
+    lines = [line for line in (summary or "").split("\n") if line]
+    lines.extend(summarize_turn(turn) for turn in turns)
+    while lines and estimate_tokens("\n".join(lines)) > budget:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class BuiltPrompt:
+    def __init__(self, text: str, section_tokens: dict):
+        self.text = text
+        self.section_tokens = section_tokens
+        self.total_tokens = estimate_tokens(text)
+
+
+class PromptStats:
+    """Running totals of prompt sizes so they can be compared across deployments via /metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_tokens = 0
+        self.max_tokens = 0
+        self.section_totals: dict[str, int] = {}
+
+    def record(self, prompt: BuiltPrompt) -> None:
+        with self._lock:
+            self.count += 1
+            self.total_tokens += prompt.total_tokens
+            self.max_tokens = max(self.max_tokens, prompt.total_tokens)
+            for section, tokens in prompt.section_tokens.items():
+                self.section_totals[section] = self.section_totals.get(section, 0) + tokens
+
+    def stats(self) -> dict:
+        with self._lock:
+            if not self.count:
+                return {"prompts": 0}
+            return {
+                "prompts": self.count,
+                "avg_tokens": round(self.total_tokens / self.count, 1),
+                "max_tokens": self.max_tokens,
+                "avg_section_tokens": {
+                    section: round(total / self.count, 1) for section, total in sorted(self.section_totals.items())
+                },
+            }
+
+
+prompt_stats = PromptStats()
+
+
+def _history_section(history: list[dict], budget: int):
+    """
+    Most recent turns verbatim, newest first until the budget is spent.
+    Returns (section_text, overflow_turns) where overflow_turns did not fit and should be summarized.
+    """
+    per_turn = max(1, int(budget * MAX_TURN_SHARE))
+    kept, used = [], 0
+    for index in range(len(history) - 1, -1, -1):
+        turn = history[index]
+        answer = truncate_to_tokens(turn.get("response_text") or "", per_turn)
+        block = f"User: {turn.get('query_text', '')}\nAssistant: {answer}\n"
+        cost = estimate_tokens(block)
+        if used + cost > budget:
+            return "".join(reversed(kept)), history[:index + 1]
+        kept.append(block)
+        used += cost
+    return "".join(reversed(kept)), []
+
+
+def build_prompt(
+    language_code: str,
+    question: str,
+    history: list[dict] = None,
+    faqs: list[dict] = None,
+    profile: dict = None,
+    summary: str = "",
+    notes: list[str] = (),
+    budgets: dict = None,
+) -> BuiltPrompt:
+    """
+    Assembles the assistant prompt with a token budget per section:
+    rolling summary of older turns, recent history, FAQ context, farm profile and the question.
+    `notes` are short messages telling the model that a context source was unavailable.
+    """
+    budgets = {**SECTION_BUDGETS, **(budgets or {})}
+    sections = {}
+
+    history_text, overflow = _history_section(history or [], budgets["history"])
+    summary_text = fold_into_summary(summary, overflow, budgets["summary"]) if overflow else (summary or "")
+    summary_text = truncate_to_tokens(summary_text, budgets["summary"])
+    if summary_text:
+        sections["summary"] = f"\n\n--- Earlier Conversation (summary) ---\n{summary_text}\n--------------------------\n\n"
+    if history_text:
+        sections["history"] = f"\n\n--- Conversation History ---\n{history_text}--------------------------\n\n"
+
+    if faqs:
+        faq_budget = max(1, budgets["faqs"] // len(faqs))
+        faq_text = ""
+        for i, faq in enumerate(faqs):
+            entry = f"Q{i+1}: {faq['question']}\nA{i+1}: {faq['answer']}"
+            faq_text += truncate_to_tokens(entry, faq_budget) + "\n"
+        sections["faqs"] = f"\n\n--- Relevant FAQs ---\n{faq_text}---------------------\n\n"
+
+    if profile:
+        profile_text = (
+            f"Region: {profile.get('region', 'N/A')}\n"
+            f"Crop Focus: {profile.get('crop_focus', 'N/A')}\n"
+            f"Land Size: {profile.get('land_size', 'N/A')}"
+        )
+        sections["profile"] = f"\n\n--- Farm Profile ---\n{truncate_to_tokens(profile_text, budgets['profile'])}\n--------------------\n\n"
+
+    notes_text = "".join(f"\n\n({note})\n\n" for note in notes if note)
+    question_text = truncate_to_tokens(question, budgets["question"])
+    text = (
+        f"You are an expert agricultural assistant for Ethiopian farmers. "
+        f"Your goal is to provide accurate, helpful, and concise advice. "
+        f"Please respond in {language_code}, as that is the user's preferred language.\n\n"
+        f"{sections.get('summary', '')}"
+        f"{sections.get('history', '')}"
+        f"{sections.get('faqs', '')}"
+        f"{sections.get('profile', '')}"
+        f"{notes_text}"
+        f"User's current question: {question_text}"
+    )
+    section_tokens = {name: estimate_tokens(section) for name, section in sections.items()}
+    section_tokens["question"] = estimate_tokens(question_text)
+    return BuiltPrompt(text, section_tokens)
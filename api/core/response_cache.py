@@ -0,0 +1,175 @@
+import os
+import re
+import time
+import json
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+
+from .ttl_cache import TTLCache, MISSING
+from .concurrency import run_blocking
+
+DEFAULT_SQLITE_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "cache", "response_cache.sqlite3")
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """Canonical form of a question for cache keys: NFKC, lowercase, no punctuation, single spaces."""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = _PUNCTUATION_RE.sub(" ", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def faq_id(faq: dict) -> str:
+    """Stable identifier of an FAQ entry (its explicit id, or a hash of its question)."""
+    if faq.get("id") is not None:
+        return str(faq["id"])
+    return hashlib.sha1(faq.get("question", "").encode("utf-8")).hexdigest()[:12]
+
+
+def make_response_key(question: str, language_code: str, region=None, crop=None, faq_ids=()) -> str:
+    """
+    Cache key for a model answer. Two requests share an answer only if they ask the same normalized
+    question, in the same language, for the same region/crop, with the same FAQ context.
+    """
+    parts = {
+        "q": normalize_question(question),
+        "lang": (language_code or "").lower(),
+        "region": (region or "").strip().lower(),
+        "crop": (crop or "").strip().lower(),
+        "faqs": sorted(faq_ids),
+    }
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class MemoryResponseBackend:
+    """Per-process LRU/TTL store."""
+
+    blocking = False
+
+    def __init__(self, max_entries: int, ttl: float):
+        self._cache = TTLCache(maxsize=max_entries, ttl=ttl)
+
+    def get(self, key: str):
+        value = self._cache.get(key)
+        return None if value is MISSING else value
+
+    def set(self, key: str, value: str) -> None:
+        self._cache.set(key, value)
+
+    def size(self) -> int:
+        return len(self._cache)
+
+
+class SqliteResponseBackend:
+    """
+    Local SQLite store shared by all workers on a host and kept across restarts.
+    Entries expire after `ttl` seconds; beyond `max_entries` the least recently used are evicted.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, now + self.ttl, now),
+            )
+            self._writes_since_evict += 1
+            # Evicting on every write would turn each set into a table scan; batch it instead
+            if self._writes_since_evict >= 100:
+                self._writes_since_evict = 0
+                self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    " SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class ResponseCache:
+    """Model-answer cache in front of a pluggable backend, with hit/miss counters."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str):
+        if self.backend.blocking:
+            value = await run_blocking(self.backend.get, key)
+        else:
+            value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: str) -> None:
+        if self.backend.blocking:
+            await run_blocking(self.backend.set, key, value)
+        else:
+            self.backend.set(key, value)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def create_response_cache():
+    """Builds the cache selected by RESPONSE_CACHE_BACKEND ('memory', 'sqlite' or 'off')."""
+    backend_name = os.getenv("RESPONSE_CACHE_BACKEND", "memory").lower()
+    if backend_name == "off":
+        return None
+    max_entries = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+    ttl = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", str(3 * 24 * 3600)))
+    if backend_name == "sqlite":
+        path = os.getenv("RESPONSE_CACHE_SQLITE_PATH", DEFAULT_SQLITE_PATH)
+        try:
+            return ResponseCache(SqliteResponseBackend(path, max_entries, ttl))
+        except Exception as e:
+            print(f"WARNING - Could not open SQLite response cache at {path}, using memory: {e}")
+    return ResponseCache(MemoryResponseBackend(max_entries, ttl))
+
+
+response_cache = create_response_cache()
@@ -0,0 +1,191 @@
+"""
+Short-lived session state for the USSD and IVR channels.
+
+Gateways send every hop of a session as a separate request, often to a different worker, and most
+sessions are abandoned mid-menu without an explicit end. Both backends therefore expire sessions a
+fixed time after their last hop and stay bounded:
+
+- MemorySessionStore: per-process, with a min-heap of expiry times so expired sessions are evicted
+  in O(log n) without scanning. Only correct with a single worker.
+- SqliteSessionStore: a WAL-mode SQLite file shared by all workers on the host. Reads and writes are
+  local and well under a millisecond, so they are made inline rather than through run_blocking.
+"""
+import os
+import json
+import time
+import heapq
+import sqlite3
+import threading
+
+DEFAULT_SQLITE_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "cache", "sessions.sqlite3")
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "300"))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "100000"))
+# Several workers cannot share in-process sessions, so default to the shared backend when they are configured
+SESSION_STORE_BACKEND = os.getenv(
+    "SESSION_STORE_BACKEND", "sqlite" if int(os.getenv("WEB_CONCURRENCY", "1")) > 1 else "memory"
+)
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", DEFAULT_SQLITE_PATH)
+
+
+class _Entry:
+    __slots__ = ("expires_at", "state")
+
+    def __init__(self, expires_at: float, state: dict):
+        self.expires_at = expires_at
+        self.state = state
+
+
+class MemorySessionStore:
+    """
+    Sessions in a dict plus a heap of (expires_at, session_id). Renewing a session pushes a new heap
+    item; the stale one is skipped when it reaches the top. When `max_sessions` is reached the
+    session closest to expiry is evicted.
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL_SECONDS, max_sessions: int = SESSION_MAX_ENTRIES, timer=time.monotonic):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._timer = timer
+        self._entries: dict[str, _Entry] = {}
+        self._heap: list = []
+        self._lock = threading.Lock()
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _purge(self, now: float) -> None:
+        heap = self._heap
+        while heap and (heap[0][0] <= now or len(self._entries) > self.max_sessions):
+            expires_at, session_id = heapq.heappop(heap)
+            entry = self._entries.get(session_id)
+            if entry is None or entry.expires_at != expires_at:
+                continue # Renewed or deleted since this item was pushed
+            del self._entries[session_id]
+            if expires_at <= now:
+                self.expired += 1
+            else:
+                self.evicted += 1
+        # Renewals leave dead heap items behind; rebuild once they dominate the heap
+        if len(heap) > 2 * len(self._entries) + 64:
+            self._heap = [(entry.expires_at, session_id) for session_id, entry in self._entries.items()]
+            heapq.heapify(self._heap)
+
+    def get(self, session_id: str):
+        """The session's state (a copy), or None if it does not exist or has expired."""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            if entry.expires_at <= self._timer():
+                del self._entries[session_id]
+                self.expired += 1
+                return None
+            return dict(entry.state)
+
+    def set(self, session_id: str, state: dict) -> None:
+        """Stores the state and restarts the session's TTL."""
+        with self._lock:
+            now = self._timer()
+            expires_at = now + self.ttl
+            self._entries[session_id] = _Entry(expires_at, dict(state))
+            heapq.heappush(self._heap, (expires_at, session_id))
+            self._purge(now)
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "sessions": len(self._entries), "expired": self.expired, "evicted": self.evicted}
+
+
+class SqliteSessionStore:
+    """
+    Sessions in a SQLite table (one row per namespace and session id) in WAL mode, so readers in
+    other workers never block on a writer. Expired rows are ignored on read; every `purge_every`
+    writes they are deleted in bulk, along with the oldest sessions beyond `max_sessions`.
+    """
+
+    def __init__(self, path: str, namespace: str = "default", ttl: float = SESSION_TTL_SECONDS,
+                 max_sessions: int = SESSION_MAX_ENTRIES, purge_every: int = 500, timer=time.time):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.purge_every = purge_every
+        self._timer = timer # Wall clock: expiry times are compared across processes
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.purged = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL") # Sessions are disposable; skip the fsync per commit
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " namespace TEXT NOT NULL, session_id TEXT NOT NULL, state TEXT NOT NULL, expires_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, session_id)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions(expires_at)")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM sessions WHERE namespace = ? AND expires_at > ?", (self.namespace, self._timer())
+            ).fetchone()[0]
+
+    def get(self, session_id: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM sessions WHERE namespace = ? AND session_id = ? AND expires_at > ?",
+                (self.namespace, session_id, self._timer()),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, session_id: str, state: dict) -> None:
+        now = self._timer()
+        value = json.dumps(state, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (namespace, session_id, state, expires_at) VALUES (?, ?, ?, ?)",
+                (self.namespace, session_id, value, now + self.ttl),
+            )
+            self._writes += 1
+            # Purging on every write would add a scan to each hop; batch it instead
+            if self._writes % self.purge_every == 0:
+                self._purge(now)
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE namespace = ? AND session_id = ?", (self.namespace, session_id))
+
+    def purge(self) -> int:
+        """Deletes expired and over-limit sessions in this namespace. Returns how many were removed."""
+        with self._lock:
+            return self._purge(self._timer())
+
+    def _purge(self, now: float) -> int:
+        removed = self._conn.execute(
+            "DELETE FROM sessions WHERE namespace = ? AND expires_at <= ?", (self.namespace, now)
+        ).rowcount
+        removed += self._conn.execute(
+            "DELETE FROM sessions WHERE namespace = ? AND session_id IN ("
+            " SELECT session_id FROM sessions WHERE namespace = ? ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.max_sessions),
+        ).rowcount
+        self.purged += removed
+        return removed
+
+    def stats(self) -> dict:
+        return {"backend": "sqlite", "sessions": len(self), "purged": self.purged}
+
+
+def create_session_store(namespace: str, ttl: float = SESSION_TTL_SECONDS, backend: str = SESSION_STORE_BACKEND):
+    """A session store for one channel, using SESSION_STORE_BACKEND ('memory' or 'sqlite')."""
+    if backend.lower() == "sqlite":
+        try:
+            return SqliteSessionStore(SESSION_STORE_PATH, namespace=namespace, ttl=ttl)
+        except Exception as e:
+            print(f"WARNING - Could not open SQLite session store at {SESSION_STORE_PATH}, using memory: {e}")
+    return MemorySessionStore(ttl=ttl)
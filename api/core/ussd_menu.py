@@ -0,0 +1,285 @@
+"""
+Declarative USSD menu, compiled once at import into a transition table with pre-rendered screens.
+
+MENU maps each step to its transitions: `inputs` for exact choices, `otherwise` for anything else
+(free text or an invalid choice). Every step except the language and main menus also accepts "0"
+to go back to the main menu. A transition names the next step (None ends the session), the screen
+to show, and optionally the language it selects, the session field the input is saved as, or an
+action that renders a dynamic result. Each hop is then two dict lookups, and static screens come
+with their JSON-encoded message and IVR prompt already built.
+"""
+import re
+import json
+from typing import NamedTuple, Optional
+
+from .latency_budget import LatencyBudget, BudgetExceeded
+
+LANGUAGES = {"1": "en", "2": "am"}
+DEFAULT_LANGUAGE = "en"
+START_STEP = "lang_selection"
+
+MENU_TEXT = {
+    "en": {
+        "welcome": "CON Welcome to Farmer's Companion! Please select your language:\n1. English\n2. አማርኛ (Amharic)",
+        "main": "CON Main Menu:\n1. Crop Info\n2. Pest Help\n3. Market Prices\n0. Exit",
+        "crop_info_prompt": "CON Crop Info selected. Enter your region:\n0. Back",
+        "crop_type_prompt": "CON Enter crop type (e.g., maize, teff):\n0. Back",
+        "crop_result": "END Crop: {crop}, Region: {region} - Advisory: Use disease-resistant seeds.", # Placeholder
+        "pest_help_prompt": "CON Pest Help selected. Describe the issue or send photo later:\n0. Back",
+        "pest_result": "END Pest for {crop}: Monitor for symptoms. Consult local extension for specific treatment.", # Placeholder
+        "market_prices_prompt": "CON Market Prices selected. Enter crop name:\n0. Back",
+        "market_price_result": "END {crop} price per kg:",
+        "market_price_not_found": "END {crop} price: Not found",
+        "invalid_input": "CON Invalid input. Please try again.",
+        "busy": "END Service is busy. Please try again in a moment.",
+        "question_followup": "CON You can ask another question, or hang up.",
+        "question_not_heard": "CON Sorry, we did not hear a question. Please ask again.",
+        "question_busy": "CON Sorry, the answer is not ready yet. Please ask again in a moment.",
+        "thank_you": "END Thank you for using Farmer's Companion!"
+    },
+    "am": {
+        "welcome": "CON እንኳን ደህና መጡ ወደ ገበሬ ባልደረባ! ቋንቋ ይምረጡ:\n1. English\n2. አማርኛ",
+        "main": "CON ዋና ምናሌ:\n1. የእርሻ መረጃ\n2. የተባባሪ መረጃ\n3. የገበያ ዋጋ\n0. ውጣ",
+        "crop_info_prompt": "CON የእርሻ መረጃ ተመርጧል። ክልልዎን ያስገቡ:\n0. ተመለስ",
+        "crop_type_prompt": "CON የእርሻ አይነት ያስገቡ (ለምሳሌ: በቆሎ, ጤፍ):\n0. ተመለስ",
+        "crop_result": "END ሰብል: {crop}, ክልል: {region} - ምክር: በሽታን የሚቋቋሙ ዘሮችን ይጠቀሙ።", # Placeholder
+        "pest_help_prompt": "CON የተባባሪ መረጃ ተመርጧል። ችግሩን ይግለጹ ወይም ፎቶ ይላኩ:\n0. ተመለስ",
+        "pest_result": "END ለ{crop} ተባይ: ምልክቶችን ይከታተሉ። ለተለየ ህክምና የአካባቢውን ባለሙያ ያማክሩ።", # Placeholder
+        "market_prices_prompt": "CON የገበያ ዋጋ ተመርጧል። የእርሻ ስም ያስገቡ:\n0. ተመለስ",
+        "market_price_result": "END የ{crop} ዋጋ በኪሎ:",
+        "market_price_not_found": "END የ{crop} ዋጋ አልተገኘም።",
+        "invalid_input": "CON የተሳሳተ ግብዓት። እባክዎ ደግመው ይሞክሩ።",
+        "busy": "END አገልግሎቱ ተጨናንቋል። እባክዎ ትንሽ ቆይተው ይሞክሩ።",
+        "question_followup": "CON ሌላ ጥያቄ መጠየቅ ወይም ስልኩን መዝጋት ይችላሉ።",
+        "question_not_heard": "CON ይቅርታ፣ ጥያቄዎን አልሰማንም። እባክዎ እንደገና ይጠይቁ።",
+        "question_busy": "CON ይቅርታ፣ መልሱ ገና አልተዘጋጀም። እባክዎ ትንሽ ቆይተው እንደገና ይጠይቁ።",
+        "thank_you": "END አመሰግናለሁ ወደ ገበሬ ባልደረባ ስለ መጡ!"
+    }
+}
+
+# How a numbered menu line ("1. Crop Info") is read out on a voice call
+IVR_OPTION_TEMPLATE = {
+    "en": "Press {key} for {label}.",
+    "am": "{label}፦ {key} ይጫኑ።",
+}
+
+
+class Transition(NamedTuple):
+    next_step: Optional[str] # None ends the session
+    screen: str
+    lang: Optional[str] = None # Language selected by this input
+    capture: Optional[str] = None # Session field the raw input is stored as
+    action: Optional[str] = None # Name of a dynamic action that renders the message instead of `screen`
+
+
+MENU = {
+    "lang_selection": {
+        "inputs": {key: Transition("main_menu", "main", lang=lang) for key, lang in LANGUAGES.items()},
+        "otherwise": Transition("lang_selection", "welcome"),
+    },
+    "main_menu": {
+        "inputs": {
+            "1": Transition("crop_info_region_input", "crop_info_prompt"),
+            "2": Transition("pest_help_crop_input", "pest_help_prompt"),
+            "3": Transition("market_prices_crop_input", "market_prices_prompt"),
+            "0": Transition(None, "thank_you"),
+        },
+        "otherwise": Transition("main_menu", "invalid_input"),
+    },
+    "crop_info_region_input": {"otherwise": Transition("crop_info_type_input", "crop_type_prompt", capture="region")},
+    "crop_info_type_input": {"otherwise": Transition(None, "crop_result", capture="crop", action="crop_result")},
+    "pest_help_crop_input": {"otherwise": Transition("pest_help_desc_input", "pest_help_prompt", capture="crop")},
+    "pest_help_desc_input": {"otherwise": Transition(None, "pest_result", action="pest_result")},
+    "market_prices_crop_input": {"otherwise": Transition(None, "invalid_input", action="market_prices")},
+}
+# Steps where "0" is not "back to the main menu"
+NO_BACK_STEPS = {"lang_selection", "main_menu"}
+BACK = Transition("main_menu", "main")
+
+
+class Screen:
+    """One rendered screen: the USSD text, its JSON-encoded form, and the IVR prompt."""
+
+    __slots__ = ("text", "json", "ends", "ivr_text")
+
+    def __init__(self, text: str, lang: str):
+        self.text = text
+        self.json = json.dumps(text, ensure_ascii=False).encode("utf-8")
+        self.ends = text.startswith("END ")
+        self.ivr_text = render_ivr_text(text, lang)
+
+
+class CompiledStep:
+    __slots__ = ("name", "inputs", "otherwise", "free_text")
+
+    def __init__(self, name: str, inputs: dict, otherwise: Transition):
+        self.name = name
+        self.inputs = inputs
+        self.otherwise = otherwise
+        # Steps that accept arbitrary text need speech input on a voice call rather than a keypress
+        self.free_text = otherwise.capture is not None or otherwise.action is not None
+
+
+class Hop(NamedTuple):
+    message: str
+    screen: Optional[Screen] # The pre-rendered screen, None for dynamic results
+    session: Optional[dict] # New session state; None when the session ended
+    lang: str
+    changed: bool # Whether the session state must be written back
+
+    @property
+    def message_json(self) -> bytes:
+        if self.screen is not None:
+            return self.screen.json
+        return json.dumps(self.message, ensure_ascii=False).encode("utf-8")
+
+    @property
+    def ivr_text(self) -> str:
+        return self.screen.ivr_text if self.screen is not None else render_ivr_text(self.message, self.lang)
+
+
+_OPTION_LINE = re.compile(r"^(\d)\.\s*(.+)$")
+
+
+def render_ivr_text(text: str, lang: str) -> str:
+    """Turns a USSD screen into a spoken prompt: drops the CON/END prefix and reads out menu options."""
+    body = text[4:] if text[:4] in ("CON ", "END ") else text
+    template = IVR_OPTION_TEMPLATE.get(lang, IVR_OPTION_TEMPLATE[DEFAULT_LANGUAGE])
+    lines = []
+    for line in body.split("\n"):
+        match = _OPTION_LINE.match(line.strip())
+        lines.append(template.format(key=match.group(1), label=match.group(2)) if match else line.strip())
+    return " ".join(line for line in lines if line)
+
+
+class CompiledMenu:
+    """
+    The interpreter for a compiled MENU. `actions` maps action names to callables
+    (lang, session, user_input) -> message, for screens that depend on the input.
+    """
+
+    def __init__(self, menu: dict, texts: dict, actions: dict):
+        missing = {t.action for step in menu.values() for t in _transitions(step) if t.action} - set(actions)
+        if missing:
+            raise ValueError(f"USSD menu actions without an implementation: {sorted(missing)}")
+        self.screens = {lang: {key: Screen(text, lang) for key, text in screens.items()} for lang, screens in texts.items()}
+        self.steps = {}
+        for name, spec in menu.items():
+            inputs = dict(spec.get("inputs", {}))
+            if name not in NO_BACK_STEPS:
+                inputs.setdefault("0", BACK)
+            for transition in list(inputs.values()) + [spec["otherwise"]]:
+                if transition.next_step is not None and transition.next_step not in menu:
+                    raise ValueError(f"USSD step '{name}' leads to unknown step '{transition.next_step}'")
+                for screens in self.screens.values():
+                    if transition.screen not in screens:
+                        raise ValueError(f"USSD step '{name}' uses unknown screen '{transition.screen}'")
+            self.steps[name] = CompiledStep(name, inputs, spec["otherwise"])
+        self.actions = actions
+
+    def screen(self, lang: str, key: str) -> Screen:
+        return self.screens.get(lang, self.screens[DEFAULT_LANGUAGE])[key]
+
+    def step_of(self, session: Optional[dict]) -> CompiledStep:
+        return self.steps.get((session or {}).get("step", START_STEP), self.steps[START_STEP])
+
+    def _resolve(self, session: Optional[dict], user_input: str):
+        session = session or {"step": START_STEP}
+        step = self.steps.get(session.get("step"))
+        lang = session.get("lang")
+        if step is None or (lang is None and step.name != START_STEP):
+            # Unknown or language-less state: start over
+            step, session, lang = self.steps[START_STEP], {"step": START_STEP}, None
+
+        transition = step.inputs.get(user_input) or step.otherwise
+        lang = transition.lang or lang
+        if transition.capture:
+            session = {**session, transition.capture: user_input}
+        return step, transition, session, lang
+
+    def _finish(self, step: CompiledStep, transition: Transition, session: dict, lang: Optional[str], message: str, screen) -> Hop:
+        screen_lang = lang or DEFAULT_LANGUAGE
+        if transition.next_step is None:
+            return Hop(message, screen, None, screen_lang, True)
+        if transition.next_step == step.name and not transition.capture and transition.lang is None:
+            # Re-prompt on the same step: nothing to write (a new session is not created yet)
+            return Hop(message, screen, session, screen_lang, False)
+        new_session = {**session, "step": transition.next_step}
+        if lang:
+            new_session["lang"] = lang
+        if transition.next_step == "main_menu":
+            # Inputs captured in a sub-flow do not carry over to the next one
+            new_session = {"step": "main_menu", "lang": lang}
+        return Hop(message, screen, new_session, screen_lang, True)
+
+    def _run_inline(self, transition: Transition, lang: str, session: dict, user_input: str):
+        """Runs an action directly; returns (message, screen) with its own screen if it fails."""
+        try:
+            return self.actions[transition.action](lang, session, user_input), None
+        except Exception as e:
+            print(f"ERROR - USSD action '{transition.action}' failed: {e}")
+            screen = self.screen(lang, transition.screen)
+            return screen.text, screen
+
+    def fallback_key(self, lang: str, session: dict, user_input: str) -> tuple:
+        """Identifies an action's answer for latency-budget fallbacks: language, input and captured fields."""
+        captured = tuple(sorted((k, v) for k, v in session.items() if k not in ("step", "lang")))
+        return (lang, user_input.casefold(), captured)
+
+    def hop(self, session: Optional[dict], user_input: str) -> Hop:
+        """Applies one input to the session state (None for a new session) and returns the result."""
+        step, transition, session, lang = self._resolve(session, user_input)
+        screen_lang = lang or DEFAULT_LANGUAGE
+        if transition.action:
+            message, screen = self._run_inline(transition, screen_lang, session, user_input)
+        else:
+            screen = self.screen(screen_lang, transition.screen)
+            message = screen.text
+        return self._finish(step, transition, session, lang, message, screen)
+
+    async def hop_within(self, session: Optional[dict], user_input: str, budget: LatencyBudget) -> Hop:
+        """
+        Like hop(), but actions marked with slow_action() run within `budget`. Past the deadline
+        the last answer for the same input is served, or the "busy" screen if there is none.
+        Other actions only format strings and run inline, so they never queue behind slow ones.
+        """
+        step, transition, session, lang = self._resolve(session, user_input)
+        screen_lang = lang or DEFAULT_LANGUAGE
+        action = self.actions.get(transition.action) if transition.action else None
+        if action is None:
+            screen = self.screen(screen_lang, transition.screen)
+            return self._finish(step, transition, session, lang, screen.text, screen)
+        if not getattr(action, "budgeted", False):
+            message, screen = self._run_inline(transition, screen_lang, session, user_input)
+            return self._finish(step, transition, session, lang, message, screen)
+
+        screen = None
+        try:
+            message = await budget.call(
+                f"action:{transition.action}", action, screen_lang, session, user_input,
+                fallback_key=self.fallback_key(screen_lang, session, user_input),
+            )
+        except BudgetExceeded as e:
+            # Timed out with nothing cached: tell the caller to retry; a failing action shows its own screen
+            screen = self.screen(screen_lang, transition.screen if e.__cause__ is not None else "busy")
+            message = screen.text
+        return self._finish(step, transition, session, lang, message, screen)
+
+
+def _transitions(spec: dict):
+    yield from spec.get("inputs", {}).values()
+    yield spec["otherwise"]
+
+
+def slow_action(func):
+    """Marks an action that reads a dependency which can be slow (data load, search, model call)."""
+    func.budgeted = True
+    return func
+
+
+def format_result(key: str, **fields):
+    """An action that fills a result template from the session's captured fields."""
+    def _action(lang: str, session: dict, user_input: str) -> str:
+        values = {name: session.get(field, "Unknown") for name, field in fields.items()}
+        return MENU_TEXT.get(lang, MENU_TEXT[DEFAULT_LANGUAGE])[key].format(**values)
+    return _action
@@ -0,0 +1,166 @@
+import os
+import time
+import hashlib
+import threading
+
+
+def file_fingerprint(*paths: str) -> tuple:
+    """Cheap change detector for files: (path, mtime_ns, size) per path; missing files count as None."""
+    fingerprint = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            fingerprint.append((path, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            fingerprint.append((path, None, None))
+    return tuple(fingerprint)
+
+
+def hash_bytes(*chunks: bytes) -> str:
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Snapshot:
+    """One immutable generation of cached data."""
+
+    __slots__ = ("data", "version", "content_hash", "fingerprint", "loaded_at", "load_duration")
+
+    def __init__(self, data, version: int, content_hash: str, fingerprint, load_duration: float):
+        self.data = data
+        self.version = version
+        self.content_hash = content_hash
+        self.fingerprint = fingerprint
+        self.loaded_at = time.time()
+        self.load_duration = load_duration
+
+
+class VersionedCache:
+    """
+    Holds the current Snapshot of data loaded from disk and replaces it when the source changes.
+
+    `load()` returns (data, content_hash) and does all the expensive work (parsing, building indexes);
+    `fingerprint()` is a cheap stat-based check. A background thread polls the fingerprint and, when it
+    changes, loads the new data off the request path and swaps the snapshot in with a single attribute
+    assignment, so readers always see either the old or the new generation, never a mix.
+    If the content hash is unchanged (e.g. the file was touched) the version is not bumped.
+    A failed reload keeps serving the previous version; if the very first load fails, `empty()`
+    (when given) is served as version 0 until the source changes.
+    `on_reload(previous_data, new_data)`, when given, runs before a new version becomes visible
+    (e.g. to diff it against the previous one). Functions registered with `add_listener(func)` run
+    as `func(new_data)` right after each new version is swapped in, in the thread that loaded it,
+    so data derived from a generation is rebuilt off the request path.
+    """
+
+    def __init__(self, name: str, load, fingerprint, poll_interval: float = 5.0, empty=None, on_reload=None):
+        self.name = name
+        self._load = load
+        self._fingerprint = fingerprint
+        self._empty = empty
+        self._on_reload = on_reload
+        self._listeners = []
+        self.poll_interval = poll_interval
+        self._snapshot = None
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.reloads = 0
+        self.failed_reloads = 0
+
+    @property
+    def snapshot(self) -> Snapshot:
+        if self._snapshot is None:
+            self.refresh(force=True)
+        return self._snapshot
+
+    def get(self):
+        """The current data. Callers should read it once per request and use that object throughout."""
+        return self.snapshot.data
+
+    def refresh(self, force: bool = False) -> bool:
+        """Reloads if the source changed (or `force`). Returns True when a new version was swapped in."""
+        with self._reload_lock:
+            current = self._snapshot
+            fingerprint = None
+            started = time.perf_counter()
+            try:
+                fingerprint = self._fingerprint()
+                if not force and current is not None and fingerprint == current.fingerprint:
+                    return False
+                started = time.perf_counter()
+                data, content_hash = self._load()
+            except Exception as e:
+                self.failed_reloads += 1
+                print(f"ERROR - Reloading {self.name} failed, keeping version {current.version if current else 0}: {e}")
+                if current is None:
+                    if self._empty is None:
+                        raise
+                    self._snapshot = Snapshot(self._empty(), 0, "", fingerprint, 0.0)
+                return False
+            load_duration = time.perf_counter() - started
+            if current is not None and content_hash == current.content_hash:
+                # Same content: remember the new fingerprint so it is not re-read on every poll
+                self._snapshot = Snapshot(current.data, current.version, content_hash, fingerprint, current.load_duration)
+                return False
+            version = current.version + 1 if current is not None else 1
+            if self._on_reload is not None and current is not None:
+                try:
+                    self._on_reload(current.data, data)
+                except Exception as e:
+                    print(f"WARNING - {self.name} on_reload hook failed: {e}")
+            self._snapshot = Snapshot(data, version, content_hash, fingerprint, load_duration)
+            self.reloads += 1
+            print(f"DEBUG - {self.name} version {version} loaded in {load_duration * 1000:.1f}ms.")
+            for listener in self._listeners:
+                self._notify(listener, data)
+            return True
+
+    def add_listener(self, func) -> None:
+        """Calls `func(data)` for every new version, starting with the current one if it is loaded."""
+        with self._reload_lock:
+            self._listeners.append(func)
+            if self._snapshot is not None:
+                self._notify(func, self._snapshot.data)
+
+    def _notify(self, listener, data) -> None:
+        try:
+            listener(data)
+        except Exception as e:
+            print(f"WARNING - {self.name} reload listener failed: {e}")
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"ERROR - {self.name} watcher: {e}")
+
+    def start_watching(self) -> None:
+        """Starts the polling thread (idempotent)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name=f"{self.name}-watcher", daemon=True)
+        self._thread.start()
+
+    def stop_watching(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval + 1)
+            self._thread = None
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {"version": 0, "reloads": self.reloads, "failed_reloads": self.failed_reloads}
+        return {
+            "version": snapshot.version,
+            "content_hash": snapshot.content_hash[:16],
+            "loaded_at": snapshot.loaded_at,
+            "load_duration_ms": round(snapshot.load_duration * 1000, 2),
+            "reloads": self.reloads,
+            "failed_reloads": self.failed_reloads,
+            "watching": self._thread is not None and self._thread.is_alive(),
+        }
@@ -0,0 +1,298 @@
+import os
+import re
+import glob
+import json
+import asyncio
+import threading
+
+from .concurrency import run_blocking
+from .supabase_client import get_supabase_client
+
+DEFAULT_SPILL_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "spool", "write_behind.jsonl")
+# SQLSTATE classes a retry cannot fix: data exceptions (22), constraint violations (23), bad SQL/columns (42)
+PERMANENT_SQLSTATE_CLASSES = ("22", "23", "42")
+
+
+def is_permanent_error(error: Exception) -> bool:
+    """Whether a write failed because of the rows themselves (retrying them would fail again)."""
+    code = str(getattr(error, "code", "") or "")
+    if len(code) == 5 and code[:2] in PERMANENT_SQLSTATE_CLASSES:
+        return True
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return isinstance(status, int) and 400 <= status < 500 and status not in (408, 429)
+
+
+class WriteBehindQueue:
+    """
+    Write-behind pipeline for rows that do not need to be persisted before the response is sent
+    (chat_history logs, feedback, cache rows).
+
+    Handlers call enqueue(), which never waits. A background task drains the bounded asyncio
+    queue and groups rows per table into multi-row inserts (or upserts), flushing when a batch is
+    full or `flush_interval` seconds have passed. Batches that fail to write, and rows that arrive
+    while the queue is full, are appended to a local JSONL spill file that is replayed on startup.
+    A batch rejected because of its data is retried row by row; rows that are rejected on their
+    own go to a dead-letter file instead, so they cannot block their batch-mates on every replay.
+
+    Each process spills to its own file (`<spill_path stem>.<pid>.jsonl`), so workers never
+    interleave writes; on startup the files of processes that are no longer running are replayed,
+    and so is a file with this process's own pid that this run has not written to (a restarted
+    container usually gets the same pid as the run that left it).
+    """
+
+    def __init__(
+        self,
+        client_getter=get_supabase_client,
+        max_queue: int = 10000,
+        batch_size: int = 200,
+        flush_interval: float = 1.0,
+        spill_path: str = DEFAULT_SPILL_PATH,
+    ):
+        self._client_getter = client_getter
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self._queue = None
+        self._loop = None
+        self._worker = None
+        self._spill_lock = threading.Lock()
+        self._spilled = False # Whether this run has written to its own spill file
+        self._counters_lock = threading.Lock()
+        self._counters = {
+            "enqueued": 0,
+            "flushed_rows": 0,
+            "flushed_batches": 0,
+            "failed_batches": 0,
+            "spilled_rows": 0,
+            "replayed_rows": 0,
+            "row_retries": 0,
+            "dead_lettered_rows": 0,
+        }
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._counters_lock:
+            self._counters[name] += amount
+
+    def _ensure_worker(self) -> None:
+        """Binds the queue and worker task to the running event loop (re-binding if the loop changed)."""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._worker is not None and not self._worker.done():
+            return
+        pending = []
+        if self._queue is not None and self._loop is not loop:
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+        if self._queue is None or self._loop is not loop:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._loop = loop
+        for item in pending:
+            self._queue.put_nowait(item)
+        self._worker = loop.create_task(self._run())
+
+    def enqueue(self, table: str, row: dict, on_conflict: str = None) -> None:
+        """
+        Schedules a row for insertion (or upsert when `on_conflict` is given). Must be called from
+        the event loop. If the queue is full the row goes straight to the spill file instead.
+        """
+        self._ensure_worker()
+        item = (table, on_conflict, row)
+        self._count("enqueued")
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            print(f"WARNING - Write-behind queue full, spilling {table} row to disk.")
+            self._spill([item])
+
+    async def start(self) -> None:
+        """Starts the worker and replays rows spilled by a previous run."""
+        self._ensure_worker()
+        items = await run_blocking(self._take_spilled)
+        if items:
+            print(f"DEBUG - Replaying {len(items)} spilled write-behind rows.")
+            self._count("replayed_rows", len(items))
+            for i in range(0, len(items), self.batch_size):
+                await self._flush(items[i:i + self.batch_size])
+
+    async def stop(self) -> None:
+        """Stops the worker and flushes whatever is still queued (spilling it if the write fails)."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        remaining = []
+        while self._queue is not None and not self._queue.empty():
+            remaining.append(self._queue.get_nowait())
+        for i in range(0, len(remaining), self.batch_size):
+            await self._flush(remaining[i:i + self.batch_size])
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                print(f"ERROR - Write-behind flush failed unexpectedly: {e}")
+
+    async def _flush(self, items: list) -> None:
+        groups: dict[tuple, list] = {}
+        for table, on_conflict, row in items:
+            groups.setdefault((table, on_conflict), []).append(row)
+        for (table, on_conflict), rows in groups.items():
+            await run_blocking(self._write_group, table, on_conflict, rows)
+
+    def _insert(self, table: str, on_conflict: str, rows: list[dict]) -> None:
+        supabase = self._client_getter()
+        if not supabase:
+            raise RuntimeError("Supabase client not initialized.")
+        if on_conflict:
+            supabase.table(table).upsert(rows, on_conflict=on_conflict).execute()
+        else:
+            supabase.table(table).insert(rows).execute()
+
+    def _write_group(self, table: str, on_conflict: str, rows: list[dict]) -> None:
+        """
+        Writes one multi-row batch (runs in the blocking-I/O pool). If the rows were rejected, retries
+        them one at a time; whatever failed for a transient reason (database unreachable) is spilled.
+        """
+        try:
+            self._insert(table, on_conflict, rows)
+            self._count("flushed_rows", len(rows))
+            self._count("flushed_batches")
+            return
+        except Exception as e:
+            self._count("failed_batches")
+            if len(rows) == 1 or not is_permanent_error(e):
+                print(f"WARNING - Write-behind batch of {len(rows)} {table} rows failed: {e}")
+                self._handle_failed(table, on_conflict, rows, e)
+                return
+            print(f"WARNING - Write-behind batch of {len(rows)} {table} rows rejected, retrying row by row: {e}")
+
+        for i, row in enumerate(rows):
+            self._count("row_retries")
+            try:
+                self._insert(table, on_conflict, [row])
+                self._count("flushed_rows")
+            except Exception as e:
+                if not is_permanent_error(e):
+                    # The database went away mid-retry: keep this row and the rest for the next replay
+                    self._handle_failed(table, on_conflict, rows[i:], e)
+                    return
+                self._handle_failed(table, on_conflict, [row], e)
+
+    def _handle_failed(self, table: str, on_conflict: str, rows: list[dict], error: Exception) -> None:
+        items = [(table, on_conflict, row) for row in rows]
+        if is_permanent_error(error):
+            print(f"ERROR - {len(rows)} {table} rows rejected by the database, dead-lettering: {error}")
+            self._dead_letter(items, error)
+        else:
+            self._spill(items)
+
+    def _process_path(self, kind: str = "") -> str:
+        stem, ext = os.path.splitext(self.spill_path)
+        return f"{stem}.{kind}{os.getpid()}{ext}"
+
+    def _append(self, path: str, records: list) -> None:
+        with self._spill_lock:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _spill(self, items: list) -> None:
+        self._spilled = True
+        try:
+            self._append(self._process_path(), [
+                {"table": table, "on_conflict": on_conflict, "row": row} for table, on_conflict, row in items
+            ])
+            self._count("spilled_rows", len(items))
+        except Exception as e:
+            print(f"ERROR - Could not spill {len(items)} write-behind rows, they are lost: {e}")
+
+    def _dead_letter(self, items: list, error: Exception) -> None:
+        """Keeps rejected rows for inspection; they are never replayed."""
+        try:
+            self._append(self._process_path("dead."), [
+                {"table": table, "on_conflict": on_conflict, "row": row, "error": str(error)[:500]}
+                for table, on_conflict, row in items
+            ])
+            self._count("dead_lettered_rows", len(items))
+        except Exception as e:
+            print(f"ERROR - Could not dead-letter {len(items)} write-behind rows, they are lost: {e}")
+
+    def _replayable_paths(self) -> list[str]:
+        """Spill files of exited processes or of an earlier run with our pid, plus the legacy single file."""
+        stem, ext = os.path.splitext(self.spill_path)
+        pattern = re.compile(re.escape(os.path.basename(stem)) + r"\.(\d+)" + re.escape(ext) + "$")
+        paths = [self.spill_path] if os.path.exists(self.spill_path) else []
+        for path in glob.glob(f"{glob.escape(stem)}.*{ext}"):
+            match = pattern.match(os.path.basename(path))
+            if not match:
+                continue
+            pid = int(match.group(1))
+            # Our own pid before we spilled anything: left by an earlier run that had the same pid
+            if (pid == os.getpid() and not self._spilled) or not _process_alive(pid):
+                paths.append(path)
+        return paths
+
+    def _take_spilled(self) -> list:
+        """Atomically takes ownership of the spill files of finished processes and returns their rows."""
+        items = []
+        for path in self._replayable_paths():
+            # Per-process name: with several workers replaying at startup only one wins each rename
+            replay_path = f"{path}.replay-{os.getpid()}"
+            try:
+                os.replace(path, replay_path)
+            except FileNotFoundError:
+                continue
+            with open(replay_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        items.append((record["table"], record.get("on_conflict"), record["row"]))
+                    except (json.JSONDecodeError, KeyError):
+                        print(f"WARNING - Skipping corrupt write-behind spill line: {line[:200]!r}")
+            os.remove(replay_path)
+        return items
+
+    def stats(self) -> dict:
+        with self._counters_lock:
+            counters = dict(self._counters)
+        counters["queue_depth"] = self._queue.qsize() if self._queue is not None else 0
+        return counters
+
+
+def _process_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True # Running as another user
+    return True
+
+
+write_behind = WriteBehindQueue(
+    max_queue=int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "10000")),
+    batch_size=int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "200")),
+    flush_interval=float(os.getenv("WRITE_BEHIND_FLUSH_SECONDS", "1.0")),
+    spill_path=os.getenv("WRITE_BEHIND_SPILL_PATH", DEFAULT_SPILL_PATH),
+)
@@ -18,15 +18,38 @@ load_dotenv(dotenv_path=env_path, override=True)
 # 8. Ongoing Maintenance: Periodically retrain the model with new data to improve accuracy.
 # This task requires expertise in machine learning and access to relevant datasets and computing resources.
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
+from .core.write_behind import write_behind
+from .core.http_client import outbound
+from .routes.market_prices import market_prices_cache
+from .routes.data import crop_info_cache
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Starts background workers on startup and drains them on shutdown."""
+    # Start the write-behind worker and replay rows spilled by a previous run
+    await write_behind.start()
+    # Watch market_prices.json and swap in new versions without a restart
+    market_prices_cache.start_watching()
+    crop_info_cache.start_watching()
+    yield
+    market_prices_cache.stop_watching()
+    crop_info_cache.stop_watching()
+    # Close pooled keep-alive connections to upstream APIs
+    await outbound.aclose()
+    # Flush queued chat_history/feedback rows before the process exits
+    await write_behind.stop()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="AI Farmer's Companion API",
     description="API for the AI Farmer's Companion application, providing agricultural support.",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan,
 )
 
 # Add CORS middleware to allow requests from the Flutter app
@@ -48,6 +71,7 @@ async def health_check():
 
 # Import routers from the routes module
 from .routes import chat, data, weather, voice # Import the new voice router
+from .routes import access_channels, market_prices, crop_weather
 
 # Include routers
 # chat.router already has prefix "/chat", so mounting at "/api/v1" yields paths like /api/v1/chat/ask
@@ -55,6 +79,10 @@ app.include_router(chat.router, prefix="/api/v1", tags=["Chat"])
 app.include_router(data.router, prefix="/api/v1/data", tags=["Application Data"])
 app.include_router(weather.router, prefix="/api/v1", tags=["Weather"])
 app.include_router(voice.router, prefix="/api/v1", tags=["Voice"]) # Include the new voice router
+# These routers carry their own prefixes and tags, e.g. /api/v1/access-channels/ussd
+app.include_router(access_channels.router, prefix="/api/v1")
+app.include_router(market_prices.router, prefix="/api/v1")
+app.include_router(crop_weather.router, prefix="/api/v1")
 
 # We will add other routers for different features later.
 # For example:
@@ -62,7 +90,23 @@ app.include_router(voice.router, prefix="/api/v1", tags=["Voice"]) # Include the
 # app.include_router(some_other_feature.router)
 
 from .core.security import get_current_user_id
-from fastapi import Depends
+from .core.context_cache import context_cache
+from .core.response_cache import response_cache
+from .core.metrics import latency_metrics
+from .core.prompt_builder import prompt_stats
+from .core.payloads import payload_cache
+from .core.forecast_cache import forecast_cache
+from .core.advisory_cache import advisory_cache
+from .core.latency_budget import budget_stats
+from .core.audio_cache import audio_cache
+import hmac
+from typing import Optional
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+
+# Static bearer token for metrics scrapers; when unset, /metrics needs a signed-in user's JWT
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+_metrics_bearer = HTTPBearer(scheme_name="Bearer", auto_error=False)
 
 @app.get("/protected", tags=["General"])
 async def protected_route(user_id: str = Depends(get_current_user_id)):
@@ -71,6 +115,41 @@ async def protected_route(user_id: str = Depends(get_current_user_id)):
     """
     return {"user_id": user_id, "message": "You are authenticated!"}
 
+def require_metrics_access(credentials: Optional[HTTPAuthorizationCredentials] = Depends(_metrics_bearer)):
+    """Allows the request if it carries METRICS_TOKEN as its bearer token, or a valid user JWT when no token is configured."""
+    if not METRICS_TOKEN:
+        get_current_user_id(credentials)
+        return
+    if credentials is None or not hmac.compare_digest(credentials.credentials.encode(), METRICS_TOKEN.encode()):
+        print("DEBUG - Rejected /metrics request without the metrics token")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated: metrics token required",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+@app.get("/metrics", summary="In-process cache and pipeline metrics", tags=["General"], dependencies=[Depends(require_metrics_access)])
+async def metrics():
+    """
+    Returns counters for the per-process caches, e.g. per-user context cache hits and misses.
+    Each worker process reports its own numbers. Requires METRICS_TOKEN (or a user JWT if it is unset).
+    """
+    return {
+        "context_cache": context_cache.stats(),
+        "write_behind": write_behind.stats(),
+        "response_cache": response_cache.stats() if response_cache else None,
+        "latency": latency_metrics.stats(),
+        "prompt_tokens": prompt_stats.stats(),
+        "market_prices": market_prices_cache.stats(),
+        "crop_info": crop_info_cache.stats(),
+        "payload_cache": payload_cache.stats(),
+        "forecast_cache": forecast_cache.stats(),
+        "http_client": outbound.stats(),
+        "advisory_cache": advisory_cache.stats(),
+        "latency_budgets": budget_stats.stats(),
+        "audio_cache": audio_cache.stats(),
+    }
+
 if __name__ == "__main__":
     # This is for local development running the Uvicorn server directly.
     # For production, you'd typically use a process manager like Gunicorn with Uvicorn workers.
@@ -1,9 +1,27 @@
-from fastapi import APIRouter, HTTPException
+import os
+import re
+import json
+import asyncio
+
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.responses import FileResponse
 from pydantic import BaseModel
 from typing import Optional, Dict
 
 from fastapi import Depends
 from ..core.security import get_current_user_id
+from ..core.session_store import create_session_store
+from .market_prices import market_prices_cache
+from ..core.model_client import generate_answer
+from ..core.latency_budget import LatencyBudget, BudgetExceeded, remember_answer
+from ..core.ussd_menu import MENU, MENU_TEXT, LANGUAGES, CompiledMenu, format_result, slow_action
+from ..core.audio_cache import audio_cache, AUDIO_FILE_RE
+from ..core.faq_utils import direct_answer_faq, search_faqs
+from ..core.prompt_builder import build_prompt, truncate_to_tokens
+from ..core.response_cache import normalize_question
+from ..core.singleflight import SingleFlight
+from ..core.concurrency import run_blocking
+from ..core.ttl_cache import TTLCache, MISSING
 
 router = APIRouter(
     prefix="/access-channels",
@@ -30,138 +48,83 @@ class UssdResponse(BaseModel):
     # e.g., "CON Welcome to Farmer's Companion..." vs "END Thank you..."
     # We'll just return the message, and the gateway handles session control.
 
-# Simulate simple session state using session_id to store the language (in real USSD, use a session store)
-
-LANGUAGES = {"1": "en", "2": "am"}
-MENU_TEXT = {
-    "en": {
-        "welcome": "CON Welcome to Farmer's Companion! Please select your language:\n1. English\n2. አማርኛ (Amharic)",
-        "main": "CON Main Menu:\n1. Crop Info\n2. Pest Help\n3. Market Prices\n0. Exit",
-        "crop_info_prompt": "CON Crop Info selected. Enter your region:\n0. Back",
-        "crop_type_prompt": "CON Enter crop type (e.g., maize, teff):\n0. Back",
-        "crop_result": "END Crop: {crop}, Region: {region} - Advisory: Use disease-resistant seeds.", # Placeholder
-        "pest_help_prompt": "CON Pest Help selected. Describe the issue or send photo later:\n0. Back",
-        "pest_result": "END Pest for {crop}: Monitor for symptoms. Consult local extension for specific treatment.", # Placeholder
-        "market_prices_prompt": "CON Market Prices selected. Enter crop name:\n0. Back",
-        "invalid_input": "CON Invalid input. Please try again.",
-        "thank_you": "END Thank you for using Farmer's Companion!"
-    },
-    "am": {
-        "welcome": "CON እንኳን ደህና መጡ ወደ ገበሬ ባልደረባ! ቋንቋ ይምረጡ:\n1. English\n2. አማርኛ",
-        "main": "CON ዋና ምናሌ:\n1. የእርሻ መረጃ\n2. የተባባሪ መረጃ\n3. የገበያ ዋጋ\n0. ውጣ",
-        "crop_info_prompt": "CON የእርሻ መረጃ ተመርጧል። ክልልዎን ያስገቡ:\n0. ተመለስ",
-        "crop_type_prompt": "CON የእርሻ አይነት ያስገቡ (ለምሳሌ: በቆሎ, ጤፍ):\n0. ተመለስ",
-        "crop_result": "END ሰብል: {crop}, ክልል: {region} - ምክር: በሽታን የሚቋቋሙ ዘሮችን ይጠቀሙ።", # Placeholder
-        "pest_help_prompt": "CON የተባባሪ መረጃ ተመርጧል። ችግሩን ይግለጹ ወይም ፎቶ ይላኩ:\n0. ተመለስ",
-        "pest_result": "END ለ{crop} ተባይ: ምልክቶችን ይከታተሉ። ለተለየ ህክምና የአካባቢውን ባለሙያ ያማክሩ።", # Placeholder
-        "market_prices_prompt": "CON የገበያ ዋጋ ተመርጧል። የእርሻ ስም ያስገቡ:\n0. ተመለስ",
-        "invalid_input": "CON የተሳሳተ ግብዓት። እባክዎ ደግመው ይሞክሩ።",
-        "thank_you": "END አመሰግናለሁ ወደ ገበሬ ባልደረባ ስለ መጡ!"
-    }
-}
-
-# Simulate session storage (in-memory, for demonstration only)
-session_language = {}
-session_state = {}
+# Regions listed in a USSD price answer (highest price first); gateways cut screens at ~182 characters
+USSD_PRICE_REGIONS = int(os.getenv("USSD_PRICE_REGIONS", "3"))
+USSD_MAX_CHARS = 182
+
+@slow_action
+def _market_price_message(lang: str, session: dict, user_input: str) -> str:
+    """Latest price per region from the shared in-memory index; no disk access on the request path."""
+    return _render_price_message(market_prices_cache.get(), lang, user_input.strip())
+
+def _render_price_message(tables, lang: str, crop: str) -> str:
+    texts = MENU_TEXT.get(lang, MENU_TEXT["en"])
+    records = tables.store.latest_by_region(crop)
+    if not records:
+        return texts["market_price_not_found"].format(crop=crop.title())
+    message = texts["market_price_result"].format(crop=crop.title())
+    for record in records[:USSD_PRICE_REGIONS]:
+        line = f"\n{record.region}: {record.price:g} {record.currency} ({record.date.isoformat()})"
+        if len(message) + len(line) > USSD_MAX_CHARS:
+            break
+        message += line
+    return message
+
+def warm_price_answers(tables=None) -> int:
+    """
+    Pre-renders the price answer of every crop in every language as the latency-budget fallback,
+    so a price lookup that runs past the deadline still gets a real answer. Runs once per data
+    generation, from the market_prices reload listener below.
+    """
+    if tables is None:
+        tables = market_prices_cache.get()
+    crops = {crop_key for (_, crop_key), _ in tables.store.series()}
+    count = 0
+    for crop in crops:
+        for lang in MENU_TEXT:
+            message = _render_price_message(tables, lang, crop)
+            key = ussd_menu.fallback_key(lang, {}, crop)
+            for channel in ("ussd", "ivr"):
+                remember_answer(channel, "action:market_prices", key, message)
+                count += 1
+    return count
+
+# Compiled once at import; the same table drives both USSD and IVR
+ussd_menu = CompiledMenu(MENU, MENU_TEXT, actions={
+    "crop_result": format_result("crop_result", crop="crop", region="region"),
+    "pest_result": format_result("pest_result", crop="crop"),
+    "market_prices": _market_price_message,
+})
+
+# Warm the generation loaded at import now, and every later one as the watcher swaps it in
+market_prices_cache.add_listener(warm_price_answers)
+
+# Per-session state ({"step": ..., "lang": ..., plus step inputs}), expired after SESSION_TTL_SECONDS without a hop
+ussd_sessions = create_session_store("ussd")
+ivr_sessions = create_session_store("ivr")
+
+def _apply_hop(store, session_id: str, hop) -> None:
+    if not hop.changed:
+        return
+    if hop.session is None:
+        store.delete(session_id)
+    else:
+        store.set(session_id, hop.session)
 
 @router.post("/ussd", response_model=UssdResponse, summary="Handle USSD interaction")
 async def handle_ussd_request(request: UssdRequest):
+    """
+    Runs one hop of the USSD menu. The body is assembled from the pre-encoded screen instead of
+    going through a UssdResponse model, since gateways allow only a short time per hop
+    (USSD_LATENCY_BUDGET_MS); slow lookups past that budget are answered from earlier results.
+    """
+    budget = LatencyBudget("ussd")
     sid = request.session_id
-    user_input = (request.user_input or "").strip()
-    lang = session_language.get(sid)
-    state = session_state.get(sid, {"step": "lang_selection"}) # Initial state
-
-    # Handle language selection
-    if state["step"] == "lang_selection":
-        if user_input in LANGUAGES:
-            lang = LANGUAGES[user_input]
-            session_language[sid] = lang
-            session_state[sid] = {"step": "main_menu"}
-            return UssdResponse(session_id=sid, message=MENU_TEXT[lang]["main"])
-        else:
-            # Default to English if no valid language selected yet
-            return UssdResponse(session_id=sid, message=MENU_TEXT["en"]["welcome"])
-
-    # Ensure language is set for subsequent steps
-    if not lang:
-        # This should ideally not happen if lang_selection is handled first
-        return UssdResponse(session_id=sid, message=MENU_TEXT["en"]["welcome"])
-
-    # Handle main menu and sub-flows
-    if user_input == "0": # Universal back/exit
-        if state["step"] == "main_menu":
-            session_language.pop(sid, None)
-            session_state.pop(sid, None)
-            return UssdResponse(session_id=sid, message=MENU_TEXT[lang]["thank_you"])
-        else:
-            session_state[sid] = {"step": "main_menu"}
-            return UssdResponse(session_id=sid, message=MENU_TEXT[lang]["main"])
-
-    if state["step"] == "main_menu":
-        if user_input == "1": # Crop Info
-            session_state[sid] = {"step": "crop_info_region_input"}
-            return UssdResponse(session_id=sid, message=MENU_TEXT[lang]["crop_info_prompt"])
-        elif user_input == "2": # Pest Help
-            session_state[sid] = {"step": "pest_help_crop_input"}
-            return UssdResponse(session_id=sid, message=MENU_TEXT[lang]["pest_help_prompt"])
-        elif user_input == "3": # Market Prices
-            session_state[sid] = {"step": "market_prices_crop_input"}
-            return UssdResponse(session_id=sid, message=MENU_TEXT[lang]["market_prices_prompt"])
-        else:
-            return UssdResponse(session_id=sid, message=MENU_TEXT[lang]["invalid_input"])
-
-    elif state["step"] == "crop_info_region_input":
-        state["region"] = user_input
-        state["step"] = "crop_info_type_input"
-        session_state[sid] = state
-        return UssdResponse(session_id=sid, message=MENU_TEXT[lang]["crop_type_prompt"])
-    elif state["step"] == "crop_info_type_input":
-        region = state.get("region", "Unknown")
-        crop = user_input
-        # In a real app, call backend API for crop info
-        response_message = MENU_TEXT[lang]["crop_result"].format(crop=crop, region=region)
-        session_language.pop(sid, None) # End session after result
-        session_state.pop(sid, None)
-        return UssdResponse(session_id=sid, message=response_message)
-
-    elif state["step"] == "pest_help_crop_input":
-        state["crop"] = user_input
-        state["step"] = "pest_help_desc_input"
-        session_state[sid] = state
-        return UssdResponse(session_id=sid, message=MENU_TEXT[lang]["pest_help_prompt"]) # Re-using prompt
-    elif state["step"] == "pest_help_desc_input":
-        crop = state.get("crop", "Unknown")
-        # In a real app, call backend API for pest diagnosis
-        response_message = MENU_TEXT[lang]["pest_result"].format(crop=crop)
-        session_language.pop(sid, None) # End session after result
-        session_state.pop(sid, None)
-        return UssdResponse(session_id=sid, message=response_message)
-
-    elif state["step"] == "market_prices_crop_input":
-        crop = user_input.strip().lower()
-        # Load market prices from JSON (direct read for simplicity, could use shared cache)
-        import os, json
-        data_path = os.path.join(os.path.dirname(__file__), "..", "data", "market_prices.json")
-        try:
-            with open(data_path, "r", encoding="utf-8") as f:
-                all_prices = json.load(f)
-            filtered = [p for p in all_prices if p.get("crop_type", "").lower() == crop]
-            if filtered:
-                latest = sorted(filtered, key=lambda x: x.get("date", "0000-00-00"), reverse=True)[0]
-                price_str = f"{latest.get('region', 'N/A')}: {latest.get('price_per_kg', 0.0)} {latest.get('currency', 'ETB')} ({latest.get('date', 'N/A')})"
-            else:
-                price_str = "Not found"
-            response_message = f"END {crop.title()} price: {price_str}"
-        except Exception as e:
-            print(f"ERROR - Failed to fetch market price for USSD: {e}")
-            response_message = MENU_TEXT[lang]["invalid_input"] # Or a more specific error message
-        
-        session_language.pop(sid, None)
-        session_state.pop(sid, None)
-        return UssdResponse(session_id=sid, message=response_message)
-
-    # Fallback for unhandled states
-    return UssdResponse(session_id=sid, message=MENU_TEXT[lang]["invalid_input"])
+    hop = await ussd_menu.hop_within(ussd_sessions.get(sid), (request.user_input or "").strip(), budget)
+    _apply_hop(ussd_sessions, sid, hop)
+    body = b'{"session_id":' + json.dumps(sid).encode("utf-8") + b',"message":' + hop.message_json + b"}"
+    budget.finish()
+    return Response(content=body, media_type="application/json")
 
 
 # --- IVR (Voice) Models and Endpoint ---
@@ -193,29 +156,137 @@ async def handle_ivr_event(request: IvrEventRequest):
     """
     actions = []
     lang = request.language_preference or "en" # Default to English
+    budget = LatencyBudget("ivr")
+    _warm_prompts_once()
 
     if request.event_type == 'new_call':
-        actions.append({
-            "action": "play_audio", 
-            "audio_config": {"text": f"Welcome to the AI Farmer's Companion. Please select your language. Press 1 for English, 2 for Amharic.", "language": "en"}
-        })
-        actions.append({"action": "get_input", "input_type": "dtmf", "max_digits": 1, "timeout_ms": 5000})
+        ivr_sessions.delete(request.call_id)
+        actions.append(_play(ussd_menu.screen("en", "welcome").ivr_text, "en"))
+        actions.append(_next_input(ussd_menu.steps["lang_selection"], "en"))
     elif request.event_type == 'dtmf_input':
-        if request.dtmf_input == '1':
-            actions.append({"action": "play_audio", "audio_config": {"text": "You have selected English. Press 1 for Crop Info, 2 for Pest Help, 3 for Market Prices.", "language": "en"}})
-            actions.append({"action": "get_input", "input_type": "dtmf", "max_digits": 1, "timeout_ms": 5000})
-        elif request.dtmf_input == '2':
-            actions.append({"action": "play_audio", "audio_config": {"text": "አማርኛ መርጠዋል። ለሰብል መረጃ 1 ይጫኑ፣ ለተባይ መረጃ 2 ይጫኑ፣ ለገበያ ዋጋ 3 ይጫኑ።", "language": "am"}})
-            actions.append({"action": "get_input", "input_type": "dtmf", "max_digits": 1, "timeout_ms": 5000})
-        else:
-            actions.append({"action": "play_audio", "audio_config": {"text": "Invalid input. Please try again.", "language": lang}})
-            actions.append({"action": "hangup"}) # Or loop back to main menu
+        hop = await ussd_menu.hop_within(ivr_sessions.get(request.call_id), (request.dtmf_input or "").strip(), budget)
+        _apply_hop(ivr_sessions, request.call_id, hop)
+        actions.extend(_ivr_actions(hop))
     elif request.event_type == 'speech_transcribed':
-        # Process speech_to_text_result with Gemini or local model
-        # For simplicity, just echo back and hangup
-        actions.append({"action": "play_audio", "audio_config": {"text": f"You said: {request.speech_to_text_result}. Processing your request.", "language": lang}})
-        actions.append({"action": "hangup"})
+        session = ivr_sessions.get(request.call_id)
+        speech = (request.speech_to_text_result or "").strip()
+        if session and ussd_menu.step_of(session).free_text:
+            # The caller answered a free-text prompt (region, crop name, ...) by voice
+            hop = await ussd_menu.hop_within(session, speech, budget)
+            _apply_hop(ivr_sessions, request.call_id, hop)
+            actions.extend(_ivr_actions(hop))
+        else:
+            # A spoken question: answered from the FAQs when one fits, otherwise by the model
+            lang = (session or {}).get("lang") or lang
+            actions.extend(await _question_actions(speech, lang, budget))
     else:
+        ivr_sessions.delete(request.call_id)
         actions.append({"action": "hangup"})
 
+    budget.finish()
     return IvrActionResponse(call_id=request.call_id, actions=actions)
+
+# Spoken answers are cut to about this many tokens; a caller cannot skim a long reply
+IVR_ANSWER_MAX_TOKENS = int(os.getenv("IVR_ANSWER_MAX_TOKENS", "120"))
+IVR_PROMPT_NOTE = (
+    "The user asked this on a phone call and will hear your reply read aloud: answer in at most "
+    "three short sentences, without lists, headings or other formatting."
+)
+_MARKDOWN_RE = re.compile(r"[*_#`>|]+")
+
+# Model answers to spoken questions, by language and normalized question
+ivr_answers = TTLCache(
+    maxsize=int(os.getenv("IVR_ANSWER_CACHE_MAX_ENTRIES", "2000")),
+    ttl=float(os.getenv("IVR_ANSWER_CACHE_TTL_SECONDS", str(24 * 3600))),
+)
+_ivr_questions = SingleFlight()
+
+def _spoken(text: str) -> str:
+    return truncate_to_tokens(" ".join(_MARKDOWN_RE.sub(" ", text).split()), IVR_ANSWER_MAX_TOKENS)
+
+async def _model_answer(question: str, lang: str) -> str:
+    """
+    Asks the model, with the closest FAQs as context. The call is shared by concurrent callers
+    and keeps running when a caller's budget expires, so asking again gets the cached answer.
+    """
+    key = (lang, normalize_question(question))
+    cached = ivr_answers.get(key)
+    if cached is not MISSING:
+        return cached
+
+    async def _generate():
+        faqs = await run_blocking(search_faqs, question, top_n=2)
+        prompt = build_prompt(lang, question, faqs=faqs, notes=[IVR_PROMPT_NOTE]).text
+        answer = _spoken(await generate_answer(prompt))
+        ivr_answers.set(key, answer)
+        return answer
+
+    return await _ivr_questions.do(key, _generate)
+
+async def _question_actions(question: str, lang: str, budget: LatencyBudget) -> list:
+    """Answers a spoken question within the IVR budget, then waits for the next one."""
+    if not question:
+        return [_play(ussd_menu.screen(lang, "question_not_heard").ivr_text, lang), _next_input(None, lang)]
+    try:
+        faq = await budget.call("faq", direct_answer_faq, question, lang)
+    except BudgetExceeded:
+        faq = None
+    if faq:
+        # FAQ answers are fixed texts, so their audio is worth keeping
+        answer = _play(_spoken(faq["answer"]), lang)
+    else:
+        try:
+            text = await budget.call("model", _model_answer, question, lang, fallback_key=(lang, normalize_question(question)))
+            answer = _play(text, lang, cache=False)
+        except BudgetExceeded:
+            answer = _play(ussd_menu.screen(lang, "question_busy").ivr_text, lang)
+            return [answer, _next_input(None, lang)]
+    followup = _play(ussd_menu.screen(lang, "question_followup").ivr_text, lang)
+    return [answer, followup, _next_input(None, lang)]
+
+def _play(text: str, lang: str, cache: bool = True) -> dict:
+    """A play_audio action; fixed texts point at their pre-rendered recording once there is one."""
+    return {"action": "play_audio", "audio_config": audio_cache.audio_config(text, lang, cache=cache)}
+
+def ivr_prompts():
+    """(text, language) of every static screen, as spoken on a call."""
+    for lang, screens in ussd_menu.screens.items():
+        for screen in screens.values():
+            if "{" not in screen.text: # Templates are only spoken once filled in
+                yield screen.ivr_text, lang
+
+_warm_started = {"task": None}
+
+def _warm_prompts_once() -> None:
+    """Renders all static prompts in the background, on the first IVR event of the process."""
+    if _warm_started["task"] is None and audio_cache.enabled:
+        _warm_started["task"] = asyncio.get_running_loop().create_task(audio_cache.warm(ivr_prompts()))
+
+@router.get("/audio/{name}", summary="Pre-rendered IVR prompt audio")
+async def get_ivr_audio(name: str):
+    """
+    Serves a rendered prompt at /api/v1/access-channels/audio/<name> (what AUDIO_BASE_URL must point at).
+    Names are content hashes, so responses may be cached indefinitely.
+    """
+    if not AUDIO_FILE_RE.match(name):
+        raise HTTPException(status_code=404, detail="Audio not found")
+    path = audio_cache.path_for(name.rsplit(".", 1)[0])
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Audio not found")
+    return FileResponse(path, media_type="audio/mpeg", headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+def _next_input(step, lang: str) -> dict:
+    """The input to wait for at `step`; None waits for a spoken question."""
+    if step is None or step.free_text:
+        return {"action": "get_speech_input", "language": lang, "timeout_ms": 8000}
+    return {"action": "get_input", "input_type": "dtmf", "max_digits": 1, "timeout_ms": 5000}
+
+def _ivr_actions(hop) -> list:
+    """Speaks the hop's screen, then waits for the next input (or hangs up when the menu ended)."""
+    # Static screens have recordings; results filled in from the caller's input are left to gateway TTS
+    actions = [_play(hop.ivr_text, hop.lang, cache=hop.screen is not None)]
+    if hop.session is None:
+        actions.append({"action": "hangup"})
+    else:
+        actions.append(_next_input(ussd_menu.step_of(hop.session), hop.lang))
+    return actions
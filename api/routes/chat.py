@@ -1,21 +1,24 @@
 import os
+import json
+import time
+import asyncio
+import hashlib
+from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from dotenv import load_dotenv
-import google.generativeai as genai
 from datetime import datetime, timezone
 
 from ..core.supabase_client import get_supabase_client
 from ..core.security import get_current_user_id
-from ..core.faq_utils import search_faqs # Import the FAQ search utility
-
-# Load environment variables and configure the Gemini API
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY is not set in the environment variables.")
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-1.5-flash')
+from ..core.faq_utils import hybrid_search_faqs, hybrid_search_faqs_batch # Import the FAQ search utilities
+from ..core.context_cache import context_cache, HISTORY_LIMIT
+from ..core.concurrency import run_blocking
+from ..core.write_behind import write_behind
+from ..core.response_cache import response_cache, make_response_key, faq_id
+from ..core.metrics import latency_metrics
+from ..core.model_client import model, generate_answer
+from ..core.prompt_builder import build_prompt, prompt_stats
 
 router = APIRouter(
     prefix="/chat",
@@ -28,123 +31,453 @@ class UserQuery(BaseModel):
     text_input: str
     language_code: str = 'en'
 
+# Per-source time budgets for gathering prompt context. A source that runs over its budget is
+# left out of the prompt instead of delaying the whole answer.
+HISTORY_TIMEOUT_SECONDS = float(os.getenv("CHAT_HISTORY_TIMEOUT_SECONDS", "1.5"))
+FAQ_TIMEOUT_SECONDS = float(os.getenv("CHAT_FAQ_TIMEOUT_SECONDS", "1.0"))
+FARM_PROFILE_TIMEOUT_SECONDS = float(os.getenv("CHAT_FARM_PROFILE_TIMEOUT_SECONDS", "1.5"))
+PROFILE_UPSERT_TIMEOUT_SECONDS = float(os.getenv("CHAT_PROFILE_UPSERT_TIMEOUT_SECONDS", "2.0"))
+
+# Users with conversation history get fresh answers, since the model's reply may depend on it
+RESPONSE_CACHE_BYPASS_WITH_HISTORY = os.getenv("RESPONSE_CACHE_BYPASS_WITH_HISTORY", "true").lower() == "true"
+
+def _build_prompt(query: UserQuery, user_id: str, history, relevant_faqs, profile_data, notes=()) -> str:
+    """Builds the token-budgeted model prompt and records its size."""
+    built = build_prompt(
+        query.language_code,
+        query.text_input,
+        history=history,
+        faqs=relevant_faqs,
+        profile=profile_data,
+        summary=context_cache.get_summary(user_id),
+        notes=notes,
+    )
+    prompt_stats.record(built)
+    print(f"--- Built prompt: ~{built.total_tokens} tokens {built.section_tokens} ---")
+    return built.text
+
+async def _ensure_profile(supabase, user_id: str):
+    """Ensures the user exists in profiles (foreign-key target); skipped for users already seen."""
+    if context_cache.is_profile_known(user_id):
+        return
+    try:
+        await run_blocking(
+            lambda: supabase.table('profiles').upsert({'id': user_id}).execute(),
+            timeout=PROFILE_UPSERT_TIMEOUT_SECONDS,
+        )
+        context_cache.mark_profile_known(user_id)
+    except Exception as e:
+        print(f"WARNING - Failed to upsert user profile: {type(e).__name__} {e}")
+        # This is non-critical, so we'll log and continue.
+
+async def _get_history_context(supabase, user_id: str):
+    """
+    Recent chat history for conversational memory (cached per user).
+    Returns (error_note, history); history is None if it could not be retrieved.
+    """
+    try:
+        history = context_cache.get_history(user_id)
+        if history is None:
+            # Fetch last messages (adjust HISTORY_LIMIT as needed for context window limits)
+            response = await run_blocking(
+                lambda: supabase.table('chat_history').select('query_text, response_text')
+                    .eq('user_id', user_id)
+                    .order('timestamp', desc=True)
+                    .limit(HISTORY_LIMIT).execute(),
+                timeout=HISTORY_TIMEOUT_SECONDS,
+            )
+            history = response.data or []
+            # Reverse to get chronological order for prompt
+            history.reverse()
+            context_cache.set_history(user_id, history)
+            print("--- Fetched chat history ---")
+
+        if not history:
+            print("--- No chat history found ---")
+        return "", history
+    except asyncio.TimeoutError:
+        print(f"--- Chat history fetch exceeded {HISTORY_TIMEOUT_SECONDS}s, continuing without it ---")
+        return "", None
+    except Exception as e:
+        print(f"--- Supabase chat history fetch error: {e} ---")
+        return "Could not retrieve conversation history due to an error.", None # Indicate error to AI
+
+async def _get_faq_context(text_input: str):
+    """
+    RAG (Retrieval Augmented Generation) context from the local FAQ corpus.
+    Returns (error_note, faqs); faqs is None if the search failed.
+    """
+    try:
+        relevant_faqs = await run_blocking(hybrid_search_faqs, text_input, top_n=2, timeout=FAQ_TIMEOUT_SECONDS) # Top 2 FAQs (keyword + semantic)
+        if not relevant_faqs:
+            print("--- No relevant FAQs found ---")
+            return "", []
+        print("--- Fetched relevant FAQs ---")
+        return "", relevant_faqs
+    except asyncio.TimeoutError:
+        print(f"--- FAQ search exceeded {FAQ_TIMEOUT_SECONDS}s, continuing without it ---")
+        return "", None
+    except Exception as e:
+        print(f"--- FAQ search error: {e} ---")
+        return "Could not retrieve FAQ context due to an error.", None # Indicate error to AI
+
+async def _get_batch_faq_results(questions: list[str]) -> list:
+    """
+    FAQ matches for every batch question. If the search fails or runs over FAQ_TIMEOUT_SECONDS the
+    batch is answered without FAQ context; None (as in _get_faq_context) keeps those answers out of the cache.
+    """
+    try:
+        return await run_blocking(hybrid_search_faqs_batch, questions, top_n=2, timeout=FAQ_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        print(f"--- Batch FAQ search exceeded {FAQ_TIMEOUT_SECONDS}s, continuing without it ---")
+    except Exception as e:
+        print(f"--- Batch FAQ search error: {type(e).__name__} {e} ---")
+    return [None] * len(questions)
+
+async def _get_farm_profile_context(supabase, user_id: str):
+    """
+    Farm profile data for personalization (cached per user).
+    Returns (error_note, profile); profile is {} if the user has none and None if it could not be retrieved.
+    """
+    try:
+        found, profile_data = context_cache.get_farm_profile(user_id)
+        if not found:
+            response = await run_blocking(
+                lambda: supabase.table('farm_profiles').select('*').eq('user_id', user_id).limit(1).execute(),
+                timeout=FARM_PROFILE_TIMEOUT_SECONDS,
+            )
+            profile_data = response.data[0] if response.data else None
+            context_cache.set_farm_profile(user_id, profile_data)
+            print("--- Fetched farm profile ---")
+
+        if not profile_data:
+            print("--- No farm profile found ---")
+            return "", {}
+        return "", profile_data
+    except asyncio.TimeoutError:
+        print(f"--- Farm profile fetch exceeded {FARM_PROFILE_TIMEOUT_SECONDS}s, continuing without it ---")
+        return "", None
+    except Exception as e:
+        print(f"--- Farm profile fetch error: {e} ---")
+        return "Could not retrieve farm profile due to an error.", None # Indicate error to AI
+
+def _response_cache_key(query: UserQuery, history, relevant_faqs, profile_data):
+    """
+    Cache key for this question's answer, or None when the answer should not be shared:
+    the cache is disabled, a context source failed, or the user has conversation history
+    (the model's answer may depend on it) and RESPONSE_CACHE_BYPASS_WITH_HISTORY is on.
+    """
+    if response_cache is None or history is None or relevant_faqs is None or profile_data is None:
+        return None
+    if history and RESPONSE_CACHE_BYPASS_WITH_HISTORY:
+        return None
+    return make_response_key(
+        query.text_input,
+        query.language_code,
+        region=profile_data.get('region'),
+        crop=profile_data.get('crop_focus'),
+        faq_ids=[faq_id(faq) for faq in relevant_faqs],
+    )
+
+async def _prepare_prompt(query: UserQuery, current_user_id: str):
+    """
+    Gathers the user's context and builds the model prompt.
+    Returns (prompt, cache_key, cached_response); cached_response is set when the answer can be reused.
+    """
+    supabase = get_supabase_client()
+    if not supabase:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Supabase client not initialized.")
+
+    # 1-3. Gather history, FAQ and farm profile context concurrently, each within its own budget
+    _, (history_note, history), (faq_note, relevant_faqs), (profile_note, profile_data) = await asyncio.gather(
+        _ensure_profile(supabase, current_user_id),
+        _get_history_context(supabase, current_user_id),
+        _get_faq_context(query.text_input),
+        _get_farm_profile_context(supabase, current_user_id),
+    )
+
+    # 4. Construct a prompt for the Gemini model, within the per-section token budgets
+    prompt = _build_prompt(
+        query, current_user_id, history, relevant_faqs, profile_data,
+        notes=(history_note, faq_note, profile_note),
+    )
+
+    # Reuse a cached answer to the same question when possible
+    cache_key = _response_cache_key(query, history, relevant_faqs, profile_data)
+    cached_response = await response_cache.get(cache_key) if cache_key else None
+    return prompt, cache_key, cached_response
+
+async def _record_answer(query: UserQuery, current_user_id: str, ai_response_text: str, cache_key=None):
+    """Caches a fresh answer and logs the interaction (write-behind; the caller does not wait for Supabase)."""
+    if cache_key:
+        await response_cache.set(cache_key, ai_response_text)
+    try:
+        write_behind.enqueue('chat_history', {
+            'user_id': current_user_id,
+            'query_text': query.text_input,
+            'response_text': ai_response_text,
+            'language': query.language_code,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+        })
+        context_cache.append_history(current_user_id, {
+            'query_text': query.text_input,
+            'response_text': ai_response_text,
+        })
+        print("--- Chat history queued for Supabase ---")
+    except Exception as e:
+        print(f"--- Supabase logging error: {e} ---") # Non-critical error
+
 @router.post("/ask", summary="Process a user's text query")
 async def ask_assistant(query: UserQuery, current_user_id: str = Depends(get_current_user_id)):
+    started = time.perf_counter()
     try:
         print(f"--- Received query: '{query.text_input}' in {query.language_code} ---")
 
-        supabase = get_supabase_client()
-        if not supabase:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Supabase client not initialized.")
+        prompt, cache_key, ai_response_text = await _prepare_prompt(query, current_user_id)
+
+        # 4. Generate the AI response (unless it was served from cache)
+        if ai_response_text is not None:
+            print("--- Served response from cache ---")
+            cache_key = None # Already cached
+        else:
+            print("--- Sending request to Gemini API... ---")
+            ai_response_text = await generate_answer(prompt, coalesce_key=cache_key)
+            print(f"--- Received response from Gemini ---")
+
+        # 5. Cache the answer and log the interaction to Supabase
+        await _record_answer(query, current_user_id, ai_response_text, cache_key)
+        latency_metrics.recorder("chat_ask_total").record(time.perf_counter() - started)
+
+        # 6. Return the AI-generated response to the client
+        return {"response": ai_response_text}
+
+    except Exception as e:
+        print(f"--- CRITICAL ERROR in ask_assistant: {e} ---")
+        # Return a 500 error with the exception details (refined error handling)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {type(e).__name__} - {str(e)}"
+        )
+
+def _sse_event(data: dict, event: str = None) -> str:
+    """Formats one server-sent event."""
+    payload = json.dumps(data, ensure_ascii=False)
+    return (f"event: {event}\n" if event else "") + f"data: {payload}\n\n"
+
+@router.post("/ask/stream", summary="Process a user's text query, streaming the answer as server-sent events")
+async def ask_assistant_stream(query: UserQuery, current_user_id: str = Depends(get_current_user_id)):
+    """
+    Same as /ask, but forwards the model's output as it is generated, so users on slow links see
+    the start of the answer right away instead of waiting for the whole completion.
+
+    Events: `data: {"text": "<chunk>"}` for each piece of the answer, then `event: done`
+    (or `event: error` if generation fails part-way). The full answer is logged to chat history
+    after the stream completes.
+    """
+    started = time.perf_counter()
+    print(f"--- Received streaming query: '{query.text_input}' in {query.language_code} ---")
+    try:
+        prompt, cache_key, cached_response = await _prepare_prompt(query, current_user_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"--- CRITICAL ERROR in ask_assistant_stream: {e} ---")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {type(e).__name__} - {str(e)}"
+        )
+
+    async def event_stream():
+        first_chunk_at = None
+        if cached_response is not None:
+            print("--- Served streamed response from cache ---")
+            latency_metrics.recorder("chat_stream_ttfb").record(time.perf_counter() - started)
+            yield _sse_event({"text": cached_response})
+            yield _sse_event({}, event="done")
+            await _record_answer(query, current_user_id, cached_response)
+            return
 
-        # Ensure the user exists in profiles (foreign-key target)
+        parts = []
         try:
-            supabase.table('profiles').upsert({'id': current_user_id}).execute()
+            print("--- Streaming request to Gemini API... ---")
+            response = await model.generate_content_async(prompt, stream=True)
+            async for chunk in response:
+                text = getattr(chunk, "text", "")
+                if not text:
+                    continue
+                if first_chunk_at is None:
+                    first_chunk_at = time.perf_counter()
+                    latency_metrics.recorder("chat_stream_ttfb").record(first_chunk_at - started)
+                parts.append(text)
+                yield _sse_event({"text": text})
         except Exception as e:
-            print(f"WARNING - Failed to upsert user profile: {e}")
-            # This is non-critical, so we'll log and continue.
+            print(f"--- Streaming generation error: {e} ---")
+            latency_metrics.recorder("chat_stream_total").record(time.perf_counter() - started, error=True)
+            yield _sse_event({"detail": f"{type(e).__name__} - {str(e)}"}, event="error")
+            return
+
+        latency_metrics.recorder("chat_stream_total").record(time.perf_counter() - started)
+        yield _sse_event({}, event="done")
+        print("--- Finished streaming response from Gemini ---")
+        # Log the assembled answer once the client has it
+        await _record_answer(query, current_user_id, "".join(parts), cache_key)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}, # Stop proxies from buffering the stream
+    )
+
+# --- Batch questions (cooperative agents, IVR) ---
+BATCH_MAX_ITEMS = int(os.getenv("CHAT_BATCH_MAX_ITEMS", "50"))
+BATCH_MODEL_CONCURRENCY = int(os.getenv("CHAT_BATCH_MODEL_CONCURRENCY", "4"))
+# Comma-separated user ids (e.g. cooperative agent accounts) allowed to ask on behalf of other farmers
+BATCH_AGENT_USER_IDS = {uid.strip() for uid in os.getenv("CHAT_BATCH_AGENT_USER_IDS", "").split(",") if uid.strip()}
+
+# Bound to the event loop that created it; rebuilt for a new loop (e.g. another app instance or test client)
+_batch_model_semaphore = {"loop": None, "semaphore": None}
+
+class BatchQuestion(UserQuery):
+    user_id: Optional[str] = None # Farmer the question is asked for; defaults to the caller
+
+class BatchQuery(BaseModel):
+    items: List[BatchQuestion]
 
-        # 1. Fetch recent chat history for conversational memory
-        chat_history_str = ""
+def _get_batch_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    if _batch_model_semaphore["loop"] is not loop:
+        _batch_model_semaphore["semaphore"] = asyncio.Semaphore(BATCH_MODEL_CONCURRENCY)
+        _batch_model_semaphore["loop"] = loop
+    return _batch_model_semaphore["semaphore"]
+
+async def _load_bulk_context(supabase, user_ids: list[str]):
+    """
+    Context for many users with one query per table (only for users not already in the context cache).
+    Returns ({user_id: history or None}, {user_id: profile, {} or None}); None marks a failed lookup.
+    """
+    unknown_profiles = [uid for uid in user_ids if not context_cache.is_profile_known(uid)]
+    if unknown_profiles:
         try:
-            # Fetch last 5 messages (adjust as needed for context window limits)
-            response = supabase.table('chat_history').select('query_text, response_text') \
-                .eq('user_id', current_user_id) \
-                .order('timestamp', ascending=False) \
-                .limit(5).execute()
-            
-            history = response.data
-            if history:
-                # Reverse to get chronological order for prompt
-                history.reverse() 
-                chat_history_str = "\n\n--- Conversation History ---\n"
-                for entry in history:
-                    chat_history_str += f"User: {entry['query_text']}\n"
-                    chat_history_str += f"Assistant: {entry['response_text']}\n"
-                chat_history_str += "--------------------------\n\n"
-                print("--- Fetched chat history ---")
-            else:
-                print("--- No chat history found ---")
+            await run_blocking(
+                lambda: supabase.table('profiles').upsert([{'id': uid} for uid in unknown_profiles]).execute(),
+                timeout=PROFILE_UPSERT_TIMEOUT_SECONDS,
+            )
+            for uid in unknown_profiles:
+                context_cache.mark_profile_known(uid)
         except Exception as e:
-            print(f"--- Supabase chat history fetch error: {e} ---")
-            chat_history_str = "\n\n(Could not retrieve conversation history due to an error.)\n\n" # Indicate error to AI
+            print(f"WARNING - Failed to bulk upsert user profiles: {type(e).__name__} {e}")
 
-        # 2. Implement RAG (Retrieval Augmented Generation) for FAQs
-        faq_context = ""
+    histories = {uid: context_cache.get_history(uid) for uid in user_ids}
+    missing_history = [uid for uid, history in histories.items() if history is None]
+    if missing_history:
+        # PostgREST cannot limit per user, so over-fetch and keep the newest HISTORY_LIMIT rows per user
+        row_limit = len(missing_history) * HISTORY_LIMIT * 4
         try:
-            relevant_faqs = search_faqs(query.text_input, top_n=2) # Get top 2 relevant FAQs
-            if relevant_faqs:
-                faq_context = "\n\n--- Relevant FAQs ---\n"
-                for i, faq in enumerate(relevant_faqs):
-                    faq_context += f"Q{i+1}: {faq['question']}\n"
-                    faq_context += f"A{i+1}: {faq['answer']}\n"
-                faq_context += "---------------------\n\n"
-                print("--- Fetched relevant FAQs ---")
-            else:
-                print("--- No relevant FAQs found ---")
+            response = await run_blocking(
+                lambda: supabase.table('chat_history').select('user_id, query_text, response_text')
+                    .in_('user_id', missing_history)
+                    .order('timestamp', desc=True)
+                    .limit(row_limit).execute(),
+                timeout=HISTORY_TIMEOUT_SECONDS,
+            )
+            rows = response.data or []
+            grouped = {uid: [] for uid in missing_history}
+            for row in rows:
+                bucket = grouped.get(row.get('user_id'))
+                if bucket is not None and len(bucket) < HISTORY_LIMIT:
+                    bucket.append({'query_text': row['query_text'], 'response_text': row['response_text']})
+            truncated = len(rows) >= row_limit
+            for uid, bucket in grouped.items():
+                bucket.reverse() # Chronological order for the prompt
+                histories[uid] = bucket
+                # With a truncated result a short bucket may be missing rows crowded out by other users,
+                # so only a full one is known to be the user's newest HISTORY_LIMIT turns
+                if not truncated or len(bucket) == HISTORY_LIMIT:
+                    context_cache.set_history(uid, bucket)
         except Exception as e:
-            print(f"--- FAQ search error: {e} ---")
-            faq_context = "\n\n(Could not retrieve FAQ context due to an error.)\n\n" # Indicate error to AI
+            print(f"--- Bulk chat history fetch error: {type(e).__name__} {e} ---")
 
-        # 3. Fetch farm profile data for personalization
-        farm_profile_context = ""
+    profiles = {}
+    missing_profile = []
+    for uid in user_ids:
+        found, profile_data = context_cache.get_farm_profile(uid)
+        if found:
+            profiles[uid] = profile_data or {}
+        else:
+            profiles[uid] = None
+            missing_profile.append(uid)
+    if missing_profile:
         try:
-            response = supabase.table('farm_profiles').select('*').eq('user_id', current_user_id).single().execute()
-            profile_data = response.data
-            if profile_data:
-                farm_profile_context = "\n\n--- Farm Profile ---\n"
-                farm_profile_context += f"Region: {profile_data.get('region', 'N/A')}\n"
-                farm_profile_context += f"Crop Focus: {profile_data.get('crop_focus', 'N/A')}\n"
-                farm_profile_context += f"Land Size: {profile_data.get('land_size', 'N/A')}\n"
-                farm_profile_context += "--------------------\n\n"
-                print("--- Fetched farm profile ---")
-            else:
-                print("--- No farm profile found ---")
+            response = await run_blocking(
+                lambda: supabase.table('farm_profiles').select('*').in_('user_id', missing_profile).execute(),
+                timeout=FARM_PROFILE_TIMEOUT_SECONDS,
+            )
+            by_user = {row.get('user_id'): row for row in (response.data or [])}
+            for uid in missing_profile:
+                context_cache.set_farm_profile(uid, by_user.get(uid))
+                profiles[uid] = by_user.get(uid) or {}
         except Exception as e:
-            print(f"--- Farm profile fetch error: {e} ---")
-            farm_profile_context = "\n\n(Could not retrieve farm profile due to an error.)\n\n" # Indicate error to AI
-
-
-        # 4. Construct a prompt for the Gemini model
-        prompt = (
-            f"You are an expert agricultural assistant for Ethiopian farmers. "
-            f"Your goal is to provide accurate, helpful, and concise advice. "
-            f"Please respond in {query.language_code}, as that is the user's preferred language.\n\n"
-            f"{chat_history_str}" # Include conversation history
-            f"{faq_context}"     # Include FAQ context
-            f"{farm_profile_context}" # Include farm profile context
-            f"User's current question: {query.text_input}"
-        )
+            print(f"--- Bulk farm profile fetch error: {type(e).__name__} {e} ---")
 
-        # 4. Generate the AI response
-        print("--- Sending request to Gemini API... ---")
-        response = await model.generate_content_async(prompt)
-        ai_response_text = response.text
-        print(f"--- Received response from Gemini ---")
+    return histories, profiles
 
-        # 5. Log the interaction to Supabase
-        try:
-            supabase.table('chat_history').insert({
-                'user_id': current_user_id,
-                'query_text': query.text_input,
-                'response_text': ai_response_text,
-                'language': query.language_code,
-                'timestamp': datetime.now(timezone.utc).isoformat(),
-            }).execute()
-            print("--- Chat history logged to Supabase ---")
-        except Exception as e:
-            print(f"--- Supabase logging error: {e} ---") # Non-critical error
+@router.post("/ask/batch", summary="Process many questions in one request")
+async def ask_assistant_batch(batch: BatchQuery, current_user_id: str = Depends(get_current_user_id)):
+    """
+    Answers a list of questions for the caller or, for agent accounts listed in
+    CHAT_BATCH_AGENT_USER_IDS, on behalf of other farmers (`user_id` per item).
 
-        # 6. Return the AI-generated response to the client
-        return {"response": ai_response_text}
+    Context for all users is fetched in bulk, identical in-flight questions share one model call,
+    and model calls run with bounded concurrency. Results are returned in request order;
+    an item that fails carries an `error` instead of a `response`.
+    """
+    if len(batch.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"A batch can contain at most {BATCH_MAX_ITEMS} questions.")
+    supabase = get_supabase_client()
+    if not supabase:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Supabase client not initialized.")
 
-    except Exception as e:
-        print(f"--- CRITICAL ERROR in ask_assistant: {e} ---")
-        # Return a 500 error with the exception details (refined error handling)
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Internal server error: {type(e).__name__} - {str(e)}"
+    results: list = [None] * len(batch.items)
+    allowed = []
+    for i, item in enumerate(batch.items):
+        user_id = item.user_id or current_user_id
+        if user_id != current_user_id and current_user_id not in BATCH_AGENT_USER_IDS:
+            results[i] = {"index": i, "user_id": user_id, "error": "Not allowed to ask on behalf of another user."}
+        else:
+            allowed.append((i, user_id, item))
+
+    if allowed:
+        user_ids = list(dict.fromkeys(user_id for _, user_id, _ in allowed))
+        (histories, profiles), faq_results = await asyncio.gather(
+            _load_bulk_context(supabase, user_ids),
+            _get_batch_faq_results([item.text_input for _, _, item in allowed]),
         )
+        semaphore = _get_batch_semaphore()
+
+        async def _answer(i: int, user_id: str, item: BatchQuestion, relevant_faqs):
+            try:
+                history, profile_data = histories[user_id], profiles[user_id]
+                cache_key = _response_cache_key(item, history, relevant_faqs, profile_data)
+                ai_response_text = await response_cache.get(cache_key) if cache_key else None
+                if ai_response_text is None:
+                    prompt = _build_prompt(item, user_id, history, relevant_faqs, profile_data)
+                    # Coalesce on the shareable cache key, or on the exact prompt for personalised questions
+                    coalesce_key = cache_key or hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+                    ai_response_text = await generate_answer(prompt, coalesce_key=coalesce_key, limit=semaphore)
+                else:
+                    cache_key = None # Already cached
+                await _record_answer(item, user_id, ai_response_text, cache_key)
+                results[i] = {"index": i, "user_id": user_id, "response": ai_response_text}
+            except Exception as e:
+                print(f"--- Batch item {i} failed: {type(e).__name__} {e} ---")
+                results[i] = {"index": i, "user_id": user_id, "error": f"{type(e).__name__} - {str(e)}"}
+
+        await asyncio.gather(*(
+            _answer(i, user_id, item, relevant_faqs)
+            for (i, user_id, item), relevant_faqs in zip(allowed, faq_results)
+        ))
+
+    return {"results": results}
 
 class Feedback(BaseModel):
     message_id: str
@@ -156,14 +489,9 @@ async def submit_feedback(
     current_user_id: str = Depends(get_current_user_id)
 ):
     """
-    Receives user feedback (like/dislike) for a specific AI chat message and saves it.
+    Receives user feedback (like/dislike) for a specific AI chat message and queues it for saving.
     """
-    supabase = get_supabase_client()
-    if not supabase:
-        raise HTTPException(status_code=500, detail="Supabase client not initialized.")
-
     try:
-        # Implement logic to save feedback in Supabase
         # Assuming a 'feedback' table exists with columns: user_id, message_id, feedback_type, timestamp
         data_to_save = {
             'user_id': current_user_id,
@@ -171,9 +499,8 @@ async def submit_feedback(
             'feedback_type': feedback.feedback_type,
             'timestamp': datetime.now(timezone.utc).isoformat(),
         }
-        # Insert the feedback data into the 'feedback' table
-        response = supabase.table('feedback').insert(data_to_save).execute()
-        print(f"DEBUG - Supabase feedback insert response: {response.data}")
+        # Batched into the 'feedback' table by the write-behind worker
+        write_behind.enqueue('feedback', data_to_save)
 
         # Return a success message
         return {"message": "Feedback saved successfully!"}
@@ -5,6 +5,9 @@ from datetime import date
 
 from fastapi import Depends
 from ..core.security import get_current_user_id
+from ..core.http_client import outbound
+from ..core.forecast_cache import forecast_cache, seconds_until_refresh, FORECAST_UPDATE_HOURS
+from ..core.advisory_cache import advisory_cache
 
 router = APIRouter(
     prefix="/crop-weather",
@@ -20,7 +23,17 @@ class CropWeatherParams(BaseModel):
     request_date: date = date.today()
     is_offline: bool = False
 
-import requests
+DAILY_VARIABLES = "temperature_2m_max,temperature_2m_min,precipitation_sum,weathercode"
+OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
+
+async def _fetch_daily(latitude: float, longitude: float) -> dict:
+    params = {
+        "latitude": latitude,
+        "longitude": longitude,
+        "daily": DAILY_VARIABLES,
+        "timezone": "Africa/Addis_Ababa",
+    }
+    return await outbound.get_json(OPEN_METEO_URL, params=params)
 
 @router.get("/advisory", summary="Get crop and weather advisory")
 async def get_crop_weather_advisory(
@@ -38,41 +51,61 @@ async def get_crop_weather_advisory(
     - **crop_type**: Optional. The specific crop the farmer is interested in (e.g., 'maize', 'teff').
     - **request_date**: The date for the advisory. Defaults to today.
     - **is_offline**: Indicates if the app is in offline mode. If true, should rely on cached data.
+
+    Advisories are cached per grid cell, crop and date (in memory, then the crop_advisory_cache table),
+    so repeat and offline requests are answered without calling Open-Meteo.
     """
 
+    advisory_date = request_date.isoformat()
+    forecast_source = None
+    forecast_data = None
     if is_offline:
-        # Placeholder: Logic to fetch cached weather forecast and crop tips
+        # Serve the last advisory stored for this grid cell, even if it has expired
+        entry = await advisory_cache.get(latitude, longitude, crop_type, advisory_date, allow_expired=True)
         weather_forecast = "Cached 3-day weather forecast for your area."
         crop_tips = "Offline crop tips for general farming."
         if crop_type:
             crop_tips = f"Offline tips for {crop_type}."
-        forecast_data = None
+        if entry:
+            forecast_data = entry["weather_forecast_data"]
+            weather_forecast = f"Cached forecast from {entry['fetched_at']}."
+            crop_tips = (entry.get("crop_tips_data") or {}).get("crop_advisory", crop_tips)
+            forecast_source = "cache"
     else:
-        # Call Open-Meteo API for real weather forecast
-        try:
-            url = (
-                f"https://api.open-meteo.com/v1/forecast?latitude={latitude}&longitude={longitude}"
-                f"&daily=temperature_2m_max,temperature_2m_min,precipitation_sum,weathercode"
-                f"&timezone=Africa%2FAddis_Ababa"
-            )
-            resp = requests.get(url, timeout=10)
-            resp.raise_for_status()
-            data = resp.json()
-            # Parse relevant forecast data
-            forecast_data = {
-                "dates": data.get("daily", {}).get("time", []),
-                "temp_max": data.get("daily", {}).get("temperature_2m_max", []),
-                "temp_min": data.get("daily", {}).get("temperature_2m_min", []),
-                "precipitation": data.get("daily", {}).get("precipitation_sum", []),
-                "weathercode": data.get("daily", {}).get("weathercode", [])
-            }
-            weather_forecast = "3-day forecast from Open-Meteo."
-        except Exception as e:
-            weather_forecast = f"Could not fetch weather forecast: {e}"
-            forecast_data = None
         crop_tips = "Online, tailored crop advice."
         if crop_type:
             crop_tips = f"Detailed online advice for {crop_type} at your location."
+        entry = await advisory_cache.get(latitude, longitude, crop_type, advisory_date)
+        if entry:
+            forecast_data = entry["weather_forecast_data"]
+            weather_forecast = (entry.get("crop_tips_data") or {}).get("weather_forecast", "3-day forecast from Open-Meteo.")
+            forecast_source = "cache"
+        else:
+            # Call Open-Meteo API for real weather forecast (shared per grid cell until the next model update)
+            try:
+                data = await forecast_cache.get("daily", latitude, longitude, DAILY_VARIABLES, _fetch_daily)
+                # Parse relevant forecast data
+                forecast_data = {
+                    "dates": data.get("daily", {}).get("time", []),
+                    "temp_max": data.get("daily", {}).get("temperature_2m_max", []),
+                    "temp_min": data.get("daily", {}).get("temperature_2m_min", []),
+                    "precipitation": data.get("daily", {}).get("precipitation_sum", []),
+                    "weathercode": data.get("daily", {}).get("weathercode", [])
+                }
+                weather_forecast = "3-day forecast from Open-Meteo."
+                forecast_source = "live"
+                advisory_cache.put(
+                    latitude, longitude, crop_type, advisory_date, forecast_data,
+                    {"weather_forecast": weather_forecast, "crop_advisory": crop_tips},
+                    ttl_seconds=seconds_until_refresh(FORECAST_UPDATE_HOURS["daily"]),
+                )
+            except Exception as e:
+                weather_forecast = f"Could not fetch weather forecast: {e}"
+                stale = await advisory_cache.get(latitude, longitude, crop_type, advisory_date, allow_expired=True)
+                if stale:
+                    forecast_data = stale["weather_forecast_data"]
+                    weather_forecast = f"Live forecast unavailable; cached forecast from {stale['fetched_at']}."
+                    forecast_source = "cache"
 
     return {
         "location": {"latitude": latitude, "longitude": longitude},
@@ -81,5 +114,6 @@ async def get_crop_weather_advisory(
         "is_offline": is_offline,
         "weather_forecast": weather_forecast,
         "forecast_data": forecast_data,
+        "forecast_source": forecast_source,
         "crop_advisory": crop_tips
     }
@@ -1,12 +1,15 @@
 import os
 import io
 import json
-from fastapi import APIRouter, HTTPException, File, UploadFile
+from typing import Optional
+from fastapi import APIRouter, HTTPException, File, UploadFile, Request, Query
 import google.generativeai as genai
 from PIL import Image
 
-# Import cached market prices data and loading function
-from .market_prices import _market_prices_cache, load_market_prices_data
+# Versioned market prices cache (read per request, so hot reloads are picked up)
+from .market_prices import market_prices_cache, load_market_prices_data
+from ..core.versioned_cache import VersionedCache, file_fingerprint, hash_bytes
+from ..core.payloads import KeyedDataset, payload_response
 
 router = APIRouter()
 
@@ -20,59 +23,78 @@ try:
 except Exception as e:
     print(f"Error configuring Gemini: {e}")
 
+_SINCE_DESCRIPTION = (
+    "Optional: a data version (the ETag value or X-Data-Version header of an earlier response). "
+    "Returns only the rows changed since then as {version, since, full, changed, deleted}; "
+    "full=true (with since=null) means the version was unknown and `changed` holds every row."
+)
+
+def _dataset_response(request: Request, dataset: KeyedDataset, since: Optional[str]):
+    try:
+        payload = dataset.payload if since is None else dataset.delta_payload(since)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return payload_response(request, payload, headers={"X-Data-Version": dataset.version})
+
 @router.get("/market-prices")
-async def get_market_prices():
-    """Returns market price data from cache."""
+async def get_market_prices(request: Request, since: Optional[str] = Query(None, description=_SINCE_DESCRIPTION)):
+    """
+    Returns market price data from cache.
+    Supports If-None-Match (304 when unchanged), gzip/brotli and `since=<version>` deltas.
+    """
     # Use the cached data loaded by the market_prices module
-    market_prices = _market_prices_cache
+    tables = market_prices_cache.get()
 
-    if not market_prices:
+    if not tables.rows:
          # Attempt to reload data if cache is empty (e.g., on first request after startup error)
-         load_market_prices_data()
-         market_prices = _market_prices_cache
-         if not market_prices:
+         tables = load_market_prices_data()
+         if not tables.rows:
               raise HTTPException(status_code=500, detail="Market prices data not available.")
 
-    return market_prices
-
-# Placeholder for caching crop info data (similar to market prices)
-_crop_info_cache = None
+    return _dataset_response(request, tables.dataset, since)
+
+CROP_INFO_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "crop_info.json") # Assuming crop_info.json exists
+
+def _load_crop_info():
+    """Loads crop information data from the JSON file."""
+    with open(CROP_INFO_PATH, "rb") as f:
+        raw = f.read()
+    content_hash = hash_bytes(raw)
+    dataset = KeyedDataset(json.loads(raw), content_hash, key_func=lambda item: item["name"])
+    print("DEBUG - Crop info data loaded and cached.")
+    return dataset, content_hash
+
+# Versioned crop info cache, reloaded by the same watcher mechanism as market prices
+crop_info_cache = VersionedCache(
+    "crop_info",
+    load=_load_crop_info,
+    fingerprint=lambda: file_fingerprint(CROP_INFO_PATH),
+    poll_interval=float(os.getenv("CROP_INFO_POLL_SECONDS", "30")),
+    empty=lambda: KeyedDataset([], "", key_func=lambda item: item["name"]),
+    on_reload=lambda previous, dataset: dataset.link_previous(previous),
+)
 
 def load_crop_info_data():
-    """Loads crop information data from a JSON file."""
-    global _crop_info_cache
-    data_path = os.path.join(os.path.dirname(__file__), "..", "data", "crop_info.json") # Assuming crop_info.json exists
-    try:
-        with open(data_path, "r", encoding="utf-8") as f:
-            _crop_info_cache = json.load(f)
-        print("DEBUG - Crop info data loaded and cached.")
-    except FileNotFoundError:
-        print(f"ERROR - Crop info data file not found at {data_path}")
-        _crop_info_cache = [] # Initialize as empty list on error
-    except json.JSONDecodeError:
-        print(f"ERROR - Error decoding crop info data from {data_path}")
-        _crop_info_cache = [] # Initialize as empty list on error
-    except Exception as e:
-        print(f"ERROR - An unexpected error occurred loading crop info: {e}")
-        _crop_info_cache = [] # Initialize as empty list on error
+    """Reloads crop information data from the JSON file now."""
+    crop_info_cache.refresh(force=True)
+    return crop_info_cache.get()
 
 # Load data when the module is imported
-load_crop_info_data()
+crop_info_cache.refresh()
 
 @router.get("/crop-info")
-async def get_crop_info():
-    """Returns crop information from cache (placeholder for real data)."""
+async def get_crop_info(request: Request, since: Optional[str] = Query(None, description=_SINCE_DESCRIPTION)):
+    """Returns crop information from cache (placeholder for real data). Supports ETags and `since` deltas."""
     # Use the cached data
-    crop_info = _crop_info_cache
+    dataset = crop_info_cache.get()
 
-    if not crop_info:
+    if not dataset.rows:
          # Attempt to reload data if cache is empty
-         load_crop_info_data()
-         crop_info = _crop_info_cache
-         if not crop_info:
+         dataset = load_crop_info_data()
+         if not dataset.rows:
               raise HTTPException(status_code=500, detail="Crop information data not available.")
 
-    return crop_info
+    return _dataset_response(request, dataset, since)
 
 @router.post("/pest-diagnose")
 async def diagnose_pest(file: UploadFile = File(...)):
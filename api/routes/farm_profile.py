@@ -4,6 +4,7 @@ from typing import Optional
 
 from ..core.security import get_current_user_id
 from ..core.supabase_client import get_supabase_client
+from ..core.context_cache import context_cache
 
 router = APIRouter(
     prefix="/farm-profile",
@@ -43,6 +44,9 @@ async def create_or_update_farm_profile(
         
         print(f"DEBUG - Supabase upsert response for farm profile: {response.data}")
 
+        # Write-through so /chat/ask sees the new profile without re-reading it
+        context_cache.set_farm_profile(current_user_id, response.data[0] if response.data else data_to_save)
+
         # Return a success message
         return {"message": "Farm profile saved successfully!", "data": response.data}
 
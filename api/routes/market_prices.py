@@ -1,12 +1,19 @@
-from fastapi import APIRouter, Query, HTTPException
+from fastapi import APIRouter, Query, HTTPException, Request
 from pydantic import BaseModel
 from typing import Optional, List
-from datetime import date, datetime
-import json
+from datetime import date
 import os
+import json
 
 from fastapi import Depends
 from ..core.security import get_current_user_id
+from ..core.price_store import PriceStore
+from ..core.price_analytics import PriceHistory
+from ..core.versioned_cache import VersionedCache, file_fingerprint, hash_bytes
+from ..core.price_segments import load_merged_rows, list_segments, segments_dir_for, price_key
+from ..core.payloads import KeyedDataset, payload_cache, payload_response
+from ..core.market_price_table import iter_table_pages, from_table_row, latest_fetched_at
+from ..core.supabase_client import get_supabase_client
 
 router = APIRouter(
     prefix="/market-prices",
@@ -35,83 +42,106 @@ class MarketPriceResponse(BaseModel):
     advice: Optional[str] = None # e.g., 'Hold' or 'Sell'
     offline_data_used: bool = False
 
-# Cache market prices data
-_market_prices_cache = None
+def _price_data_from_record(record) -> PriceData:
+    return PriceData(
+        crop=record.crop,
+        price=record.price,
+        unit=record.currency + "/kg", # Assuming currency is unit for simplicity
+        source=record.source,
+        last_updated=record.date,
+    )
+
+MARKET_PRICES_PATH = os.getenv(
+    "MARKET_PRICES_PATH", os.path.join(os.path.dirname(__file__), "..", "data", "market_prices.json")
+)
+MARKET_PRICES_SEGMENTS_DIR = segments_dir_for(MARKET_PRICES_PATH) # Delta segments written by update_market_prices.py
+MARKET_PRICES_POLL_SECONDS = float(os.getenv("MARKET_PRICES_POLL_SECONDS", "5"))
+# 'file' reads market_prices.json (+ segments) on this node; 'supabase' reads the shared
+# market_price_cache table kept up to date by scripts/sync_market_prices.py
+MARKET_PRICES_SOURCE = os.getenv("MARKET_PRICES_SOURCE", "file").lower()
+MARKET_PRICES_PAGE_SIZE = int(os.getenv("MARKET_PRICES_PAGE_SIZE", "1000"))
+
+class MarketPriceTables:
+    """One loaded generation of market prices: the raw rows plus the indexes built from them."""
+
+    def __init__(self, rows: list, content_hash: str = ""):
+        self.rows = rows
+        self.store = PriceStore(rows, model_factory=_price_data_from_record)
+        self.history = PriceHistory.from_store(self.store) # Columnar copy with precomputed trend analytics
+        self.dataset = KeyedDataset(rows, content_hash, key_func=price_key) # Encoded payload + delta log for /data
+
+def _load_market_price_tables():
+    """
+    Reads market_prices.json plus any delta segments and builds the indexes;
+    runs off the request path in the watcher thread.
+    """
+    rows, raw_chunks = load_merged_rows(MARKET_PRICES_PATH, MARKET_PRICES_SEGMENTS_DIR)
+    content_hash = hash_bytes(*raw_chunks)
+    tables = MarketPriceTables(rows, content_hash)
+    print(f"DEBUG - Market prices data loaded and cached ({len(tables.store)} indexed rows).")
+    return tables, content_hash
+
+def _market_prices_fingerprint():
+    return file_fingerprint(MARKET_PRICES_PATH, *list_segments(MARKET_PRICES_SEGMENTS_DIR))
+
+def _load_market_price_tables_from_supabase():
+    """Reads the latest market_price_cache snapshot page by page (keyset pagination) and builds the indexes."""
+    supabase = get_supabase_client()
+    if not supabase:
+        raise RuntimeError("Supabase client not initialized.")
+    rows = []
+    for page in iter_table_pages(supabase, page_size=MARKET_PRICES_PAGE_SIZE):
+        rows.extend(from_table_row(record) for record in page)
+    content_hash = hash_bytes(json.dumps(rows, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    tables = MarketPriceTables(rows, content_hash)
+    print(f"DEBUG - Market prices loaded from Supabase ({len(tables.store)} indexed rows).")
+    return tables, content_hash
+
+def _supabase_fingerprint():
+    supabase = get_supabase_client()
+    if not supabase:
+        raise RuntimeError("Supabase client not initialized.")
+    return latest_fetched_at(supabase)
+
+# Versioned market prices cache. Always read it through market_prices_cache.get() (once per request)
+# rather than keeping a reference to the rows, so a reload is picked up everywhere.
+_from_supabase = MARKET_PRICES_SOURCE == "supabase"
+market_prices_cache = VersionedCache(
+    "market_prices",
+    load=_load_market_price_tables_from_supabase if _from_supabase else _load_market_price_tables,
+    fingerprint=_supabase_fingerprint if _from_supabase else _market_prices_fingerprint,
+    poll_interval=MARKET_PRICES_POLL_SECONDS,
+    empty=lambda: MarketPriceTables([]),
+    on_reload=lambda previous, tables: tables.dataset.link_previous(previous.dataset),
+)
 
 def load_market_prices_data():
-    """Loads market prices data from the JSON file."""
-    global _market_prices_cache
-    data_path = os.path.join(os.path.dirname(__file__), "..", "data", "market_prices.json")
-    try:
-        with open(data_path, "r", encoding="utf-8") as f:
-            _market_prices_cache = json.load(f)
-        print("DEBUG - Market prices data loaded and cached.")
-    except FileNotFoundError:
-        print(f"ERROR - Market prices data file not found at {data_path}")
-        _market_prices_cache = [] # Initialize as empty list on error
-    except json.JSONDecodeError:
-        print(f"ERROR - Error decoding market prices data from {data_path}")
-        _market_prices_cache = [] # Initialize as empty list on error
-    except Exception as e:
-        print(f"ERROR - An unexpected error occurred loading market prices: {e}")
-        _market_prices_cache = [] # Initialize as empty list on error
+    """Reloads market prices data from its source now (the watcher does this automatically on change)."""
+    market_prices_cache.refresh(force=True)
+    return market_prices_cache.get()
 
 # Load data when the module is imported
-load_market_prices_data()
+market_prices_cache.refresh()
 
-# You might want to add a mechanism to periodically refresh the cache in a real application
-
-@router.get("/", response_model=MarketPriceResponse, summary="Get market prices for crops")
-async def get_market_prices(
-    region: str = Query(..., description="The region for which to fetch market prices."),
-    crop_type: Optional[str] = Query(None, description="Optional: Specific crop to filter prices for."),
-    price_date: date = Query(date.today(), description="Date for which prices are requested (YYYY-MM-DD)."),
-    is_offline: bool = Query(False, description="Indicates if the request is made in offline mode.")
-):
-    """
-    Provides market price information for various crops in a given region.
+def _price_advice(history: PriceHistory, region: str, prices: List[PriceData], price_date: date) -> Optional[str]:
+    """Hold/sell advice from the precomputed price trends, one line per crop when several are listed."""
+    advice = []
+    for crop in dict.fromkeys(p.crop for p in prices):
+        signal = history.signal(region, crop, on_or_before=price_date)
+        if signal:
+            advice.append(signal["advice"] if len(prices) == 1 else f"{crop}: {signal['advice']}")
+    return " ".join(advice) or None
 
-    - **region**: The agricultural region (e.g., 'Amhara', 'Oromia').
-    - **crop_type**: Optional. Filter by a specific crop (e.g., 'coffee', 'sesame').
-    - **price_date**: The date for which the price information is sought. Defaults to today.
-    - **is_offline**: Indicates if the app is in offline mode. If true, should rely on cached data.
-    """
+def _build_market_price_response(tables, region: str, crop_type: Optional[str], price_date: date, is_offline: bool) -> MarketPriceResponse:
+    # Index probe on (region, crop_type) and date; rows that failed to parse were skipped at load time
+    prices = tables.store.models(tables.store.exact(region, crop_type, price_date))
 
-    # Use the cached data
-    all_prices = _market_prices_cache
-
-    if not all_prices:
-         raise HTTPException(status_code=500, detail="Market prices data not available.")
-
-    # Filter by region, crop_type, and date
-    filtered = [
-        p for p in all_prices
-        if p.get("region", "").lower() == region.lower()
-        and (not crop_type or p.get("crop_type", "").lower() == crop_type.lower())
-        and p.get("date") == str(price_date)
-    ]
-
-    prices = []
-    for p in filtered:
-        try:
-            prices.append(
-                PriceData(
-                    crop=p.get("crop_type", "Unknown"),
-                    price=float(p.get("price_per_kg", 0.0)),
-                    unit=p.get("currency", "ETB") + "/kg", # Assuming currency is unit for simplicity
-                    source=p.get("source", "Sample JSON"),
-                    last_updated=datetime.strptime(p.get("date", str(date.today())), "%Y-%m-%d").date()
-                )
-            )
-        except (ValueError, TypeError) as e:
-            print(f"WARNING - Could not parse market price data: {p} - {e}")
-            continue # Skip this entry if parsing fails
-
-
-    advice_message = "Prices are stable. Consider market demand before selling."
+    trend_advice = _price_advice(tables.history, region, prices, price_date)
+    advice_message = trend_advice or "Prices are stable. Consider market demand before selling."
 
     if is_offline:
-        advice_message = "Displaying cached prices. Sync when online for latest data."
+        advice_message = f"{trend_advice} " if trend_advice else ""
+        advice_message += "Displaying cached prices. Sync when online for latest data."
         return MarketPriceResponse(
             region=region,
             date=price_date,
@@ -122,7 +152,7 @@ async def get_market_prices(
     else:
         # When online, attempt to fetch live data (currently uses cached JSON data as placeholder)
         # Placeholder: Logic to fetch live market prices
-        advice_message = "Displaying available prices."
+        advice_message = trend_advice or "Displaying available prices."
         return MarketPriceResponse(
             region=region,
             date=price_date,
@@ -130,3 +160,33 @@ async def get_market_prices(
             advice=advice_message,
             offline_data_used=False
         )
+
+@router.get("/", response_model=MarketPriceResponse, summary="Get market prices for crops")
+async def get_market_prices(
+    request: Request,
+    region: str = Query(..., description="The region for which to fetch market prices."),
+    crop_type: Optional[str] = Query(None, description="Optional: Specific crop to filter prices for."),
+    price_date: date = Query(date.today(), description="Date for which prices are requested (YYYY-MM-DD)."),
+    is_offline: bool = Query(False, description="Indicates if the request is made in offline mode.")
+):
+    """
+    Provides market price information for various crops in a given region.
+
+    - **region**: The agricultural region (e.g., 'Amhara', 'Oromia').
+    - **crop_type**: Optional. Filter by a specific crop (e.g., 'coffee', 'sesame').
+    - **price_date**: The date for which the price information is sought. Defaults to today.
+    - **is_offline**: Indicates if the app is in offline mode. If true, should rely on cached data.
+    """
+
+    # Use the cached data (one consistent generation for the whole request)
+    tables = market_prices_cache.get()
+    if not tables.rows:
+         raise HTTPException(status_code=500, detail="Market prices data not available.")
+
+    # Each filter combination is built and serialized once per data version, then served as bytes
+    payload = payload_cache.get_or_build(
+        tables.dataset.version,
+        ("market-prices", region, crop_type, price_date.isoformat(), is_offline),
+        lambda: _build_market_price_response(tables, region, crop_type, price_date, is_offline).model_dump(mode="json"),
+    )
+    return payload_response(request, payload)
@@ -2,12 +2,29 @@
 For production you can swap to Tomorrow.io and load an API key from env vars.
 """
 from fastapi import APIRouter, HTTPException, Query
-import requests
+
+from ..core.http_client import outbound
+from ..core.forecast_cache import forecast_cache
 
 router = APIRouter()
 
 DEFAULT_LAT = 9.145  # Ethiopia approx centre
 DEFAULT_LON = 40.48967
+HOURLY_VARIABLES = "temperature_2m,precipitation"
+OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
+
+async def _fetch_hourly(lat: float, lon: float) -> dict:
+    params = {
+        "latitude": lat,
+        "longitude": lon,
+        "hourly": HOURLY_VARIABLES,
+        "timezone": "Africa/Addis_Ababa",
+        "forecast_days": 1,
+    }
+    data = await outbound.get_json(OPEN_METEO_URL, params=params)
+    if "hourly" not in data:
+        raise ValueError("Invalid weather response")
+    return data
 
 @router.get("/weather", summary="24-hour weather forecast")
 async def get_weather(
@@ -18,21 +35,15 @@ async def get_weather(
 
     Uses free Open-Meteo endpoint (no API key). In production this can be swapped for
     Tomorrow.io by changing the base URL and adding your token.
+    Forecasts are cached per grid cell until the upstream model next updates.
     """
-    url = (
-        "https://api.open-meteo.com/v1/forecast"
-        f"?latitude={lat}&longitude={lon}&hourly=temperature_2m,precipitation"
-        "&timezone=Africa%2FAddis_Ababa&forecast_days=1"
-    )
     try:
-        resp = requests.get(url, timeout=10)
-        data = resp.json()
+        data = await forecast_cache.get("hourly", lat, lon, HOURLY_VARIABLES, _fetch_hourly)
+    except ValueError as exc:
+        raise HTTPException(status_code=502, detail=str(exc))
     except Exception as exc:
         raise HTTPException(status_code=502, detail=f"Weather service error: {exc}")
 
-    if "hourly" not in data:
-        raise HTTPException(status_code=502, detail="Invalid weather response")
-
     # Build concise result
     result = {
         "latitude": lat,
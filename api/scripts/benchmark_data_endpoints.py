@@ -0,0 +1,99 @@
+"""Compares requests/sec for the static data endpoints with and without pre-serialized responses.
+
+    python -m api.scripts.benchmark_data_endpoints --rows 5000 --requests 2000
+
+"Before" returns the Python objects and lets FastAPI run jsonable_encoder + JSON encoding on every
+request (the previous behaviour); "after" serves bytes encoded once per data version. Both run
+in-process over ASGI, so the numbers isolate serialization cost from network and server overhead.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import date, timedelta
+from typing import Optional
+
+import httpx
+from fastapi import FastAPI, Request
+
+if __package__ in (None, ""):
+    # Allow running as a plain script: python api/scripts/benchmark_data_endpoints.py
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from api.core.payloads import PayloadCache, payload_response
+from api.routes.market_prices import MarketPriceTables, MarketPriceResponse, _build_market_price_response
+
+REGIONS = ["Addis Ababa", "Oromia", "Amhara", "Tigray", "Sidama", "SNNPR", "Afar", "Somali"]
+CROPS = ["teff", "maize", "wheat", "sorghum", "barley", "coffee", "sesame", "haricot bean"]
+
+def synthetic_rows(count: int) -> list:
+    start = date(2025, 1, 1)
+    rows = []
+    for i in range(count):
+        rows.append({
+            "region": REGIONS[i % len(REGIONS)],
+            "crop_type": CROPS[(i // len(REGIONS)) % len(CROPS)],
+            "date": (start + timedelta(days=i // (len(REGIONS) * len(CROPS)))).isoformat(),
+            "price_per_kg": round(10 + (i * 7919 % 5000) / 100, 2),
+            "currency": "ETB",
+        })
+    return rows
+
+def build_apps(tables: MarketPriceTables):
+    before, after = FastAPI(), FastAPI()
+    cache = PayloadCache()
+
+    @before.get("/data/market-prices")
+    async def before_all():
+        return tables.rows
+
+    @before.get("/market-prices/", response_model=MarketPriceResponse)
+    async def before_filtered(region: str, price_date: date, crop_type: Optional[str] = None, is_offline: bool = False):
+        return _build_market_price_response(tables, region, crop_type, price_date, is_offline)
+
+    @after.get("/data/market-prices")
+    async def after_all(request: Request):
+        return payload_response(request, tables.dataset.payload)
+
+    @after.get("/market-prices/")
+    async def after_filtered(request: Request, region: str, price_date: date, crop_type: Optional[str] = None, is_offline: bool = False):
+        payload = cache.get_or_build(
+            tables.dataset.version,
+            ("market-prices", region, crop_type, price_date.isoformat(), is_offline),
+            lambda: _build_market_price_response(tables, region, crop_type, price_date, is_offline).model_dump(mode="json"),
+        )
+        return payload_response(request, payload)
+
+    return before, after
+
+async def _requests_per_second(app: FastAPI, path: str, params: dict, count: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.get(path, params=params) # Warm up (and fill the cache for "after")
+        started = time.perf_counter()
+        for _ in range(count):
+            response = await client.get(path, params=params)
+            response.raise_for_status()
+        return count / (time.perf_counter() - started)
+
+async def run_benchmark(rows: int, requests: int):
+    data = synthetic_rows(rows)
+    tables = MarketPriceTables(data, content_hash="benchmark" * 8)
+    before, after = build_apps(tables)
+    cases = [
+        ("/data/market-prices (full list)", "/data/market-prices", {}),
+        ("/market-prices/ (filtered)", "/market-prices/", {"region": "Oromia", "price_date": data[0]["date"]}),
+    ]
+    print(f"{rows:,} price rows, {requests:,} sequential requests per case")
+    for label, path, params in cases:
+        before_rps = await _requests_per_second(before, path, params, requests)
+        after_rps = await _requests_per_second(after, path, params, requests)
+        print(f"{label}: before {before_rps:,.0f} req/s, after {after_rps:,.0f} req/s ({after_rps / before_rps:.1f}x)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.rows, args.requests))
@@ -0,0 +1,68 @@
+"""Benchmarks the columnar price analytics on synthetic daily prices.
+
+    python -m api.scripts.benchmark_price_analytics --markets 60 --crops 20 --years 5
+
+Reports the time to build the history (sort + all trend analytics) and the per-lookup cost
+of PriceHistory.signal(), so the numbers can be compared as the dataset grows.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date
+
+import numpy as np
+
+if __package__ in (None, ""):
+    # Allow running as a plain script: python api/scripts/benchmark_price_analytics.py
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from api.core.price_analytics import PriceHistory
+
+def synthetic_history(markets: int, crops: int, days: int, seed: int = 0):
+    """Random-walk daily prices with a yearly cycle for every market/crop pair."""
+    rng = np.random.default_rng(seed)
+    start = date(2020, 1, 1).toordinal()
+    series = markets * crops
+    day = np.arange(days)
+    base = rng.uniform(10, 120, size=(series, 1))
+    season = 1 + 0.15 * np.sin(2 * np.pi * day / 365.25 + rng.uniform(0, 2 * np.pi, size=(series, 1)))
+    walk = np.exp(np.cumsum(rng.normal(0, 0.01, size=(series, days)), axis=1))
+    prices = (base * season * walk).ravel()
+    ordinals = np.tile(start + day, series)
+    region_codes = np.repeat(np.arange(series) // crops, days)
+    crop_codes = np.repeat(np.arange(series) % crops, days)
+    return ordinals, prices, region_codes, crop_codes
+
+def run_benchmark(markets: int, crops: int, years: int, lookups: int):
+    days = int(years * 365)
+    ordinals, prices, region_codes, crop_codes = synthetic_history(markets, crops, days)
+    regions = [f"market-{i}" for i in range(markets)]
+    crop_names = [f"crop-{i}" for i in range(crops)]
+
+    started = time.perf_counter()
+    history = PriceHistory(ordinals, prices, region_codes, crop_codes, regions, crop_names)
+    build_seconds = time.perf_counter() - started
+
+    rng = np.random.default_rng(1)
+    queries = [
+        (regions[rng.integers(markets)], crop_names[rng.integers(crops)], date.fromordinal(int(rng.choice(ordinals))))
+        for _ in range(lookups)
+    ]
+    started = time.perf_counter()
+    for region, crop, on in queries:
+        history.signal(region, crop, on_or_before=on)
+    lookup_seconds = time.perf_counter() - started
+
+    print(f"Rows: {len(history):,} ({markets} markets x {crops} crops x {days} days)")
+    print(f"Build + analytics: {build_seconds:.2f}s ({len(history) / build_seconds / 1e6:.2f}M rows/s)")
+    print(f"Signal lookup: {lookup_seconds / lookups * 1e6:.1f}us per lookup over {lookups:,} lookups")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--markets", type=int, default=60)
+    parser.add_argument("--crops", type=int, default=20)
+    parser.add_argument("--years", type=float, default=5)
+    parser.add_argument("--lookups", type=int, default=20000)
+    args = parser.parse_args()
+    run_benchmark(args.markets, args.crops, args.years, args.lookups)
@@ -0,0 +1,72 @@
+"""Measures USSD hops/sec for the compiled menu, in-process and through the HTTP endpoint.
+
+    python -m api.scripts.benchmark_ussd --sessions 2000 --concurrency 200
+
+"interpreter" runs ussd_menu.hop() plus the session store for complete sessions (language, main
+menu, crop info, region, crop) with no HTTP. "endpoint" drives POST /access-channels/ussd over
+ASGI with `concurrency` sessions in flight at once, like a gateway forwarding a burst of dials.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+from fastapi import FastAPI
+
+if __package__ in (None, ""):
+    # Allow running as a plain script: python api/scripts/benchmark_ussd.py
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from api.core.session_store import MemorySessionStore, SqliteSessionStore
+from api.routes import access_channels
+
+# A full crop-info session: dial, English, Crop Info, region, crop
+SESSION_INPUTS = ["", "1", "1", "Oromia", "maize"]
+
+def bench_interpreter(sessions: int, store) -> float:
+    menu = access_channels.ussd_menu
+    started = time.perf_counter()
+    for i in range(sessions):
+        sid = f"bench-{i}"
+        for user_input in SESSION_INPUTS:
+            hop = menu.hop(store.get(sid), user_input)
+            access_channels._apply_hop(store, sid, hop)
+    return sessions * len(SESSION_INPUTS) / (time.perf_counter() - started)
+
+async def bench_endpoint(sessions: int, concurrency: int) -> float:
+    app = FastAPI()
+    app.include_router(access_channels.router)
+    transport = httpx.ASGITransport(app=app)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_session(client, i):
+        async with semaphore:
+            for user_input in SESSION_INPUTS:
+                response = await client.post("/access-channels/ussd", json={
+                    "session_id": f"http-{i}", "phone_number": "+251900000000", "user_input": user_input,
+                })
+                response.raise_for_status()
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(run_session(client, i) for i in range(sessions)))
+        return sessions * len(SESSION_INPUTS) / (time.perf_counter() - started)
+
+def run_benchmark(sessions: int, concurrency: int, sqlite_path: str):
+    print(f"{sessions:,} sessions x {len(SESSION_INPUTS)} hops")
+    print(f"interpreter + memory sessions: {bench_interpreter(sessions, MemorySessionStore()):,.0f} hops/s")
+    if sqlite_path:
+        store = SqliteSessionStore(sqlite_path, namespace="benchmark")
+        print(f"interpreter + sqlite sessions: {bench_interpreter(sessions, store):,.0f} hops/s")
+    endpoint_rps = asyncio.run(bench_endpoint(sessions, concurrency))
+    print(f"endpoint ({concurrency} concurrent sessions, {type(access_channels.ussd_sessions).__name__}): {endpoint_rps:,.0f} hops/s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--sqlite", help="Also benchmark the SQLite session store at this path")
+    args = parser.parse_args()
+    run_benchmark(args.sessions, args.concurrency, args.sqlite)
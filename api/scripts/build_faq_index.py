@@ -0,0 +1,38 @@
+"""Compiles api/data/faqs.json into the binary, memory-mappable FAQ index (api/data/faqs.idx).
+
+Run it whenever faqs.json changes, e.g. as a deploy step:
+    python -m api.scripts.build_faq_index
+API workers pick up the compiled index at startup and fall back to parsing faqs.json if it is
+missing or older than the JSON source.
+"""
+import json
+import os
+import sys
+import time
+
+if __package__ in (None, ""):
+    # Allow running as a plain script: python api/scripts/build_faq_index.py
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from api.core.faq_index import FaqIndex, MmapFaqIndex, write_faq_index
+from api.core.faq_utils import FAQ_DATA_PATH, FAQ_INDEX_PATH
+
+def build_faq_index(source_path: str = FAQ_DATA_PATH, output_path: str = FAQ_INDEX_PATH):
+    started = time.perf_counter()
+    with open(source_path, "r", encoding="utf-8") as f:
+        faqs = json.load(f)
+    index = FaqIndex(faqs)
+    write_faq_index(index, output_path)
+
+    # Re-open the written file as a sanity check before workers start mapping it
+    compiled = MmapFaqIndex(output_path)
+    if len(compiled) != len(index) or compiled.term_count != index.term_count:
+        raise RuntimeError("Compiled FAQ index does not match the source corpus.")
+    elapsed = time.perf_counter() - started
+    print(
+        f"FAQ index written to {output_path}: {len(index)} FAQs, {index.term_count} terms, "
+        f"{os.path.getsize(output_path)} bytes in {elapsed:.2f}s."
+    )
+
+if __name__ == "__main__":
+    build_faq_index()
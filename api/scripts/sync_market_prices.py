@@ -0,0 +1,102 @@
+"""Pushes market price deltas into the shared Supabase `market_price_cache` table.
+
+    python -m api.scripts.sync_market_prices          # segments written since the last sync
+    python -m api.scripts.sync_market_prices --full   # the whole merged dataset (e.g. after a compaction)
+
+Rows are sent as batched upserts on (region, crop_type, price_date), with region and crop normalized
+the same way price_key() dedupes them. Each carries the hold/sell advice computed from the price
+history as of its date. API nodes with MARKET_PRICES_SOURCE=supabase
+read the table instead of their own JSON file. Needs SUPABASE_SERVICE_KEY (the table is read-only
+for the anon role).
+"""
+import argparse
+import os
+import sys
+from datetime import date
+
+if __package__ in (None, ""):
+    # Allow running as a plain script: python api/scripts/sync_market_prices.py
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from api.core.supabase_client import get_supabase_client
+from api.core.price_segments import (
+    load_merged_rows, list_segments, read_segment, segments_dir_for, price_key, validate_row,
+)
+from api.core.price_store import PriceStore
+from api.core.price_analytics import PriceHistory
+from api.core.market_price_table import to_table_row, upsert_rows
+
+DATA_PATH = os.getenv("MARKET_PRICES_PATH", os.path.join(os.path.dirname(__file__), "..", "data", "market_prices.json"))
+BATCH_SIZE = int(os.getenv("MARKET_PRICES_SYNC_BATCH_SIZE", "500"))
+TTL_DAYS = float(os.getenv("MARKET_PRICES_SYNC_TTL_DAYS", "30"))
+
+def _state_path(segments_dir: str) -> str:
+    return os.path.join(segments_dir, "synced.txt")
+
+def _read_synced(segments_dir: str) -> set:
+    try:
+        with open(_state_path(segments_dir), "r", encoding="utf-8") as f:
+            return {line.strip() for line in f if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+def _write_synced(segments_dir: str, names: set) -> None:
+    path = _state_path(segments_dir)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(sorted(names)) + "\n")
+    os.replace(temp_path, path)
+
+def sync_market_prices(full: bool = False, base_path: str = DATA_PATH):
+    supabase = get_supabase_client()
+    if not supabase:
+        print("Supabase client not initialized. Aborting sync.")
+        return None
+
+    segments_dir = segments_dir_for(base_path)
+    segments = list_segments(segments_dir)
+    synced = _read_synced(segments_dir)
+    pending = [path for path in segments if os.path.basename(path) not in synced]
+    if not full and not pending:
+        print("No unsynced market price segments.")
+        return 0
+
+    all_rows, _ = load_merged_rows(base_path, segments_dir, segments)
+    history = PriceHistory.from_store(PriceStore(all_rows))
+    if full:
+        delta = {}
+        for row in all_rows:
+            clean, _ = validate_row(row)
+            if clean is not None:
+                delta[price_key(clean)] = clean
+    else:
+        # Later segments win; one row per key so a batch never upserts the same key twice
+        delta = {}
+        for path in pending:
+            for row in read_segment(path):
+                delta[price_key(row)] = row
+
+    def _table_rows():
+        for row in delta.values():
+            signal = history.signal(row["region"], row["crop_type"], on_or_before=date.fromisoformat(row["date"]))
+            yield to_table_row(row, trend_advice=signal["advice"] if signal else None, ttl_days=TTL_DAYS)
+
+    try:
+        sent = upsert_rows(supabase, _table_rows(), batch_size=BATCH_SIZE)
+    except Exception as e:
+        print(f"Error syncing market prices to Supabase: {e}")
+        return None
+
+    # Remember what was pushed; forget segments that have since been compacted away
+    current_names = {os.path.basename(path) for path in segments}
+    pushed = current_names if full else synced | {os.path.basename(path) for path in pending}
+    if segments:
+        _write_synced(segments_dir, pushed & current_names)
+    print(f"Synced {sent} market price rows to Supabase ({'full' if full else f'{len(pending)} segments'}).")
+    return sent
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Push market price deltas into the market_price_cache table.")
+    parser.add_argument("--full", action="store_true", help="Push the whole merged dataset instead of new segments")
+    args = parser.parse_args()
+    sync_market_prices(full=args.full)
@@ -1,14 +1,42 @@
-import json
-import datetime
-import requests
+"""Ingests the market price feed as an incremental delta.
+
+    python -m api.scripts.update_market_prices              # fetch API_URL
+    python -m api.scripts.update_market_prices --file feed.json
+    python -m api.scripts.update_market_prices --compact    # also fold segments into market_prices.json
+    python -m api.scripts.update_market_prices --sync       # also push the delta to Supabase (see sync_market_prices.py)
+
+The feed (a JSON array or NDJSON) is streamed and parsed row by row, validated in chunks, and only
+new or changed rows are written, as one atomic JSONL segment next to market_prices.json. Invalid rows
+go to market_prices.quarantine.jsonl instead of aborting the update. API workers pick up new segments
+without a restart.
+"""
+import argparse
+import asyncio
+import codecs
 import os
+import sys
+import tempfile
+
+if __package__ in (None, ""):
+    # Allow running as a plain script: python api/scripts/update_market_prices.py
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from api.core.http_client import outbound
+from api.core.price_segments import iter_feed, ingest_feed, compact, list_segments, segments_dir_for
+from api.scripts.sync_market_prices import sync_market_prices
 
 # CONFIGURABLE: Replace with your real market price API endpoint if available
 API_URL = "https://api.mockmarketprices.com/v1/prices"  # <-- Replace with real endpoint
 API_KEY = os.getenv("MARKET_PRICES_API_KEY")  # Optionally use an API key
 
 # Output path for the JSON file
-DATA_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "market_prices.json")
+DATA_PATH = os.getenv("MARKET_PRICES_PATH", os.path.join(os.path.dirname(__file__), "..", "data", "market_prices.json"))
+
+CHUNK_SIZE = int(os.getenv("MARKET_PRICES_INGEST_CHUNK_SIZE", "5000"))
+# Fold segments into market_prices.json once there are this many
+COMPACT_AFTER_SEGMENTS = int(os.getenv("MARKET_PRICES_COMPACT_AFTER_SEGMENTS", "20"))
+# Push each delta to the shared market_price_cache table (before compaction folds its segment away)
+SYNC_TO_SUPABASE = os.getenv("MARKET_PRICES_SYNC", "false").lower() == "true"
 
 # Example: expected response from real API
 # [
@@ -16,41 +44,58 @@ DATA_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "market_prices
 #   ...
 # ]
 
-def fetch_market_prices():
-    """Fetch market prices from external API. Replace with actual API logic."""
+def _decode_chunks(byte_chunks):
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for chunk in byte_chunks:
+        yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
+
+async def _download_feed(dest) -> int:
     headers = {"Authorization": f"Bearer {API_KEY}"} if API_KEY else {}
     try:
-        response = requests.get(API_URL, headers=headers, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        # Optionally transform data to match your schema
-        return data
+        return await outbound.download(API_URL, dest, headers=headers)
+    finally:
+        await outbound.aclose()
+
+def fetch_market_prices():
+    """
+    Streams the feed from the external API as text chunks. Replace with actual API logic.
+    The body is spooled to a temporary file (in memory up to 8 MB) by the shared outbound client,
+    so a dropped connection is retried from the start instead of leaving a half-parsed feed.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as spool:
+        asyncio.run(_download_feed(spool))
+        yield from _decode_chunks(iter(lambda: spool.read(64 * 1024), b""))
+
+def read_feed_file(path: str):
+    with open(path, "rb") as f:
+        yield from _decode_chunks(iter(lambda: f.read(64 * 1024), b""))
+
+def update_market_prices(feed_path: str = None, force_compact: bool = False, sync: bool = SYNC_TO_SUPABASE):
+    chunks = read_feed_file(feed_path) if feed_path else fetch_market_prices()
+    try:
+        stats = ingest_feed(iter_feed(chunks), DATA_PATH, chunk_size=CHUNK_SIZE)
     except Exception as e:
-        print(f"Error fetching market prices: {e}")
+        print(f"Error ingesting market prices: {e}")
         return None
-
-def update_market_prices():
-    prices = fetch_market_prices()
-    if not prices:
-        print("No data fetched. Aborting update.")
-        return
-    # Validate/transform entries if needed
-    for entry in prices:
-        # Ensure all required fields exist
-        for field in ["region", "crop_type", "date", "price_per_kg", "currency"]:
-            if field not in entry:
-                print(f"Missing field {field} in entry: {entry}")
-                return
-        # Optionally: validate date format
-        try:
-            datetime.datetime.strptime(entry["date"], "%Y-%m-%d")
-        except Exception as e:
-            print(f"Invalid date format in entry: {entry}")
-            return
-    # Write to JSON file
-    with open(DATA_PATH, "w", encoding="utf-8") as f:
-        json.dump(prices, f, ensure_ascii=False, indent=2)
-    print(f"market_prices.json updated with {len(prices)} entries.")
+    print(
+        f"Market prices ingested: {stats['received']} received, {stats['written']} new or changed, "
+        f"{stats['unchanged']} unchanged, {stats['quarantined']} quarantined."
+    )
+    if stats["segment"]:
+        print(f"Delta segment written to {stats['segment']}")
+    if sync and sync_market_prices(base_path=DATA_PATH) is None:
+        print("Supabase sync failed; skipping compaction so the delta can be retried.")
+        return stats
+    if force_compact or len(list_segments(segments_dir_for(DATA_PATH))) >= COMPACT_AFTER_SEGMENTS:
+        folded = compact(DATA_PATH)
+        print(f"Compacted {folded} segments into {DATA_PATH}")
+    return stats
 
 if __name__ == "__main__":
-    update_market_prices()
+    parser = argparse.ArgumentParser(description="Ingest the market price feed as an incremental delta.")
+    parser.add_argument("--file", help="Read the feed from a local file instead of the API")
+    parser.add_argument("--compact", action="store_true", help="Fold all delta segments into market_prices.json")
+    parser.add_argument("--sync", action="store_true", default=SYNC_TO_SUPABASE, help="Push the delta to Supabase")
+    args = parser.parse_args()
+    update_market_prices(args.file, args.compact, args.sync)
@@ -0,0 +1,149 @@
+"""Replays synthetic USSD session traces against the USSD router and reports latency against the budget.
+
+    python -m api.scripts.ussd_load_generator --sessions 2000 --rate 200
+    python -m api.scripts.ussd_load_generator --slow-prices-ms 2500      # exercise the fallback path
+    python -m api.scripts.ussd_load_generator --url http://localhost:8000/api/v1/access-channels/ussd
+
+Traces are random walks over the compiled menu table: menu choices (with some invalid keys), free
+text from sample regions and crops, and sessions abandoned mid-menu like real dials. Sessions start
+as a Poisson process at `rate` per second, so bursts overlap. Without --url the router runs
+in-process over ASGI; --slow-prices-ms then delays the market price lookup to push it past the budget.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+import httpx
+from fastapi import FastAPI
+
+if __package__ in (None, ""):
+    # Allow running as a plain script: python api/scripts/ussd_load_generator.py
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from api.core.latency_budget import LATENCY_BUDGETS, budget_stats
+from api.core.ussd_menu import START_STEP
+from api.routes import access_channels
+
+SAMPLE_TEXT = {
+    "region": ["Oromia", "Amhara", "Addis Ababa", "Tigray", "Sidama"],
+    "crop": ["maize", "teff", "wheat", "sorghum", "coffee"],
+    None: ["teff", "maize", "yellow leaves", "wheat", "barley"],
+}
+
+def synthetic_trace(rng: random.Random, abandon: float = 0.15, invalid: float = 0.05, max_hops: int = 8) -> list:
+    """One session's inputs, generated by walking the same table the handler runs."""
+    menu = access_channels.ussd_menu
+    inputs, session = [""], None
+    session = menu.hop(session, "").session
+    for _ in range(max_hops):
+        step = menu.step_of(session)
+        if step.name != START_STEP and rng.random() < abandon:
+            break
+        if step.free_text:
+            user_input = rng.choice(SAMPLE_TEXT.get(step.otherwise.capture, SAMPLE_TEXT[None]))
+        elif rng.random() < invalid:
+            user_input = "9"
+        else:
+            user_input = rng.choice(sorted(step.inputs))
+        inputs.append(user_input)
+        hop = menu.hop(session, user_input)
+        if hop.session is None:
+            break
+        if hop.changed:
+            session = hop.session
+    return inputs
+
+def _percentile(samples: list, p: float) -> float:
+    return samples[min(len(samples) - 1, int(p * len(samples)))] * 1000 if samples else 0.0
+
+async def replay(traces: list, rate: float, think_ms: float, client: httpx.AsyncClient, path: str, seed: int) -> dict:
+    rng = random.Random(seed)
+    latencies, busy, errors = [], 0, 0
+
+    async def run_session(index: int, inputs: list):
+        nonlocal busy, errors
+        for user_input in inputs:
+            started = time.perf_counter()
+            try:
+                response = await client.post(path, json={
+                    "session_id": f"load-{seed}-{index}", "phone_number": "+251900000000", "user_input": user_input,
+                })
+                response.raise_for_status()
+                message = response.json()["message"]
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - started)
+            if message in (access_channels.MENU_TEXT["en"]["busy"], access_channels.MENU_TEXT["am"]["busy"]):
+                busy += 1
+            if message.startswith("END"):
+                return
+            if think_ms:
+                await asyncio.sleep(think_ms / 1000)
+
+    started = time.perf_counter()
+    tasks = []
+    for index, inputs in enumerate(traces):
+        tasks.append(asyncio.create_task(run_session(index, inputs)))
+        if rate > 0:
+            await asyncio.sleep(rng.expovariate(rate))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    budget = LATENCY_BUDGETS["ussd"]
+    return {
+        "hops": len(latencies),
+        "hops_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(_percentile(latencies, 0.50), 2),
+        "p95_ms": round(_percentile(latencies, 0.95), 2),
+        "p99_ms": round(_percentile(latencies, 0.99), 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        "over_budget": sum(1 for latency in latencies if latency > budget),
+        "busy_screens": busy,
+        "errors": errors,
+    }
+
+def _slow_action(action, delay: float):
+    def _wrapped(*args):
+        time.sleep(delay)
+        return action(*args)
+    return _wrapped
+
+async def run_load(sessions: int, rate: float, think_ms: float, seed: int, url: str = None, slow_prices_ms: float = 0) -> dict:
+    rng = random.Random(seed)
+    traces = [synthetic_trace(rng) for _ in range(sessions)]
+    if url:
+        async with httpx.AsyncClient(timeout=30) as client:
+            return await replay(traces, rate, think_ms, client, url, seed)
+
+    if slow_prices_ms:
+        # As after a data load: every crop's answer is pre-rendered before lookups start running slow
+        access_channels.warm_price_answers()
+        actions = access_channels.ussd_menu.actions
+        slowed = _slow_action(actions["market_prices"], slow_prices_ms / 1000)
+        slowed.budgeted = True
+        actions["market_prices"] = slowed
+    app = FastAPI()
+    app.include_router(access_channels.router)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://load") as client:
+        return await replay(traces, rate, think_ms, client, "/access-channels/ussd", seed)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=200, help="New sessions per second (0 = all at once)")
+    parser.add_argument("--think-ms", type=float, default=0, help="Pause between hops of a session")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="Full URL of a running USSD endpoint instead of the in-process router")
+    parser.add_argument("--slow-prices-ms", type=float, default=0, help="In-process only: delay each market price lookup")
+    args = parser.parse_args()
+    report = asyncio.run(run_load(args.sessions, args.rate, args.think_ms, args.seed, args.url, args.slow_prices_ms))
+    print(f"USSD budget {LATENCY_BUDGETS['ussd'] * 1000:.0f} ms")
+    for key, value in report.items():
+        print(f"{key}: {value}")
+    if not args.url:
+        print(f"budget stats: {budget_stats.stats().get('ussd')}")
@@ -0,0 +1,120 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+from api.core.advisory_cache import AdvisoryCache, TABLE, ON_CONFLICT
+
+
+class _FakeQuery:
+    def __init__(self, db):
+        self.db = db
+        self.eqs, self.upper, self.n = {}, None, None
+
+    def select(self, columns):
+        return self
+
+    def eq(self, column, value):
+        self.eqs[column] = value
+        return self
+
+    def lte(self, column, value):
+        self.upper = (column, value)
+        return self
+
+    def order(self, column, desc=False):
+        return self
+
+    def limit(self, n):
+        self.n = n
+        return self
+
+    def execute(self):
+        self.db.queries += 1
+        rows = [r for r in self.db.rows if all(r[c] == v for c, v in self.eqs.items())]
+        if self.upper:
+            rows = sorted((r for r in rows if r[self.upper[0]] <= self.upper[1]), key=lambda r: r["advisory_date"], reverse=True)
+        self.data = rows[:self.n]
+        return self
+
+
+class _FakeSupabase:
+    def __init__(self, rows=()):
+        self.rows, self.queries = list(rows), 0
+
+    def table(self, name):
+        assert name == TABLE
+        return _FakeQuery(self)
+
+
+class _FakeWriter:
+    def __init__(self):
+        self.rows = []
+
+    def enqueue(self, table, row, on_conflict=None):
+        self.rows.append((table, on_conflict, row))
+
+
+def _row(advisory_date, expires_in_hours, crop="maize"):
+    now = datetime.now(timezone.utc)
+    return {
+        "latitude": 9.025, "longitude": 38.775, "crop_type": crop, "advisory_date": advisory_date,
+        "weather_forecast_data": {"dates": [advisory_date]}, "crop_tips_data": {"crop_advisory": "tip"},
+        "fetched_at": now.isoformat(), "expires_at": (now + timedelta(hours=expires_in_hours)).isoformat(),
+    }
+
+
+def test_put_serves_from_memory_and_queues_upsert():
+    supabase, writer = _FakeSupabase(), _FakeWriter()
+    cache = AdvisoryCache(client_getter=lambda: supabase, writer=writer)
+    row = cache.put(9.01, 38.76, "Maize ", "2025-06-14", {"dates": ["2025-06-14"]}, {"crop_advisory": "tip"}, ttl_seconds=3600)
+    assert (row["latitude"], row["longitude"], row["crop_type"]) == (9.025, 38.775, "maize")
+    assert writer.rows == [(TABLE, ON_CONFLICT, row)]
+
+    # A nearby point in the same grid cell is a memory hit; no table query
+    assert asyncio.run(cache.get(9.04, 38.79, "maize", "2025-06-14")) is row
+    assert supabase.queries == 0 and cache.stats()["memory_hits"] == 1
+
+
+def test_read_through_and_expiry():
+    supabase = _FakeSupabase([_row("2025-06-14", 2), _row("2025-06-13", -5)])
+    cache = AdvisoryCache(client_getter=lambda: supabase, writer=_FakeWriter())
+
+    fresh = asyncio.run(cache.get(9.01, 38.76, "maize", "2025-06-14"))
+    assert fresh["weather_forecast_data"] == {"dates": ["2025-06-14"]}
+    asyncio.run(cache.get(9.01, 38.76, "maize", "2025-06-14"))
+    assert supabase.queries == 1 # Second read came from memory
+
+    # Expired rows are a miss online but are served offline
+    assert asyncio.run(cache.get(9.01, 38.76, "maize", "2025-06-13")) is None
+    stale = asyncio.run(cache.get(9.01, 38.76, "maize", "2025-06-13", allow_expired=True))
+    assert stale["advisory_date"] == "2025-06-13" and cache.stats()["stale_served"] == 1
+
+
+def test_offline_falls_back_to_latest_earlier_advisory():
+    supabase = _FakeSupabase([_row("2025-06-10", -48), _row("2025-06-12", -1), _row("2025-06-12", 5, crop="teff")])
+    cache = AdvisoryCache(client_getter=lambda: supabase, writer=_FakeWriter())
+    entry = asyncio.run(cache.get(9.01, 38.76, "maize", "2025-06-20", allow_expired=True))
+    assert entry["advisory_date"] == "2025-06-12" and entry["crop_type"] == "maize"
+
+
+def test_table_errors_are_misses():
+    def broken():
+        raise RuntimeError("db down")
+
+    cache = AdvisoryCache(client_getter=broken, writer=_FakeWriter())
+    assert asyncio.run(cache.get(9.0, 38.7, None, "2025-06-14")) is None
+    assert cache.stats()["read_errors"] == 1
+
+
+def test_slow_table_reads_are_misses():
+    supabase = _FakeSupabase([_row("2025-06-14", 6)])
+
+    def slow_client():
+        time.sleep(0.3)
+        return supabase
+
+    cache = AdvisoryCache(client_getter=slow_client, writer=_FakeWriter(), read_timeout=0.05)
+    started = time.perf_counter()
+    assert asyncio.run(cache.get(9.03, 38.78, "maize", "2025-06-14")) is None
+    assert time.perf_counter() - started < 0.25 # The caller went on to fetch a fresh advisory
+    assert cache.stats()["read_timeouts"] == 1 and cache.stats()["misses"] == 1
@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api.core.audio_cache import AudioCache, audio_key
+from api.core.session_store import MemorySessionStore
+from api.core.ttl_cache import TTLCache
+from api.core.ussd_menu import MENU_TEXT
+import api.routes.access_channels as access_channels
+
+
+BASE_URL = "https://ivr.example/api/v1/access-channels/audio"
+
+
+def _fake_tts(calls):
+    def synthesize(text, language):
+        calls.append((text, language))
+        return f"{language}:{text}".encode("utf-8")
+    return synthesize
+
+
+def test_keys_ignore_whitespace_but_not_language():
+    assert audio_key("Press 1  for English.", "en") == audio_key(" Press 1 for English.\n", "en")
+    assert audio_key("Press 1 for English.", "en") != audio_key("Press 1 for English.", "am")
+
+
+def test_prompts_are_rendered_once_and_shared_through_the_directory(tmp_path):
+    calls = []
+    cache = AudioCache(str(tmp_path), base_url=BASE_URL + "/", synthesize=_fake_tts(calls))
+    prompts = [("Welcome", "en"), ("እንኳን ደህና መጡ", "am"), ("Welcome", "en")]
+
+    assert asyncio.run(cache.warm(prompts)) == 2
+    assert asyncio.run(cache.warm(prompts)) == 2
+    assert len(calls) == 2
+    url = cache.url_for("Welcome", "en")
+    assert url == f"{BASE_URL}/{audio_key('Welcome', 'en')}.mp3"
+    assert (tmp_path / f"{audio_key('Welcome', 'en')}.mp3").read_bytes() == b"en:Welcome"
+
+    # Another worker finds the files without rendering them again
+    other = AudioCache(str(tmp_path), base_url=BASE_URL, synthesize=_fake_tts(calls))
+    assert other.audio_config("Welcome", "en")["url"] == url
+    assert other.stats()["files"] == 2 and len(calls) == 2
+
+
+def test_uncached_texts_are_rendered_in_the_background(tmp_path):
+    calls = []
+    cache = AudioCache(str(tmp_path), base_url=BASE_URL, synthesize=_fake_tts(calls), max_files=1)
+
+    async def scenario():
+        assert cache.audio_config("Answer", "en") == {"text": "Answer", "language": "en"}
+        assert cache.audio_config("Dynamic", "en", cache=False) == {"text": "Dynamic", "language": "en"}
+        await asyncio.gather(*cache._background)
+        assert "url" in cache.audio_config("Answer", "en")
+        assert await cache.render("Over the limit", "en") is None
+
+    asyncio.run(scenario())
+    assert calls == [("Answer", "en")]
+    assert cache.stats()["skipped"] == 1
+
+
+def test_failed_renders_leave_the_text():
+    def broken(text, language):
+        raise RuntimeError("quota")
+
+    cache = AudioCache("/nonexistent-audio-dir", base_url=BASE_URL, synthesize=broken)
+    assert asyncio.run(cache.render("Welcome", "en")) is None
+    assert cache.stats()["failures"] == 1
+    assert not AudioCache("/nonexistent-audio-dir").enabled
+
+
+def test_relative_base_urls_fail_closed(tmp_path):
+    calls = []
+    # Relative to the gateway's host, not ours: hand out text rather than a URL that cannot resolve
+    for base_url in ("", "/api/v1/access-channels/audio", "ivr.example/audio"):
+        cache = AudioCache(str(tmp_path), base_url=base_url, synthesize=_fake_tts(calls))
+        assert not cache.enabled
+        assert asyncio.run(cache.warm([("Welcome", "en")])) == 0
+        assert cache.audio_config("Welcome", "en") == {"text": "Welcome", "language": "en"}
+    assert calls == []
+
+
+def test_ivr_questions_use_faqs_first_then_the_model(monkeypatch, tmp_path):
+    calls, prompts = [], []
+    monkeypatch.setattr(access_channels, "audio_cache", AudioCache(str(tmp_path), base_url=BASE_URL, synthesize=_fake_tts(calls)))
+    monkeypatch.setattr(access_channels, "ivr_sessions", MemorySessionStore())
+    monkeypatch.setattr(access_channels, "ivr_answers", TTLCache(maxsize=10, ttl=60))
+    monkeypatch.setattr(access_channels, "_warm_started", {"task": None})
+
+    async def fake_model(prompt, coalesce_key=None):
+        prompts.append(prompt)
+        if "slow" in prompt:
+            await asyncio.sleep(0.3)
+        return "**Coffee** needs shade.\n- Mulch well."
+
+    monkeypatch.setattr(access_channels, "generate_answer", fake_model)
+    app = FastAPI()
+    app.include_router(access_channels.router, prefix="/api/v1") # As mounted by api.main
+    # One event loop for all requests, so background work outlives the request that started it
+    with TestClient(app) as client:
+
+        def ask(question):
+            body = {"call_id": "c1", "phone_number": "+251", "event_type": "speech_transcribed", "speech_to_text_result": question}
+            return client.post("/api/v1/access-channels/ivr", json=body).json()["actions"]
+
+        actions = ask("how to control fall armyworm")
+        assert actions[0]["audio_config"]["text"].startswith("Monitor your fields regularly")
+        assert actions[-1]["action"] == "get_speech_input" and not prompts
+
+        actions = ask("how do I grow coffee")
+        assert actions[0]["audio_config"] == {"text": "Coffee needs shade. - Mulch well.", "language": "en"}
+        assert len(prompts) == 1 and "phone call" in prompts[0]
+        ask("How do I grow coffee?")
+        assert len(prompts) == 1 # Answered from the cache
+
+        # Past the budget the caller is asked to try again; the answer is ready by then
+        budget = access_channels.LatencyBudget
+        monkeypatch.setattr(access_channels, "LatencyBudget", lambda channel: budget(channel, 0.1))
+        actions = ask("slow question about sorghum")
+        assert actions[0]["audio_config"]["text"] == access_channels.ussd_menu.screen("en", "question_busy").ivr_text
+        time.sleep(0.4)
+        assert ask("slow question about sorghum")[0]["audio_config"]["text"] == "Coffee needs shade. - Mulch well."
+
+        assert ask("")[0]["audio_config"]["text"] == access_channels.ussd_menu.screen("en", "question_not_heard").ivr_text
+        # The static prompts were warmed on the first event and are served from the router
+        url = access_channels.audio_cache.url_for(access_channels.ussd_menu.screen("en", "welcome").ivr_text, "en")
+        assert url.startswith(BASE_URL)
+        response = client.get(url[len("https://ivr.example"):])
+        assert response.status_code == 200 and response.headers["content-type"] == "audio/mpeg"
+        assert client.get("/api/v1/access-channels/audio/..%2Fsecrets.mp3").status_code == 404
+        assert len(calls) >= len(MENU_TEXT["en"])
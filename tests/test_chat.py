@@ -5,6 +5,7 @@ import asyncio
 from api.main import app
 from api.core import security
 from api.routes import chat as chat_route
+from api.core.context_cache import UserContextCache, HISTORY_LIMIT
 
 # Override auth dependency to bypass JWT validation in unit tests
 
@@ -29,3 +30,127 @@ def test_chat_ask():
     assert response.status_code == 200
     data = response.json()
     assert data["response"] == "pong"
+
+
+class _FakeQuery:
+    def __getattr__(self, _name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        return types.SimpleNamespace(data=[])
+
+
+class _FakeSupabase:
+    def table(self, _name):
+        return _FakeQuery()
+
+
+class _FakeStream:
+    def __init__(self, parts):
+        self._parts = parts
+
+    async def _chunks(self):
+        for part in self._parts:
+            yield types.SimpleNamespace(text=part)
+
+    def __aiter__(self):
+        return self._chunks()
+
+
+def test_chat_ask_stream(monkeypatch):
+    async def _fake_stream(prompt, stream=False):
+        return _FakeStream(["Plant maize ", "at the onset of rains."])
+
+    monkeypatch.setattr(chat_route, "get_supabase_client", lambda: _FakeSupabase())
+    monkeypatch.setattr(chat_route.model, "generate_content_async", _fake_stream)
+    monkeypatch.setattr(chat_route, "_record_answer", lambda *args, **kwargs: asyncio.sleep(0))
+
+    with client.stream("POST", "/api/v1/chat/ask/stream", json={"text_input": "stream test", "language_code": "en"}) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        lines = [line for line in response.iter_lines() if line]
+
+    assert lines == [
+        'data: {"text": "Plant maize "}',
+        'data: {"text": "at the onset of rains."}',
+        "event: done",
+        "data: {}",
+    ]
+
+
+def test_chat_ask_batch_coalesces_and_keeps_order(monkeypatch):
+    calls = []
+
+    async def _fake_generate(prompt):
+        calls.append(prompt)
+        await asyncio.sleep(0.01)
+        return types.SimpleNamespace(text=f"answer {len(calls)}")
+
+    monkeypatch.setattr(chat_route, "get_supabase_client", lambda: _FakeSupabase())
+    monkeypatch.setattr(chat_route.model, "generate_content_async", _fake_generate)
+    monkeypatch.setattr(chat_route, "_record_answer", lambda *args, **kwargs: asyncio.sleep(0))
+    monkeypatch.setattr(chat_route, "response_cache", None)
+
+    payload = {"items": [
+        {"text_input": "batch question one"},
+        {"text_input": "batch question two"},
+        {"text_input": "batch question one"},
+        {"text_input": "not mine", "user_id": "someone-else"},
+    ]}
+    response = client.post("/api/v1/chat/ask/batch", json=payload)
+    assert response.status_code == 200
+    results = response.json()["results"]
+
+    assert [r["index"] for r in results] == [0, 1, 2, 3]
+    assert results[0]["response"] == results[2]["response"] # Identical in-flight questions share one call
+    assert len(calls) == 2
+    assert "error" in results[3]
+
+
+class _HistoryQuery(_FakeQuery):
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self):
+        return types.SimpleNamespace(data=self.rows)
+
+
+def test_bulk_history_caches_only_complete_buckets(monkeypatch):
+    # Exactly row_limit rows (truncated): u1 crowds out all but one of u2's turns
+    row_limit = 2 * HISTORY_LIMIT * 4
+    rows = [{"user_id": "u1", "query_text": f"q{i}", "response_text": "a"} for i in range(row_limit - 1)]
+    rows.append({"user_id": "u2", "query_text": "only", "response_text": "a"})
+    supabase = types.SimpleNamespace(table=lambda name: _HistoryQuery(rows if name == "chat_history" else []))
+    cache = UserContextCache()
+    monkeypatch.setattr(chat_route, "context_cache", cache)
+
+    histories, _ = asyncio.run(chat_route._load_bulk_context(supabase, ["u1", "u2"]))
+    assert len(histories["u1"]) == HISTORY_LIMIT and histories["u2"] == [{"query_text": "only", "response_text": "a"}]
+    assert cache.get_history("u1") == histories["u1"]
+    assert cache.get_history("u2") is None # May be missing older turns, so it is fetched again next time
+
+
+def test_batch_semaphore_is_bound_to_the_running_loop():
+    async def get():
+        return chat_route._get_batch_semaphore(), chat_route._get_batch_semaphore()
+
+    first, same = asyncio.run(get())
+    second, _ = asyncio.run(get())
+    assert first is same and first is not second
+
+
+def test_chat_ask_batch_answers_without_faqs_when_the_search_fails(monkeypatch):
+    def broken_search(queries, top_n=3):
+        raise RuntimeError("FAQ index unavailable")
+
+    async def _fake_generate(prompt):
+        return types.SimpleNamespace(text="answered")
+
+    monkeypatch.setattr(chat_route, "get_supabase_client", lambda: _FakeSupabase())
+    monkeypatch.setattr(chat_route, "hybrid_search_faqs_batch", broken_search)
+    monkeypatch.setattr(chat_route.model, "generate_content_async", _fake_generate)
+    monkeypatch.setattr(chat_route, "_record_answer", lambda *args, **kwargs: asyncio.sleep(0))
+
+    response = client.post("/api/v1/chat/ask/batch", json={"items": [{"text_input": "a"}, {"text_input": "b"}]})
+    assert response.status_code == 200
+    assert [r["response"] for r in response.json()["results"]] == ["answered", "answered"]
@@ -0,0 +1,53 @@
+from api.core.context_cache import UserContextCache, HISTORY_LIMIT
+from api.core.ttl_cache import TTLCache, MISSING
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_expiry_and_lru_eviction():
+    clock = _Clock()
+    cache = TTLCache(maxsize=2, ttl=10, timer=clock)
+    cache.set("a", 1)
+    cache.set("b", None)
+    assert cache.get("b") is None # Cached None is a hit, not a miss
+    assert cache.get("a") == 1 # 'a' becomes most recently used
+    cache.set("c", 3)
+    assert cache.get("b") is MISSING # 'b' was least recently used
+    clock.now = 11
+    assert cache.get("a") is MISSING
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 2 and stats["evictions"] == 1
+
+
+def test_user_context_write_through():
+    cache = UserContextCache(max_users=10, ttl=60)
+    assert cache.get_history("u1") is None
+    assert not cache.is_profile_known("u1")
+
+    # Appending before the history was loaded must not fabricate a partial history
+    cache.append_history("u1", {"query_text": "q0", "response_text": "r0"})
+    assert cache.get_history("u1") is None
+
+    cache.set_history("u1", [])
+    cache.mark_profile_known("u1")
+    for i in range(HISTORY_LIMIT + 2):
+        cache.append_history("u1", {"query_text": f"q{i}", "response_text": f"r{i}"})
+    history = cache.get_history("u1")
+    assert len(history) == HISTORY_LIMIT and history[-1]["query_text"] == f"q{HISTORY_LIMIT + 1}"
+    assert cache.is_profile_known("u1")
+
+    assert cache.get_farm_profile("u1") == (False, None)
+    cache.set_farm_profile("u1", None)
+    assert cache.get_farm_profile("u1") == (True, None)
+    cache.set_farm_profile("u1", {"region": "Oromia"})
+    assert cache.get_farm_profile("u1") == (True, {"region": "Oromia"})
+
+    stats = cache.stats()
+    assert stats["history_hits"] == 1 and stats["history_misses"] == 2
+    assert stats["profile_upserts_skipped"] == 1
@@ -41,3 +41,17 @@ def test_pest_diagnose_stub():
     )
     # Gemini key may be missing; we just check we don't get 500 because of external call
     assert resp.status_code in (200, 500)
+
+
+def test_metrics_requires_the_metrics_token(monkeypatch):
+    from api import main
+    monkeypatch.setattr(main, "METRICS_TOKEN", "scrape-secret")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer user-jwt"}).status_code == 401
+    resp = client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert resp.status_code == 200 and "context_cache" in resp.json()
+
+    # Without a token configured it needs a signed-in user
+    monkeypatch.setattr(main, "METRICS_TOKEN", None)
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer user-jwt"}).status_code == 200
@@ -0,0 +1,110 @@
+import threading
+import time
+
+import numpy as np
+
+from api.core import faq_utils
+from api.core.faq_embeddings import HashingEmbedder, SemanticFaqIndex
+from api.core.faq_index import FaqIndex, MmapFaqIndex, tokenize, write_faq_index
+
+SAMPLE_FAQS = [
+    {"question": "What is the best time to plant maize?", "answer": "Plant at the onset of the rainy season."},
+    {"question": "How to control fall armyworm?", "answer": "Scout maize fields weekly and handpick egg masses."},
+    {"question": "What fertilizer should I use for teff?", "answer": "Use NPS at planting and Urea for topdressing."},
+    {"question": "ጤፍ መቼ ይዘራል?", "answer": "ጤፍ በክረምት መጀመሪያ ይዘራል።"},
+]
+
+
+def test_tokenize_keeps_short_amharic_words():
+    assert tokenize("How to plant ጤፍ") == ["how", "plant", "ጤፍ"]
+
+
+def test_index_ranks_question_matches_first():
+    index = FaqIndex(SAMPLE_FAQS)
+    results = index.search("when to plant maize", top_n=2)
+    # Both FAQs mention maize, but only the first has it (and 'plant') in the question
+    assert [doc_id for doc_id, _ in results] == [0, 1]
+    assert results[0][1] > results[1][1]
+
+
+def test_index_amharic_query_and_no_match():
+    index = FaqIndex(SAMPLE_FAQS)
+    assert index.search("ጤፍ", top_n=3)[0][0] == 3
+    assert index.search("coffee berry disease") == []
+
+
+def test_search_faqs_uses_loaded_corpus():
+    results = faq_utils.search_faqs("armyworm control", top_n=2)
+    assert results and "armyworm" in results[0]["question"].lower()
+    assert faq_utils.search_faqs("") == []
+
+
+def test_match_confidence_rejects_other_topics():
+    index = FaqIndex(SAMPLE_FAQS)
+    assert index.match_confidence("what fertilizer should I use for teff", 2) == 1.0
+    # 'maize' is in the corpus but not in the teff FAQ, so that FAQ cannot answer on its own
+    assert index.match_confidence("what fertilizer should I use for maize", 2) == 0.0
+    assert 0 < index.match_confidence("please help control armyworm", 1) < 1
+
+
+def test_direct_answer_faq_checks_confidence_and_language():
+    faq = faq_utils.direct_answer_faq("how to control fall armyworm", language="en")
+    assert faq and "armyworm" in faq["question"].lower()
+    assert faq_utils.direct_answer_faq("how to control fall armyworm", language="am") is None
+    assert faq_utils.direct_answer_faq("what is the price of coffee in Jimma") is None
+    assert faq_utils.faq_language(SAMPLE_FAQS[3]) == "am"
+
+
+def test_compiled_index_round_trip(tmp_path):
+    index = FaqIndex(SAMPLE_FAQS)
+    path = tmp_path / "faqs.idx"
+    write_faq_index(index, str(path))
+
+    compiled = MmapFaqIndex(str(path))
+    assert len(compiled) == len(index)
+    assert compiled.term_count == index.term_count
+    for query in ("when to plant maize", "ጤፍ", "urea topdressing", "unknown words"):
+        assert compiled.search(query, top_n=3) == index.search(query, top_n=3)
+    assert compiled.match_confidence("fertilizer for teff", 2) == index.match_confidence("fertilizer for teff", 2)
+    assert compiled.get_doc(3) == SAMPLE_FAQS[3]
+
+
+def test_semantic_index_batch_search():
+    texts = [f"{faq['question']} {faq['answer']}" for faq in SAMPLE_FAQS]
+    index = SemanticFaqIndex(texts, embedder=HashingEmbedder(dim=256))
+    assert index.matrix.dtype == np.float32 and index.matrix.flags["C_CONTIGUOUS"]
+
+    results = index.search_batch(["planting maize", "armyworms in my field", "ጤፍ መዝራት"], top_k=2)
+    assert len(results) == 3
+    assert results[0][0][0] == 0
+    assert results[1][0][0] == 1 # 'armyworms' still matches 'armyworm' through shared trigrams
+    assert results[2][0][0] == 3
+    assert all(len(hits) <= 2 for hits in results)
+
+
+def test_hybrid_search_falls_back_to_semantic_matches():
+    # No exact keyword overlap with the corpus, only related word forms
+    results = faq_utils.hybrid_search_faqs("irrigating", top_n=1)
+    assert results and "irrigation" in results[0]["question"].lower()
+
+
+def test_semantic_index_is_built_at_load_and_once_under_concurrency(monkeypatch):
+    # Built when the FAQs are loaded, not by the first request
+    lexical, _ = faq_utils._semantic_index
+    assert lexical is faq_utils._faq_index
+
+    builds = []
+
+    def slow_build(index):
+        builds.append(index)
+        time.sleep(0.05)
+        return SemanticFaqIndex(["x"], embedder=HashingEmbedder(dim=16))
+
+    monkeypatch.setattr(faq_utils, "_build_semantic_index", slow_build)
+    monkeypatch.setattr(faq_utils, "_semantic_index", None) # As after a failed build at load
+    threads = [threading.Thread(target=faq_utils._get_semantic_index) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(builds) == 1
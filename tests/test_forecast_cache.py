@@ -0,0 +1,65 @@
+import asyncio
+
+from api.core.forecast_cache import ForecastCache, snap_to_grid, seconds_until_refresh
+
+
+def test_nearby_points_share_a_cell():
+    assert snap_to_grid(9.011, 38.751, 0.05) == snap_to_grid(9.049, 38.799, 0.05) == (9.025, 38.775)
+    assert snap_to_grid(9.051, 38.751, 0.05) != snap_to_grid(9.049, 38.751, 0.05)
+    assert snap_to_grid(-0.01, -0.01, 0.05) == (-0.025, -0.025)
+
+
+def test_ttl_ends_after_next_model_update():
+    hour = 3600
+    # 12:05 UTC, hourly model landing 10 minutes past the hour -> expires at 12:10
+    assert seconds_until_refresh(1, 10, now=12 * hour + 5 * 60) == 5 * 60
+    # 12:15 -> next run lands at 13:10
+    assert seconds_until_refresh(1, 10, now=12 * hour + 15 * 60) == 55 * 60
+    # 3-hourly model at 13:00 -> 15:10
+    assert seconds_until_refresh(3, 10, now=13 * hour) == 2 * hour + 10 * 60
+
+
+def test_concurrent_misses_in_a_cell_share_one_fetch():
+    cache = ForecastCache(resolution=0.05)
+    calls = []
+
+    async def fetch(lat, lon):
+        calls.append((lat, lon))
+        await asyncio.sleep(0.01)
+        return {"cell": (lat, lon)}
+
+    async def scenario():
+        results = await asyncio.gather(*(
+            cache.get("hourly", 9.01 + i * 0.001, 38.76, "temperature_2m", fetch) for i in range(10)
+        ))
+        again = await cache.get("hourly", 9.02, 38.77, "temperature_2m", fetch)
+        other_vars = await cache.get("hourly", 9.02, 38.77, "precipitation", fetch)
+        return results, again, other_vars
+
+    results, again, other_vars = asyncio.run(scenario())
+    assert calls == [(9.025, 38.775), (9.025, 38.775)]
+    assert all(r == {"cell": (9.025, 38.775)} for r in results) and again == results[0]
+    assert other_vars == results[0]
+    stats = cache.stats()
+    assert stats["upstream_calls"] == 2 and stats["coalesced"] == 9
+
+
+def test_failures_are_not_cached():
+    cache = ForecastCache(resolution=0.05)
+    attempts = []
+
+    async def flaky(lat, lon):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("upstream down")
+        return {"ok": True}
+
+    async def scenario():
+        try:
+            await cache.get("daily", 9.0, 38.7, "x", flaky)
+        except ConnectionError:
+            pass
+        return await cache.get("daily", 9.0, 38.7, "x", flaky)
+
+    assert asyncio.run(scenario()) == {"ok": True}
+    assert len(attempts) == 2
@@ -0,0 +1,94 @@
+import asyncio
+
+import httpx
+import pytest
+
+from api.core.http_client import CircuitBreaker, CircuitOpenError, OutboundClient
+from api.core.forecast_cache import ForecastCache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _client(handler, retries=2):
+    return OutboundClient(retries=retries, transport=httpx.MockTransport(handler))
+
+
+def test_retries_transient_failures(monkeypatch):
+    monkeypatch.setattr("api.core.http_client.backoff_delay", lambda attempt: 0)
+    statuses = iter([503, 200])
+    calls = []
+
+    def handler(request):
+        calls.append(request.url)
+        return httpx.Response(next(statuses), json={"ok": True})
+
+    client = _client(handler)
+    assert asyncio.run(client.get_json("https://weather.test/v1", params={"latitude": 9})) == {"ok": True}
+    assert len(calls) == 2 and calls[0].params["latitude"] == "9"
+    assert client.retried == 1 and client.breaker("weather.test").state == "closed"
+
+
+def test_client_errors_are_not_retried():
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        return httpx.Response(400, json={"error": "bad"})
+
+    client = _client(handler)
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(client.get_json("https://weather.test/v1"))
+    assert len(calls) == 1 and client.breaker("weather.test").failures == 0
+
+
+def test_breaker_opens_then_half_opens():
+    clock = _Clock()
+    breaker = CircuitBreaker(threshold=2, reset_timeout=30, timer=clock)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    clock.now = 31
+    assert breaker.allow() and not breaker.allow() # one trial call at a time
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_open_circuit_fails_fast_and_forecast_serves_stale(monkeypatch):
+    monkeypatch.setattr("api.core.http_client.backoff_delay", lambda attempt: 0)
+    healthy = {"up": True}
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        if healthy["up"]:
+            return httpx.Response(200, json={"hourly": {"time": ["t0"]}})
+        raise httpx.ConnectError("down", request=request)
+
+    client = _client(handler, retries=0)
+    client.breaker("weather.test").threshold = 1
+    cache = ForecastCache(resolution=0.05)
+
+    async def fetch(lat, lon):
+        return await client.get_json("https://weather.test/v1")
+
+    async def scenario():
+        first = await cache.get("hourly", 9.0, 38.7, "t", fetch)
+        cache._cache.clear() # Pretend the entry expired
+        healthy["up"] = False
+        during_outage = await cache.get("hourly", 9.0, 38.7, "t", fetch)
+        cache._cache.clear()
+        with pytest.raises(CircuitOpenError):
+            await fetch(9.0, 38.7)
+        return first, during_outage
+
+    first, during_outage = asyncio.run(scenario())
+    assert during_outage == first
+    assert cache.stale_served == 1
+    assert len(calls) == 2 # The open circuit did not call upstream
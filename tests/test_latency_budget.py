@@ -0,0 +1,96 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from api.core import latency_budget
+from api.core.latency_budget import BudgetExceeded, LatencyBudget, budget_stats, remember_answer
+from api.core.ussd_menu import MENU, MENU_TEXT, CompiledMenu, format_result, slow_action
+from api.core.price_store import PriceStore
+from api.core.ttl_cache import TTLCache
+import api.routes.access_channels as access_channels
+
+
+@pytest.fixture(autouse=True)
+def fresh_fallbacks(monkeypatch):
+    monkeypatch.setattr(latency_budget, "fallback_answers", TTLCache(maxsize=100, ttl=60))
+
+
+def test_successful_answers_are_served_after_a_timeout():
+    async def scenario():
+        async def fast():
+            return "fresh"
+
+        async def slow():
+            await asyncio.sleep(1)
+            return "late"
+
+        assert await LatencyBudget("test", 0.5).call("lookup", fast, fallback_key="k") == "fresh"
+        budget = LatencyBudget("test", 0.1)
+        assert await budget.call("lookup", slow, fallback_key="k") == "fresh"
+        assert budget.degraded
+        with pytest.raises(BudgetExceeded):
+            await LatencyBudget("test", 0.1).call("lookup", slow, fallback_key="other")
+
+    asyncio.run(scenario())
+    steps = budget_stats.stats()["test"]["steps"]["lookup"]
+    assert steps["timeouts"] >= 2 and steps["fallbacks"] >= 1 and steps["unanswered"] >= 1
+
+
+def test_failures_fall_back_and_keep_the_cause():
+    def broken():
+        raise ValueError("boom")
+
+    async def scenario():
+        remember_answer("test", "sync", "k", "earlier")
+        assert await LatencyBudget("test", 1).call("sync", broken, fallback_key="k") == "earlier"
+        with pytest.raises(BudgetExceeded) as raised:
+            await LatencyBudget("test", 1).call("sync", broken, fallback_key="missing")
+        assert isinstance(raised.value.__cause__, ValueError)
+
+    asyncio.run(scenario())
+
+
+def test_only_slow_actions_run_within_the_budget():
+    calls = []
+
+    @slow_action
+    def prices(lang, session, text):
+        calls.append(text)
+        time.sleep(0.3)
+        return f"END {text} price"
+
+    menu = CompiledMenu(MENU, MENU_TEXT, actions={
+        "crop_result": format_result("crop_result", crop="crop", region="region"),
+        "pest_result": format_result("pest_result", crop="crop"),
+        "market_prices": prices,
+    })
+    session = {"step": "market_prices_crop_input", "lang": "en"}
+
+    async def scenario():
+        hop = await menu.hop_within(session, "teff", LatencyBudget("test", 0.1))
+        assert hop.message == MENU_TEXT["en"]["busy"] and hop.session is None
+        remember_answer("test", "action:market_prices", menu.fallback_key("en", {}, "teff"), "END cached teff price")
+        hop = await menu.hop_within(session, "Teff", LatencyBudget("test", 0.1))
+        assert hop.message == "END cached teff price"
+        # Inline actions are not affected by an exhausted budget
+        crop_session = {"step": "crop_info_type_input", "lang": "en", "region": "Oromia"}
+        hop = await menu.hop_within(crop_session, "maize", LatencyBudget("test", 0))
+        assert hop.message == MENU_TEXT["en"]["crop_result"].format(crop="maize", region="Oromia")
+
+    asyncio.run(scenario())
+
+
+def test_price_answers_are_prewarmed_for_every_crop(monkeypatch):
+    rows = [
+        {"region": "Oromia", "crop_type": "Teff", "date": "2025-06-09", "price_per_kg": 52.0, "currency": "ETB"},
+        {"region": "Amhara", "crop_type": "Maize", "date": "2025-06-10", "price_per_kg": 30.0, "currency": "ETB"},
+    ]
+    tables = SimpleNamespace(store=PriceStore(rows))
+    monkeypatch.setattr(access_channels, "market_prices_cache", SimpleNamespace(get=lambda: tables))
+
+    assert access_channels.warm_price_answers() == 2 * len(MENU_TEXT) * 2
+    key = access_channels.ussd_menu.fallback_key("am", {}, "Maize")
+    answer = latency_budget.fallback_answers.peek(("ivr", "action:market_prices", key))
+    assert answer == access_channels._market_price_message("am", {}, "maize")
@@ -0,0 +1,79 @@
+from api.core.market_price_table import to_table_row, from_table_row, upsert_rows, iter_table_pages, ON_CONFLICT
+
+
+class _FakeTable:
+    def __init__(self, db):
+        self.db = db
+        self.filters = {}
+
+    def upsert(self, rows, on_conflict=None):
+        self.db.upserts.append((len(rows), on_conflict))
+        for row in rows:
+            key = (row["region"], row["crop_type"], row["price_date"])
+            existing = self.db.rows.get(key)
+            self.db.rows[key] = {**row, "id": existing["id"] if existing else len(self.db.rows) + 1}
+        return self
+
+    def select(self, columns):
+        return self
+
+    def gt(self, column, value):
+        self.filters["gt"] = value
+        return self
+
+    def order(self, column, desc=False):
+        return self
+
+    def limit(self, n):
+        self.filters["limit"] = n
+        return self
+
+    def execute(self):
+        if "limit" not in self.filters:
+            return self
+        self.db.page_queries.append(self.filters["gt"])
+        rows = sorted((r for r in self.db.rows.values() if r["id"] > self.filters["gt"]), key=lambda r: r["id"])
+        self.data = rows[:self.filters["limit"]]
+        return self
+
+
+class _FakeSupabase:
+    def __init__(self):
+        self.rows, self.upserts, self.page_queries = {}, [], []
+
+    def table(self, name):
+        assert name == "market_price_cache"
+        return _FakeTable(self)
+
+
+def test_batched_upserts_and_keyset_pages_round_trip():
+    feed = [
+        {"region": "Oromia", "crop_type": "maize", "date": f"2025-06-{day:02d}", "price_per_kg": float(day), "currency": "ETB"}
+        for day in range(1, 8)
+    ]
+    supabase = _FakeSupabase()
+    assert upsert_rows(supabase, (to_table_row(row, trend_advice="Hold") for row in feed), batch_size=3) == 7
+    assert supabase.upserts == [(3, ON_CONFLICT), (3, ON_CONFLICT), (1, ON_CONFLICT)]
+
+    # Re-upserting an existing key updates it in place
+    upsert_rows(supabase, [to_table_row({**feed[0], "price_per_kg": 99.0})])
+    assert len(supabase.rows) == 7
+
+    pages = list(iter_table_pages(supabase, page_size=3))
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert supabase.page_queries == [0, 3, 6] # WHERE id > last seen id, never OFFSET
+    rows = [from_table_row(record) for page in pages for record in page]
+    assert rows[0] == {**feed[0], "price_per_kg": 99.0} and rows[-1] == feed[-1]
+
+
+def test_case_variants_of_a_key_update_one_row():
+    supabase = _FakeSupabase()
+    row = {"region": "Oromia", "crop_type": "Maize", "date": "2025-06-01", "price_per_kg": 17.0, "currency": "ETB"}
+    upsert_rows(supabase, [to_table_row(row), to_table_row({**row, "region": " oromia", "price_per_kg": 18.0})])
+    assert list(supabase.rows) == [("oromia", "maize", "2025-06-01")]
+
+    (record,) = supabase.rows.values()
+    assert from_table_row(record) == {**row, "region": " oromia", "price_per_kg": 18.0}
+    # Older records without display names in price_data still read back
+    legacy = {**record, "price_data": {"price_per_kg": 16.0, "currency": "ETB"}}
+    assert from_table_row(legacy)["region"] == "oromia"
@@ -0,0 +1,77 @@
+import gzip
+import json
+
+import pytest
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from api.core.payloads import KeyedDataset, PayloadCache, payload_response
+
+
+def _rows(prices):
+    return [{"name": name, "price": price} for name, price in prices.items()]
+
+
+def test_etag_304_and_compressed_encoding():
+    dataset = KeyedDataset(_rows({f"crop{i}": i for i in range(100)}), "a" * 64, key_func=lambda r: r["name"])
+    app = FastAPI()
+
+    @app.get("/data")
+    async def data(request: Request):
+        return payload_response(request, dataset.payload)
+
+    client = TestClient(app)
+    first = client.get("/data", headers={"Accept-Encoding": "gzip"})
+    assert first.status_code == 200 and first.headers["content-encoding"] == "gzip"
+    assert first.json() == dataset.rows
+    etag = first.headers["etag"]
+    assert etag == '"aaaaaaaaaaaaaaaa"'
+
+    not_modified = client.get("/data", headers={"If-None-Match": f"W/{etag}"})
+    assert not_modified.status_code == 304 and not not_modified.content
+    identity = client.get("/data", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in identity.headers and identity.content == dataset.payload.body
+    assert gzip.decompress(dataset.payload.gzip) == dataset.payload.body
+
+
+def test_since_deltas_across_versions():
+    key = lambda r: r["name"]
+    v1 = KeyedDataset(_rows({"teff": 50, "maize": 18, "wheat": 24}), "1" * 64, key)
+    v2 = KeyedDataset(_rows({"teff": 52, "maize": 18, "wheat": 24}), "2" * 64, key)
+    v2.link_previous(v1)
+    v3 = KeyedDataset(_rows({"teff": 52, "maize": 18, "sorghum": 30}), "3" * 64, key)
+    v3.link_previous(v2)
+
+    delta = json.loads(v3.delta_payload(v2.version).body)
+    assert delta["full"] is False
+    assert delta["changed"] == [{"name": "sorghum", "price": 30}] and delta["deleted"] == ["wheat"]
+
+    delta = json.loads(v3.delta_payload(v1.version).body)
+    assert sorted(r["name"] for r in delta["changed"]) == ["sorghum", "teff"] and delta["deleted"] == ["wheat"]
+
+    assert json.loads(v3.delta_payload(v3.version).body)["changed"] == []
+    unknown = v3.delta_payload("0123456789abcdef")
+    assert json.loads(unknown.body)["full"] is True and len(json.loads(unknown.body)["changed"]) == 3
+    # Every unknown version shares one payload, and the client's input never reaches the ETag
+    assert v3.delta_payload("fedcba9876543210") is unknown and unknown.etag == f'"{v3.version}-full"'
+    for bad in ('a"b', "abc\r\nSet-Cookie: x=1", "0123456789ABCDEF", ""):
+        with pytest.raises(ValueError):
+            v3.delta_payload(bad)
+
+
+def test_payload_cache_builds_once_per_version_and_key():
+    cache = PayloadCache(maxsize=8)
+    builds = []
+
+    def build():
+        builds.append(1)
+        return {"prices": [1, 2, 3]}
+
+    first = cache.get_or_build("v1", ("market-prices", "Oromia"), build)
+    assert cache.get_or_build("v1", ("market-prices", "Oromia"), build) is first and len(builds) == 1
+    assert json.loads(first.body) == {"prices": [1, 2, 3]}
+
+    other = cache.get_or_build("v1", ("market-prices", "Amhara"), build)
+    newer = cache.get_or_build("v2", ("market-prices", "Oromia"), build)
+    assert len(builds) == 3 and len({first.etag, other.etag, newer.etag}) == 3
@@ -0,0 +1,85 @@
+import math
+from datetime import date, timedelta
+
+import numpy as np
+
+from api.core import price_analytics
+from api.core.price_analytics import PriceHistory, DEFAULT_ADVICE
+from api.core.price_store import PriceStore
+
+
+def _rows(region, crop, start, prices):
+    return [
+        {"region": region, "crop_type": crop, "date": (start + timedelta(days=i)).isoformat(), "price_per_kg": p}
+        for i, p in enumerate(prices)
+    ]
+
+
+def test_vectorized_signals_match_direct_computation():
+    maize = [10, 11, 12, 11, 13, 14, 15, 16, 15, 17]
+    rows = _rows("Oromia", "maize", date(2025, 6, 1), maize) + _rows("Amhara", "maize", date(2025, 6, 1), [30, 29])
+    history = PriceHistory.from_store(PriceStore(rows), ma_window=3, volatility_window=30)
+
+    signal = history.signal("oromia", "Maize")
+    assert signal["price"] == 17
+    assert signal["moving_avg"] == round((16 + 15 + 17) / 3, 2)
+    assert signal["week_change"] == round(17 / maize[2] - 1, 4)
+    returns = [math.log(b / a) for a, b in zip(maize, maize[1:])]
+    mean = sum(returns) / len(returns)
+    expected_vol = math.sqrt(sum(r * r for r in returns) / len(returns) - mean * mean)
+    assert abs(signal["volatility"] - expected_vol) < 1e-4
+    assert signal["seasonal_percentile"] == 1.0 # Highest June price seen
+    assert signal["advice"].startswith("Sell")
+
+    # As-of lookups use only the data up to that date, and series do not bleed into each other
+    earlier = history.signal("Oromia", "maize", on_or_before=date(2025, 6, 3))
+    assert earlier["price"] == 12 and earlier["week_change"] is None and earlier["advice"] == DEFAULT_ADVICE
+    assert history.signal("Amhara", "maize")["week_change"] is None
+    assert history.signal("Tigray", "maize") is None
+    assert history.signal("Oromia", "maize", on_or_before=date(2025, 5, 1)) is None
+
+
+def test_seasonal_percentile_only_counts_earlier_prices():
+    rows = (_rows("Oromia", "teff", date(2024, 6, 1), [40, 60])
+            + _rows("Oromia", "teff", date(2025, 6, 1), [30, 50, 70])
+            + _rows("Oromia", "teff", date(2025, 7, 1), [10]))
+    history = PriceHistory.from_store(PriceStore(rows))
+
+    # June 2024 knows nothing of June 2025
+    assert history.signal("Oromia", "teff", on_or_before=date(2024, 6, 2))["seasonal_percentile"] == 1.0
+    # 30 on 2025-06-01 is ranked against 40, 60 and itself, not the later 50 and 70
+    assert history.signal("Oromia", "teff", on_or_before=date(2025, 6, 1))["seasonal_percentile"] == round(1 / 3, 2)
+    assert history.signal("Oromia", "teff", on_or_before=date(2025, 6, 2))["seasonal_percentile"] == 0.75
+    assert history.signal("Oromia", "teff", on_or_before=date(2025, 6, 30))["seasonal_percentile"] == 1.0
+    # Other months are separate seasons
+    assert history.signal("Oromia", "teff")["seasonal_percentile"] == 1.0
+
+
+def test_seasonal_percentile_matches_brute_force():
+    rng = np.random.default_rng(7)
+    n = 2000
+    history = PriceHistory(738000 + rng.integers(0, 800, n), rng.integers(1, 20, n).astype(float),
+                           rng.integers(0, 3, n), rng.integers(0, 2, n), ["a", "b", "c"], ["x", "y"])
+    months = (np.datetime64("0001-01-01") + (history.ordinals - 1)).astype("datetime64[M]").astype(np.int64) % 12
+    groups = history.series * 12 + months
+    for i in range(0, n, 7):
+        known = (groups == groups[i]) & (history.ordinals <= history.ordinals[i])
+        expected = np.count_nonzero(history.prices[known] <= history.prices[i]) / np.count_nonzero(known)
+        assert history.seasonal_percentile[i] == expected
+
+
+def test_seasonal_percentile_is_computed_in_bulk(monkeypatch):
+    # 400 series of two years of daily prices: 292,000 rows but at most 62 distinct days per (series, month)
+    rng = np.random.default_rng(3)
+    series, days = 400, 730
+    ordinals = np.tile(739000 + np.arange(days), series)
+    region_codes = np.repeat(np.arange(series) // 20, days)
+    crop_codes = np.repeat(np.arange(series) % 20, days)
+    passes = []
+    add = price_analytics._fenwick_add
+    monkeypatch.setattr(price_analytics, "_fenwick_add", lambda *args: passes.append(1) or add(*args))
+
+    history = PriceHistory(ordinals, rng.random(series * days) * 100, region_codes, crop_codes,
+                           [str(i) for i in range(20)], [str(i) for i in range(20)])
+    # One vectorized pass per day step, never one per row
+    assert len(history) == 292000 and len(passes) == 62
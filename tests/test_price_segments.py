@@ -0,0 +1,120 @@
+import json
+import os
+
+from api.core import price_segments
+from api.core.price_segments import (
+    iter_feed, ingest_feed, compact, load_merged_rows, list_segments, segments_dir_for, quarantine_path_for,
+    SegmentWriter,
+)
+
+FEED = [
+    {"region": "Oromia", "crop_type": "maize", "date": "2025-06-10", "price_per_kg": 17.0, "currency": "ETB"},
+    {"region": "Oromia", "crop_type": "teff", "date": "2025-06-10", "price_per_kg": "bad", "currency": "ETB"},
+    {"region": "Amhara", "crop_type": "wheat", "date": "2025-06-11", "price_per_kg": 25.0, "currency": "ETB"},
+]
+
+
+def _chunks(text, size=7):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_iter_feed_streams_arrays_and_ndjson():
+    array_text = json.dumps(FEED)
+    assert list(iter_feed(_chunks(array_text))) == FEED
+    ndjson = "\n".join(json.dumps(row) for row in FEED) + "\n{broken\n"
+    rows = list(iter_feed(_chunks(ndjson)))
+    assert rows[:3] == FEED and rows[3][0] == "__invalid__"
+
+
+def _rows_with_chunk_index(chunks, **kwargs):
+    """(row, number of chunks consumed when it was yielded) for every row of the feed."""
+    consumed = [0]
+
+    def counted():
+        for chunk in chunks:
+            consumed[0] += 1
+            yield chunk
+
+    return [(row, consumed[0]) for row in iter_feed(counted(), **kwargs)]
+
+
+def test_malformed_array_element_is_skipped_without_stalling(tmp_path):
+    good = [dict(FEED[0], date=f"2025-06-{day:02d}") for day in range(1, 29)]
+    broken = '{"region": "Oromia", "crop_type": "x" : bad, "note": "a } and \\" inside"}'
+    text = "[" + ", ".join(json.dumps(row) for row in good[:3]) + ", " + broken + ", "
+    text += ", ".join(json.dumps(row) for row in good[3:]) + "]"
+    chunks = _chunks(text, size=16)
+
+    results = _rows_with_chunk_index(chunks)
+    rows = [row for row, _ in results]
+    assert rows[:3] == good[:3] and rows[4:] == good[3:]
+    assert rows[3] == ("__invalid__", broken)
+    # The row after the bad element streams as soon as it is complete, not at the end of the feed
+    end_of_next_row = text.index(json.dumps(good[3])) + len(json.dumps(good[3]))
+    assert results[4][1] <= end_of_next_row // 16 + 2 < len(chunks)
+
+    base = tmp_path / "market_prices.json"
+    stats = ingest_feed(iter_feed(chunks), str(base))
+    assert stats["quarantined"] == 1 and stats["written"] == len(good)
+    quarantined = [json.loads(line) for line in open(quarantine_path_for(str(base)))]
+    assert [(entry["row"], entry["reason"]) for entry in quarantined] == [({"raw": broken}, "invalid JSON")]
+
+
+def test_unterminated_array_element_is_capped():
+    text = "[" + json.dumps(FEED[0]) + ', {"region": "Oromia", "crop_type": "' + "x" * 400 + ", " + json.dumps(FEED[2]) + "]"
+    rows = [row for row, _ in _rows_with_chunk_index(_chunks(text, size=16), max_element_chars=200)]
+    assert rows[0] == FEED[0] and rows[-1] == FEED[2]
+    assert len(rows) == 3 and rows[1][0] == "__invalid__"
+
+
+def test_ingest_writes_only_deltas_and_quarantines_bad_rows(tmp_path):
+    base = tmp_path / "market_prices.json"
+    base.write_text(json.dumps([
+        {"region": "Oromia", "crop_type": "maize", "date": "2025-06-10", "price_per_kg": 16.0, "currency": "ETB"},
+        {"region": "Amhara", "crop_type": "wheat", "date": "2025-06-11", "price_per_kg": 25.0, "currency": "ETB"},
+    ]))
+    stats = ingest_feed(iter(FEED), str(base), chunk_size=2)
+    assert (stats["received"], stats["written"], stats["unchanged"], stats["quarantined"]) == (3, 1, 1, 1)
+    assert "invalid price" in open(quarantine_path_for(str(base))).read()
+
+    rows, _ = load_merged_rows(str(base))
+    assert len(rows) == 2 and rows[0]["price_per_kg"] == 17.0
+
+    # Re-ingesting the same feed writes nothing
+    assert ingest_feed(iter(FEED), str(base))["segment"] is None
+
+    assert compact(str(base)) == 1
+    assert list_segments(segments_dir_for(str(base))) == []
+    assert json.loads(base.read_text())[0]["price_per_kg"] == 17.0
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_ingest_reads_the_fingerprint_index_not_the_dataset(tmp_path, monkeypatch):
+    base = tmp_path / "market_prices.json"
+    base.write_text(json.dumps([
+        {"region": "Oromia", "crop_type": "maize", "date": "2025-06-10", "price_per_kg": 16.0, "currency": "ETB"},
+    ], indent=2))
+    streamed = []
+    iter_base_rows = price_segments._iter_base_rows
+    monkeypatch.setattr(price_segments, "_iter_base_rows", lambda path: streamed.append(path) or iter_base_rows(path))
+    monkeypatch.setattr(price_segments, "load_merged_rows", None) # Never parses base + segments whole
+
+    # The first ingest streams the base once to build the index
+    assert ingest_feed(iter(FEED), str(base))["written"] == 2 and len(streamed) == 1
+    # Later ones only read the index, including rows from the segment just written
+    assert ingest_feed(iter(FEED), str(base))["written"] == 0 and len(streamed) == 1
+
+    # A segment written by another process is applied from the segment itself
+    writer = SegmentWriter(segments_dir_for(str(base)))
+    writer.write(dict(FEED[0], price_per_kg=18.0))
+    writer.commit()
+    assert ingest_feed(iter([dict(FEED[0], price_per_kg=18.0)]), str(base))["written"] == 0
+
+    # Compaction rewrites the index for the new base, so it is still not re-read
+    monkeypatch.setattr(price_segments, "load_merged_rows", load_merged_rows)
+    assert compact(str(base)) == 2
+    assert ingest_feed(iter(FEED), str(base))["written"] == 1 and len(streamed) == 1
+
+    # Replacing the base by other means invalidates the index
+    base.write_text(json.dumps([FEED[0]]))
+    assert ingest_feed(iter(FEED), str(base))["written"] == 1 and len(streamed) == 2
@@ -0,0 +1,52 @@
+from datetime import date
+
+from api.core.price_store import PriceStore
+
+ROWS = [
+    {"region": "Oromia", "crop_type": "maize", "date": "2025-06-10", "price_per_kg": 17.0, "currency": "ETB"},
+    {"region": "oromia ", "crop_type": "Maize", "date": "2025-06-08", "price_per_kg": 16.0, "currency": "ETB"},
+    {"region": "Oromia", "crop_type": "teff", "date": "2025-06-09", "price_per_kg": 52.0, "currency": "ETB"},
+    {"region": "Amhara", "crop_type": "wheat", "date": "2025-06-10", "price_per_kg": 24.0, "currency": "ETB"},
+    {"region": "Amhara", "crop_type": "wheat", "date": "not-a-date", "price_per_kg": 1.0, "currency": "ETB"},
+]
+
+
+def test_exact_latest_and_range_queries():
+    store = PriceStore(ROWS)
+    assert len(store) == 4 and store.skipped == 1
+
+    exact = store.exact("OROMIA", "maize", date(2025, 6, 10))
+    assert [r.price for r in exact] == [17.0]
+    assert store.exact("Oromia", None, date(2025, 6, 9))[0].crop == "teff"
+    assert store.exact("Tigray", None, date(2025, 6, 10)) == []
+
+    latest = store.latest("Oromia")
+    assert sorted((r.crop.lower(), r.price) for r in latest) == [("maize", 17.0), ("teff", 52.0)]
+    assert [r.price for r in store.latest("Oromia", "maize", on_or_before=date(2025, 6, 9))] == [16.0]
+    assert store.latest("Oromia", "maize", on_or_before=date(2025, 6, 1)) == []
+
+    in_range = store.range("oromia", "maize", start=date(2025, 6, 8), end=date(2025, 6, 9))
+    assert [r.date for r in in_range] == [date(2025, 6, 8)]
+
+
+def test_models_are_built_once_per_record():
+    built = []
+    store = PriceStore(ROWS, model_factory=lambda record: built.append(record) or {"price": record.price})
+    records = store.exact("Amhara", "wheat", date(2025, 6, 10))
+    first = store.models(records)
+    assert store.models(records)[0] is first[0] and len(built) == 1
+
+
+def test_latest_price_per_region_for_a_crop():
+    rows = ROWS + [
+        {"region": "Amhara", "crop_type": "maize", "date": "2025-06-01", "price_per_kg": 19.5, "currency": "ETB"},
+        {"region": "Tigray", "crop_type": "maize", "date": "2025-06-11", "price_per_kg": 15.0, "currency": "ETB"},
+    ]
+    store = PriceStore(rows)
+    latest = store.latest_by_region(" MAIZE")
+    assert [(r.region, r.price, r.date) for r in latest] == [
+        ("Amhara", 19.5, date(2025, 6, 1)),
+        ("Oromia", 17.0, date(2025, 6, 10)),
+        ("Tigray", 15.0, date(2025, 6, 11)),
+    ]
+    assert store.latest_by_region("coffee") == []
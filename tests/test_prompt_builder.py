@@ -0,0 +1,39 @@
+from api.core.context_cache import UserContextCache, HISTORY_LIMIT
+from api.core.prompt_builder import build_prompt, estimate_tokens, truncate_to_tokens
+
+
+def test_truncate_to_tokens_respects_budget():
+    text = "word " * 200
+    cut = truncate_to_tokens(text, 20)
+    assert estimate_tokens(cut) <= 20 and cut.endswith("…")
+    assert truncate_to_tokens("short", 20) == "short"
+    # Ge'ez text is counted per character
+    assert estimate_tokens("ጤፍ መዝራት") == 7
+
+
+def test_build_prompt_enforces_section_budgets():
+    history = [{"query_text": f"question {i}", "response_text": "long answer. " * 100} for i in range(5)]
+    faqs = [{"question": "How to plant teff?", "answer": "detail " * 500}]
+    budgets = {"history": 120, "summary": 60, "faqs": 80}
+    built = build_prompt("en", "When should I sow?", history=history, faqs=faqs, profile={"region": "Amhara"}, budgets=budgets)
+
+    # Section markup adds a few tokens on top of the content budget
+    assert built.section_tokens["history"] <= 120 + 20
+    assert built.section_tokens["faqs"] <= 80 + 20
+    assert built.section_tokens["summary"] <= 60 + 20
+    # The newest turn is kept verbatim; older turns that did not fit are summarized
+    assert "question 4" in built.text and "Earlier Conversation" in built.text
+    assert "Region: Amhara" in built.text and built.text.endswith("When should I sow?")
+    assert built.total_tokens < 600
+
+
+def test_rolling_summary_collects_turns_leaving_the_window():
+    cache = UserContextCache(max_users=10, ttl=60)
+    cache.set_history("u1", [])
+    for i in range(HISTORY_LIMIT + 2):
+        cache.append_history("u1", {"query_text": f"q{i}", "response_text": f"Answer {i}. More detail."})
+    summary = cache.get_summary("u1")
+    assert summary.splitlines() == ["Asked: q0 -> Answer 0.", "Asked: q1 -> Answer 1."]
+
+    built = build_prompt("en", "next", history=cache.get_history("u1"), summary=summary)
+    assert "Asked: q0" in built.text and "User: q6" in built.text
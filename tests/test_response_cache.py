@@ -0,0 +1,34 @@
+import asyncio
+
+from api.core.response_cache import (
+    MemoryResponseBackend,
+    ResponseCache,
+    SqliteResponseBackend,
+    make_response_key,
+    normalize_question,
+)
+
+
+def test_normalized_questions_share_a_key():
+    assert normalize_question("  When to plant MAIZE?! ") == "when to plant maize"
+    key = make_response_key("When to plant maize?", "en", region="Oromia", crop="Maize", faq_ids=["b", "a"])
+    assert key == make_response_key("when to plant  maize", "EN", region="oromia", crop="maize", faq_ids=["a", "b"])
+    assert key != make_response_key("when to plant maize", "am", region="oromia", crop="maize", faq_ids=["a", "b"])
+    assert key != make_response_key("when to plant maize", "en", region="amhara", crop="maize", faq_ids=["a", "b"])
+
+
+def test_backends_round_trip(tmp_path):
+    async def scenario(cache):
+        assert await cache.get("k") is None
+        await cache.set("k", "answer")
+        assert await cache.get("k") == "answer"
+        assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    asyncio.run(scenario(ResponseCache(MemoryResponseBackend(max_entries=10, ttl=60))))
+    asyncio.run(scenario(ResponseCache(SqliteResponseBackend(str(tmp_path / "cache.sqlite3"), max_entries=10, ttl=60))))
+
+
+def test_sqlite_backend_expires_entries(tmp_path):
+    backend = SqliteResponseBackend(str(tmp_path / "cache.sqlite3"), max_entries=10, ttl=-1)
+    backend.set("k", "stale")
+    assert backend.get("k") is None
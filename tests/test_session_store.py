@@ -0,0 +1,66 @@
+from api.core.session_store import MemorySessionStore, SqliteSessionStore
+
+
+class _Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_memory_sessions_expire_after_last_hop():
+    clock = _Clock()
+    store = MemorySessionStore(ttl=60, timer=clock)
+    store.set("s1", {"step": "main_menu", "lang": "en"})
+    store.set("s2", {"step": "main_menu"})
+    clock.now += 50
+    state = store.get("s1")
+    state["step"] = "changed" # get() returns a copy
+    assert store.get("s1") == {"step": "main_menu", "lang": "en"}
+
+    store.set("s1", {"step": "crop_info_region_input", "lang": "en"}) # Renews s1
+    clock.now += 20
+    store.set("s3", {"step": "main_menu"}) # Purges s2, which expired; the renewed s1 survives
+    assert "s2" not in store._entries and store.get("s1")["step"] == "crop_info_region_input"
+    assert len(store) == 2 and store.stats()["expired"] == 1
+
+
+def test_memory_store_stays_bounded():
+    clock = _Clock()
+    store = MemorySessionStore(ttl=60, max_sessions=100, timer=clock)
+    for i in range(1000):
+        clock.now += 0.01
+        store.set(f"s{i}", {"step": "main_menu"})
+        store.set(f"s{i}", {"step": "market_prices_crop_input"})
+    assert len(store) == 100 and store.stats()["evicted"] == 900
+    assert store.get("s999") is not None and store.get("s0") is None
+    assert len(store._heap) <= 2 * 100 + 64
+
+
+def test_sqlite_sessions_are_shared_between_workers(tmp_path):
+    clock = _Clock()
+    path = str(tmp_path / "sessions.sqlite3")
+    worker_a = SqliteSessionStore(path, namespace="ussd", ttl=60, timer=clock)
+    worker_b = SqliteSessionStore(path, namespace="ussd", ttl=60, timer=clock)
+    ivr = SqliteSessionStore(path, namespace="ivr", ttl=60, timer=clock)
+
+    worker_a.set("s1", {"step": "crop_info_type_input", "lang": "am", "region": "ኦሮሚያ"})
+    assert worker_b.get("s1") == {"step": "crop_info_type_input", "lang": "am", "region": "ኦሮሚያ"}
+    assert ivr.get("s1") is None
+    worker_b.delete("s1")
+    assert worker_a.get("s1") is None
+
+    worker_a.set("s2", {"step": "main_menu"})
+    clock.now += 61
+    assert worker_b.get("s2") is None
+    assert worker_a.purge() == 1 and len(worker_a) == 0
+
+
+def test_sqlite_store_stays_bounded(tmp_path):
+    clock = _Clock()
+    store = SqliteSessionStore(str(tmp_path / "s.sqlite3"), ttl=60, max_sessions=10, purge_every=25, timer=clock)
+    for i in range(100):
+        clock.now += 0.01
+        store.set(f"s{i}", {"step": "main_menu"})
+    assert len(store) == 10 and store.get("s99") is not None
@@ -0,0 +1,128 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api.core.ussd_menu import MENU, MENU_TEXT, CompiledMenu, Transition, format_result, render_ivr_text
+from api.core.session_store import MemorySessionStore
+import api.routes.access_channels as access_channels
+
+
+def _menu(market_prices=lambda lang, session, text: f"END {text} price: 50 ETB"):
+    return CompiledMenu(MENU, MENU_TEXT, actions={
+        "crop_result": format_result("crop_result", crop="crop", region="region"),
+        "pest_result": format_result("pest_result", crop="crop"),
+        "market_prices": market_prices,
+    })
+
+
+def _run(menu, inputs, session=None):
+    hops = []
+    for user_input in inputs:
+        hop = menu.hop(session, user_input)
+        session = hop.session if hop.changed else session
+        hops.append(hop)
+    return hops
+
+
+def test_crop_info_flow_in_amharic():
+    hops = _run(_menu(), ["", "2", "1", "Oromia", "maize"])
+    assert [h.message for h in hops[:3]] == [MENU_TEXT["en"]["welcome"], MENU_TEXT["am"]["main"], MENU_TEXT["am"]["crop_info_prompt"]]
+    assert hops[0].changed is False # No session until a language is chosen
+    assert hops[3].session == {"step": "crop_info_type_input", "lang": "am", "region": "Oromia"}
+    assert hops[4].message == MENU_TEXT["am"]["crop_result"].format(crop="maize", region="Oromia")
+    assert hops[4].session is None and hops[4].changed
+
+
+def test_back_invalid_and_exit():
+    hops = _run(_menu(), ["1", "3", "0", "7", "0"])
+    assert hops[2].message == MENU_TEXT["en"]["main"] and hops[2].session == {"step": "main_menu", "lang": "en"}
+    assert hops[3].message == MENU_TEXT["en"]["invalid_input"] and not hops[3].changed
+    assert hops[4].message == MENU_TEXT["en"]["thank_you"] and hops[4].session is None
+
+
+def test_failing_action_ends_with_invalid_input():
+    def broken(lang, session, text):
+        raise OSError("prices unavailable")
+
+    hop = _menu(broken).hop({"step": "market_prices_crop_input", "lang": "en"}, "teff")
+    assert hop.message == MENU_TEXT["en"]["invalid_input"] and hop.session is None
+
+
+def test_sessions_without_language_restart():
+    hop = _menu().hop({"step": "main_menu"}, "1")
+    assert hop.message == MENU_TEXT["en"]["main"] and hop.session == {"step": "main_menu", "lang": "en"}
+
+
+def test_compile_rejects_broken_tables():
+    with pytest.raises(ValueError):
+        CompiledMenu({"lang_selection": {"otherwise": Transition("nowhere", "welcome")}}, MENU_TEXT, actions={})
+    with pytest.raises(ValueError):
+        CompiledMenu(MENU, MENU_TEXT, actions={})
+
+
+def test_screens_are_pre_rendered_for_ivr():
+    menu = _menu()
+    main = menu.screen("en", "main")
+    assert json.loads(main.json) == main.text and not main.ends
+    assert main.ivr_text == "Main Menu: Press 1 for Crop Info. Press 2 for Pest Help. Press 3 for Market Prices. Press 0 for Exit."
+    assert render_ivr_text("END Teff price: 50 ETB", "en") == "Teff price: 50 ETB"
+    assert menu.steps["crop_info_region_input"].free_text and not menu.steps["main_menu"].free_text
+
+
+def test_ussd_and_ivr_endpoints_share_the_table(monkeypatch):
+    monkeypatch.setattr(access_channels, "ussd_sessions", MemorySessionStore())
+    monkeypatch.setattr(access_channels, "ivr_sessions", MemorySessionStore())
+    app = FastAPI()
+    app.include_router(access_channels.router)
+    client = TestClient(app)
+
+    def ussd(user_input):
+        return client.post("/access-channels/ussd", json={"session_id": "s1", "phone_number": "+251", "user_input": user_input}).json()
+
+    assert ussd("") == {"session_id": "s1", "message": MENU_TEXT["en"]["welcome"]}
+    assert ussd("1")["message"] == MENU_TEXT["en"]["main"]
+    assert access_channels.ussd_sessions.get("s1") == {"step": "main_menu", "lang": "en"}
+
+    def ivr(event_type, **fields):
+        body = {"call_id": "c1", "phone_number": "+251", "event_type": event_type, **fields}
+        return client.post("/access-channels/ivr", json=body).json()["actions"]
+
+    assert ivr("new_call")[1]["input_type"] == "dtmf"
+    ivr("dtmf_input", dtmf_input="1")
+    actions = ivr("dtmf_input", dtmf_input="2")
+    assert actions[0]["audio_config"]["text"].startswith("Pest Help selected.")
+    assert actions[1]["action"] == "get_speech_input"
+    actions = ivr("speech_transcribed", speech_to_text_result="teff")
+    assert actions[1]["action"] == "get_speech_input" # Now asks for the description
+    actions = ivr("speech_transcribed", speech_to_text_result="yellow leaves")
+    assert actions[0]["audio_config"]["text"].startswith("Pest for teff") and actions[1] == {"action": "hangup"}
+
+
+def test_market_price_answer_lists_top_regions(monkeypatch):
+    from types import SimpleNamespace
+    from api.core.price_store import PriceStore
+
+    rows = [
+        {"region": region, "crop_type": "teff", "date": f"2025-06-{day:02d}", "price_per_kg": price, "currency": "ETB"}
+        for region, day, price in [("Oromia", 9, 52.0), ("Amhara", 10, 54.5), ("Tigray", 8, 50.0), ("Sidama", 8, 49.0), ("Amhara", 1, 60.0)]
+    ]
+    tables = SimpleNamespace(store=PriceStore(rows))
+    monkeypatch.setattr(access_channels, "market_prices_cache", SimpleNamespace(get=lambda: tables))
+
+    message = access_channels._market_price_message("en", {}, "Teff")
+    assert message == "END Teff price per kg:\nAmhara: 54.5 ETB (2025-06-10)\nOromia: 52 ETB (2025-06-09)\nTigray: 50 ETB (2025-06-08)"
+    assert access_channels._market_price_message("am", {}, "coffee") == MENU_TEXT["am"]["market_price_not_found"].format(crop="Coffee")
+
+
+def test_gateway_routes_are_mounted_on_the_app(monkeypatch):
+    from api.main import app
+
+    monkeypatch.setattr(access_channels, "ussd_sessions", MemorySessionStore())
+    client = TestClient(app)
+    body = {"session_id": "s2", "phone_number": "+251", "user_input": ""}
+    response = client.post("/api/v1/access-channels/ussd", json=body)
+    assert response.status_code == 200 and response.json()["message"] == MENU_TEXT["en"]["welcome"]
+    for path in ("/api/v1/market-prices/", "/api/v1/crop-weather/advisory"):
+        assert client.get(path).status_code != 404
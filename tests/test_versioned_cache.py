@@ -0,0 +1,71 @@
+import json
+import threading
+
+from api.core.versioned_cache import VersionedCache, file_fingerprint, hash_bytes
+
+
+def _json_cache(path, **kwargs):
+    def load():
+        raw = path.read_bytes()
+        return json.loads(raw), hash_bytes(raw)
+    return VersionedCache("test", load=load, fingerprint=lambda: file_fingerprint(str(path)), **kwargs)
+
+
+def test_reload_swaps_versions_and_skips_unchanged_content(tmp_path):
+    path = tmp_path / "prices.json"
+    path.write_text('[1]')
+    cache = _json_cache(path)
+    assert cache.get() == [1] and cache.snapshot.version == 1
+    assert not cache.refresh() # Fingerprint unchanged
+
+    path.write_text('[1, 2]')
+    assert cache.refresh() and cache.get() == [1, 2] and cache.snapshot.version == 2
+
+    path.write_text('[1, 2]') # Rewritten with identical content
+    assert not cache.refresh(force=True)
+    assert cache.stats()["version"] == 2
+
+
+def test_failed_reload_keeps_previous_version(tmp_path):
+    path = tmp_path / "prices.json"
+    path.write_text('[1]')
+    cache = _json_cache(path)
+    cache.get()
+    path.write_text('{broken')
+    assert not cache.refresh()
+    assert cache.get() == [1] and cache.failed_reloads == 1
+
+    missing = _json_cache(tmp_path / "missing.json", empty=list)
+    assert missing.get() == [] and missing.snapshot.version == 0
+
+
+def test_listeners_see_the_current_and_every_new_version(tmp_path):
+    path = tmp_path / "prices.json"
+    path.write_text('[1]')
+    cache = _json_cache(path)
+    seen = []
+    cache.add_listener(lambda data: seen.append(data)) # Not loaded yet: nothing to see
+    cache.get()
+    cache.add_listener(lambda data: seen.append(("late", data)))
+    cache.add_listener(lambda data: 1 / 0) # A failing listener does not stop the reload
+    path.write_text('[1, 2]')
+    assert cache.refresh()
+    assert seen == [[1], ("late", [1]), [1, 2], ("late", [1, 2])]
+    assert cache.get() == [1, 2]
+
+
+def test_watcher_picks_up_changes(tmp_path):
+    path = tmp_path / "prices.json"
+    path.write_text('[1]')
+    cache = _json_cache(path, poll_interval=0.01)
+    cache.get()
+    swapped = threading.Event()
+    original_refresh = cache.refresh
+    cache.refresh = lambda force=False: original_refresh(force) and (swapped.set() or True)
+    cache.start_watching()
+    try:
+        path.write_text('[1, 2, 3]')
+        assert swapped.wait(2)
+        assert cache.get() == [1, 2, 3]
+    finally:
+        cache.stop_watching()
@@ -1,13 +1,14 @@
+import httpx
 from fastapi.testclient import TestClient
 from api.main import app
-import types
 
 client = TestClient(app)
 
-# Monkeypatch requests.get used in weather route
+# Route the shared outbound client through a mock transport instead of Open-Meteo
 import api.routes.weather as weather_route
+from api.core.http_client import OutboundClient
 
-def _fake_get(url, timeout=10):
+def _handler(request: httpx.Request) -> httpx.Response:
     sample = {
         "hourly": {
             "time": ["2025-06-14T00:00", "2025-06-14T01:00"],
@@ -15,9 +16,9 @@ def _fake_get(url, timeout=10):
             "precipitation": [0.0, 0.1],
         }
     }
-    return types.SimpleNamespace(json=lambda: sample)
+    return httpx.Response(200, json=sample)
 
-weather_route.requests.get = _fake_get  # type: ignore
+weather_route.outbound = OutboundClient(transport=httpx.MockTransport(_handler))
 
 def test_weather_endpoint():
     resp = client.get("/api/v1/weather?lat=9.1&lon=40.4")
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import os
+import types
+
+from api.core.write_behind import WriteBehindQueue
+
+
+class _FakeTable:
+    def __init__(self, client, name):
+        self.client, self.name = client, name
+
+    def insert(self, rows):
+        self.rows = rows
+        return self
+
+    def execute(self):
+        if self.client.fail:
+            raise RuntimeError("database unavailable")
+        if any(row.get("bad") for row in self.rows):
+            raise _ApiError("23503", "insert violates foreign key constraint")
+        self.client.batches.append((self.name, list(self.rows)))
+        return types.SimpleNamespace(data=self.rows)
+
+
+class _ApiError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+class _FakeClient:
+    def __init__(self):
+        self.batches = []
+        self.fail = False
+
+    def table(self, name):
+        return _FakeTable(self, name)
+
+
+def test_rows_are_batched_spilled_and_replayed(tmp_path):
+    client = _FakeClient()
+    spill_path = str(tmp_path / "spill.jsonl")
+
+    async def scenario():
+        queue = WriteBehindQueue(client_getter=lambda: client, batch_size=50, flush_interval=0.05, spill_path=spill_path)
+        for i in range(10):
+            queue.enqueue("chat_history", {"n": i})
+        queue.enqueue("feedback", {"n": 0})
+        await asyncio.sleep(0.2)
+        # One multi-row insert per table instead of one per row
+        assert sorted((name, len(rows)) for name, rows in client.batches) == [("chat_history", 10), ("feedback", 1)]
+
+        client.fail = True
+        queue.enqueue("feedback", {"n": 1})
+        await queue.stop()
+        assert queue.stats()["spilled_rows"] == 1
+
+        client.fail = False
+        restarted = WriteBehindQueue(client_getter=lambda: client, spill_path=spill_path)
+        await restarted.start()
+        await restarted.stop()
+        assert client.batches[-1] == ("feedback", [{"n": 1}])
+        assert restarted.stats()["replayed_rows"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_rejected_rows_are_dead_lettered_not_respilled(tmp_path):
+    client = _FakeClient()
+    spill_path = str(tmp_path / "spill.jsonl")
+    # Left by a worker that has exited (no process has this pid)
+    stale = tmp_path / "spill.999999999.jsonl"
+    stale.write_text("".join(json.dumps({"table": "feedback", "on_conflict": None, "row": row}) + "\n"
+                             for row in ({"n": 1}, {"n": 2, "bad": True}, {"n": 3})))
+
+    async def scenario():
+        queue = WriteBehindQueue(client_getter=lambda: client, spill_path=spill_path)
+        await queue.start()
+        await queue.stop()
+        return queue.stats()
+
+    stats = asyncio.run(scenario())
+    # The good rows are written one by one instead of failing with the bad one forever
+    assert [rows for _, rows in client.batches] == [[{"n": 1}], [{"n": 3}]]
+    assert stats["dead_lettered_rows"] == 1 and stats["spilled_rows"] == 0
+    assert not stale.exists()
+    dead = [json.loads(line) for line in open(tmp_path / f"spill.dead.{os.getpid()}.jsonl")]
+    assert dead[0]["row"] == {"n": 2, "bad": True} and "foreign key" in dead[0]["error"]
+
+
+def test_each_process_spills_to_its_own_file(tmp_path):
+    client = _FakeClient()
+    client.fail = True
+    spill_path = str(tmp_path / "spill.jsonl")
+    # Spilled by another worker that is still running
+    live = tmp_path / f"spill.{os.getppid()}.jsonl"
+    live.write_text(json.dumps({"table": "feedback", "on_conflict": None, "row": {"n": 0}}) + "\n")
+
+    async def scenario():
+        queue = WriteBehindQueue(client_getter=lambda: client, spill_path=spill_path)
+        await queue.start()
+        queue.enqueue("feedback", {"n": 1})
+        await queue.stop()
+        # Once this run has spilled, its own file is live too
+        again = WriteBehindQueue(client_getter=lambda: client, spill_path=spill_path)
+        again._spilled = True
+        await again.start()
+        return queue.stats()["replayed_rows"], again.stats()["replayed_rows"]
+
+    assert asyncio.run(scenario()) == (0, 0)
+    assert sorted(os.listdir(tmp_path)) == sorted([live.name, f"spill.{os.getpid()}.jsonl"])
+
+
+def test_restart_with_the_same_pid_replays_its_spill(tmp_path):
+    # Containers restart workers with the same pid (often 1), so the file looks like our own
+    client = _FakeClient()
+    spill = tmp_path / f"spill.{os.getpid()}.jsonl"
+    spill.write_text(json.dumps({"table": "feedback", "on_conflict": None, "row": {"n": 1}}) + "\n")
+
+    async def scenario():
+        queue = WriteBehindQueue(client_getter=lambda: client, spill_path=str(tmp_path / "spill.jsonl"))
+        await queue.start()
+        await queue.stop()
+        return queue.stats()
+
+    assert asyncio.run(scenario())["replayed_rows"] == 1
+    assert client.batches == [("feedback", [{"n": 1}])] and not spill.exists()